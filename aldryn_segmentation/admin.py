@@ -5,7 +5,11 @@ from django.conf.urls import url
 from django.contrib import admin
 
 from .models import Segment
-from .views import set_segment_override, reset_all_segment_overrides
+from .views import (
+    reset_all_segment_overrides,
+    segment_metrics,
+    set_segment_override,
+)
 
 
 class SegmentAdmin(admin.ModelAdmin):
@@ -36,6 +40,11 @@ class SegmentAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(reset_all_segment_overrides),
                 name='reset_all_segment_overrides'
             ),
+
+            url(r'metrics/$',
+                self.admin_site.admin_view(segment_metrics),
+                name='segment_metrics'
+            ),
         ] + super(SegmentAdmin, self).get_urls()
 
 
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import logging
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+logger = logging.getLogger(__name__)
+
+#
+# The attribute store is created at most once per request and remembered here.
+#
+STORE_ATTR = '_segment_attributes'
+
+#
+# Attributes of providers with a session_ttl are also kept in the session,
+# under this key, in the form { /key/: [ /value/, /expiry timestamp/ ] }.
+#
+SESSION_KEY = '_segment_attributes'
+
+_providers = None
+
+
+class BaseAttributeProvider(object):
+    '''
+    Supplies visitor attributes (E.g., from a CRM) to segment plugins.
+    Providers are listed in settings.SEGMENTATION_ATTRIBUTE_PROVIDERS (dotted
+    paths) and are instantiated once per process.
+
+    Rather than each segment fetching its own attribute, segment plugins
+    declare the keys they need (see SegmentPluginBase.get_attribute_keys()).
+    The keys of every segment on the page are collected before any of them
+    is evaluated and each provider is then asked once for the whole batch.
+
+    Subclasses must set `keys` (or override provides()) and implement
+    get_attributes(). Providers are called while the page is rendered, so,
+    they must bound their own latency (E.g., with timeouts on remote calls).
+    The time they take is counted against the request's evaluation budget
+    (see aldryn_segmentation.cms_plugins.budgets) and once that is spent, they
+    are not called anymore. Providers that raise are logged and their keys
+    have no value.
+    '''
+
+    # The attribute keys this provider supplies
+    keys = ()
+
+    #
+    # If set, attributes are also kept in the visitor's session for this many
+    # seconds, rather than only for the request.
+    #
+    session_ttl = None
+
+
+    def provides(self, key):
+        return key in self.keys
+
+
+    def get_attributes(self, request, keys):
+        '''
+        Returns a dict of the given keys' values for the visitor making the
+        request. Keys without a value may be omitted.
+        '''
+        raise NotImplementedError("Please Implement this method")
+
+
+def get_providers():
+    '''
+    Returns instances of the providers in
+    settings.SEGMENTATION_ATTRIBUTE_PROVIDERS, in order.
+    '''
+
+    global _providers
+    if _providers is None:
+        providers = []
+        for path in getattr(settings, 'SEGMENTATION_ATTRIBUTE_PROVIDERS', ()):
+            module_path, _, class_name = path.rpartition('.')
+            try:
+                provider_class = getattr(import_module(module_path), class_name)
+            except (ImportError, AttributeError, ValueError):
+                raise ImproperlyConfigured('Could not import the segment '
+                    'attribute provider {0!r}.'.format(path))
+            providers.append(provider_class())
+        _providers = providers
+    return _providers
+
+
+def get_provider(key):
+    for provider in get_providers():
+        if provider.provides(key):
+            return provider
+    return None
+
+
+class AttributeStore(object):
+    '''
+    The visitor attributes fetched during a request.
+    '''
+
+    def __init__(self, request):
+        self.request = request
+        self.attributes = dict()
+        # Plugin ids whose attribute keys have already been collected
+        self.collected = set()
+        # Whether the keys of the whole page have been collected
+        self.page_collected = False
+
+
+    def fetch(self, keys):
+        '''
+        Fetches the given keys that haven't been fetched yet, calling each
+        provider once with all of its keys. Keys that can't be fetched (the
+        provider raised or the request's budget is spent) have no value.
+        '''
+
+        # This can't be defined at the file level, else circular imports
+        from .cms_plugins.budgets import charge_budget, get_remaining_budget
+
+        batches = dict()
+        for key in keys:
+            if key in self.attributes:
+                continue
+            provider = get_provider(key)
+            if provider is None:
+                self.attributes[key] = None
+                continue
+            batches.setdefault(provider, set()).add(key)
+
+        for provider, provider_keys in batches.items():
+            if provider.session_ttl:
+                provider_keys = self._from_session(provider_keys)
+            if not provider_keys:
+                continue
+
+            remaining = get_remaining_budget(self.request)
+            if remaining is not None and remaining <= 0:
+                values = None
+            else:
+                start = time.time()
+                try:
+                    values = provider.get_attributes(self.request, provider_keys)
+                except Exception:
+                    logger.exception('%s failed to fetch the attributes %s.',
+                                     provider.__class__.__name__,
+                                     ', '.join(sorted(provider_keys)))
+                    values = None
+                finally:
+                    charge_budget(self.request, time.time() - start)
+
+            for key in provider_keys:
+                self.attributes[key] = values.get(key) if values else None
+
+            # Keys that couldn't be fetched are tried again next request.
+            if provider.session_ttl and values is not None:
+                self._to_session(provider_keys, provider.session_ttl)
+
+
+    def get(self, key, default=None):
+        if key not in self.attributes:
+            self.fetch([key])
+        value = self.attributes.get(key)
+        return default if value is None else value
+
+
+    def _from_session(self, keys):
+        '''
+        Takes the given keys' values from the session if they haven't
+        expired. Returns the keys that still need fetching.
+        '''
+
+        session = getattr(self.request, 'session', None)
+        if session is None:
+            return keys
+
+        now = time.time()
+        cached = session.get(SESSION_KEY) or dict()
+        missing = set()
+        for key in keys:
+            entry = cached.get(key)
+            if entry and entry[1] > now:
+                self.attributes[key] = entry[0]
+            else:
+                missing.add(key)
+        return missing
+
+
+    def _to_session(self, keys, ttl):
+        session = getattr(self.request, 'session', None)
+        if session is None:
+            return
+
+        now = time.time()
+        cached = dict(
+            (key, entry)
+            for key, entry in (session.get(SESSION_KEY) or dict()).items()
+            if entry[1] > now
+        )
+        for key in keys:
+            cached[key] = [self.attributes[key], now + ttl]
+        session[SESSION_KEY] = cached
+
+
+def get_attribute_store(request):
+    try:
+        return getattr(request, STORE_ATTR)
+    except AttributeError:
+        pass
+
+    store = AttributeStore(request)
+    setattr(request, STORE_ATTR, store)
+    return store
+
+
+def get_attribute(request, key, default=None):
+    '''
+    Returns the given visitor attribute. Segment plugins should call this
+    from is_context_appropriate() for the keys they declared.
+    '''
+
+    return get_attribute_store(request).get(key, default)
+
+
+def get_page_trees(request):
+    '''
+    Yields the top-level plugins of each placeholder of the current page
+    whose plugin tree the CMS has already loaded. The CMS loads the plugins of
+    all of a page's placeholders at once, before the first of them renders,
+    and remembers them on the page.
+    '''
+
+    page = getattr(request, 'current_page', None)
+    placeholders = getattr(page, '_tmp_placeholders_cache', None) or dict()
+    for slots in placeholders.values():
+        for placeholder in slots.values():
+            for plugin_instance in getattr(placeholder, '_plugins_cache', None) or []:
+                yield plugin_instance
+
+
+def get_evaluated_children(plugin_instance):
+    '''
+    Returns the children of the given plugin that may be evaluated up front.
+    For a Limit Block, these are its first max_children children: the others
+    are only evaluated if earlier ones are not appropriate, so, their keys
+    are only fetched once they are needed.
+    '''
+
+    children = plugin_instance.child_plugin_instances or []
+    max_children = getattr(plugin_instance, 'max_children', 0)
+    if max_children:
+        children = children[:max_children]
+    return children
+
+
+def prefetch_attributes(context, plugin_instance):
+    '''
+    Collects the attribute keys declared by all of the segment plugins on the
+    page (see get_page_trees()) and below the given one (E.g., a Limit Block
+    in a static placeholder), and fetches them in one batch per provider.
+    Each plugin is only visited once per request, so, once the page has been
+    collected, further Limit Blocks cost nothing more and each provider is
+    called once per page.
+    '''
+
+    if not get_providers():
+        return
+
+    request = context.get('request')
+    store = get_attribute_store(request)
+    pending = list(get_evaluated_children(plugin_instance))
+    if not store.page_collected:
+        store.page_collected = True
+        pending.extend(get_page_trees(request))
+
+    keys = set()
+    while pending:
+        child = pending.pop()
+        if child.pk in store.collected:
+            continue
+        store.collected.add(child.pk)
+
+        plugin = child.get_plugin_class_instance()
+        if hasattr(plugin, 'get_attribute_keys'):
+            keys.update(plugin.get_attribute_keys(child))
+        pending.extend(get_evaluated_children(child))
+
+    if keys:
+        store.fetch(keys)
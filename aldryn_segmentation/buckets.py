@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import uuid
+import zlib
+
+from django.conf import settings
+from django.utils.http import urlquote, urlunquote
+
+from .headers import get_meta_key
+
+
+#
+# Sources of the stable identifier that visitors are bucketed by
+#
+VISITOR = 'visitor'
+SESSION = 'session'
+COOKIE = 'cookie'
+
+NUM_BUCKETS = 100
+
+#
+# Buckets are computed at most once per request and remembered here.
+#
+BUCKETS_ATTR = '_segment_buckets'
+
+#
+# The identifier of a visitor that didn't have a bucket cookie yet.
+#
+NEW_VISITOR_ATTR = '_segment_new_visitor_id'
+
+#
+# Visitors bucketed by session are identified by a random identifier kept in
+# their session, rather than by its key, which doesn't exist until the
+# session is first saved and changes whenever it is cycled (E.g., on login).
+#
+SESSION_KEY = '_segment_bucket_id'
+
+
+def get_cookie_name():
+    return getattr(settings, 'SEGMENTATION_BUCKET_COOKIE_NAME', 'segment_bucket')
+
+
+def get_cookie_age():
+    return getattr(settings, 'SEGMENTATION_BUCKET_COOKIE_AGE', 365 * 24 * 60 * 60)
+
+
+def get_visitor_id(request):
+    '''
+    Returns the visitor's identifier from the bucket cookie, creating one if
+    necessary. New identifiers are sent to the visitor by
+    SegmentBucketMiddleware.
+    '''
+
+    visitor_id = request.COOKIES.get(get_cookie_name())
+    if not visitor_id:
+        visitor_id = getattr(request, NEW_VISITOR_ATTR, None)
+        if visitor_id is None:
+            visitor_id = uuid.uuid4().hex
+            setattr(request, NEW_VISITOR_ATTR, visitor_id)
+    return visitor_id
+
+
+def get_session_id(request):
+    '''
+    Returns the identifier kept in the visitor's session, creating one if
+    necessary, so that it is the same for the whole session from its first
+    request on. Without sessions, this is the visitor's bucket cookie.
+    '''
+
+    session = getattr(request, 'session', None)
+    if session is None:
+        return get_visitor_id(request)
+
+    session_id = session.get(SESSION_KEY)
+    if not session_id:
+        session_id = session[SESSION_KEY] = uuid.uuid4().hex
+    return session_id
+
+
+def get_identifier(request, identity, cookie_name=''):
+    if identity == COOKIE:
+        return request.COOKIES.get(cookie_name)
+    if identity == SESSION:
+        return get_session_id(request)
+    return get_visitor_id(request)
+
+
+def hash_bucket(experiment, identifier):
+    '''
+    Returns the bucket, from 0 to NUM_BUCKETS - 1, of the given identifier in
+    the given experiment. The experiment salts the hash, so that a visitor's
+    buckets in different experiments are independent.
+
+    This is deterministic, so, every worker assigns the same bucket without
+    keeping any state.
+    '''
+
+    value = '{0}:{1}'.format(experiment, identifier).encode('utf-8')
+    return (zlib.crc32(value) & 0xffffffff) % NUM_BUCKETS
+
+
+def get_bucket(request, experiment, identity=VISITOR, cookie_name=''):
+    '''
+    Returns the visitor's bucket in the given experiment, or None if there is
+    nothing to identify them by (E.g., the given cookie is missing). Each
+    bucket is computed at most once per request, no matter how many segments
+    of the experiment are on the page.
+    '''
+
+    buckets = getattr(request, BUCKETS_ATTR, None)
+    if buckets is None:
+        buckets = dict()
+        setattr(request, BUCKETS_ATTR, buckets)
+
+    key = (experiment, identity, cookie_name)
+    try:
+        return buckets[key]
+    except KeyError:
+        pass
+
+    identifier = get_identifier(request, identity, cookie_name)
+    bucket = hash_bucket(experiment, identifier) if identifier else None
+    buckets[key] = bucket
+    return bucket
+
+
+def get_vector_header():
+    return getattr(settings, 'SEGMENTATION_BUCKET_VECTOR_HEADER', 'X-Segment-Buckets')
+
+
+def get_vector_cookie_name():
+    return getattr(settings, 'SEGMENTATION_BUCKET_VECTOR_COOKIE_NAME', 'segment_buckets')
+
+
+def get_bucket_vector(request):
+    '''
+    Returns the visitor's buckets in the experiments that were evaluated
+    during this request, as a sorted tuple of (experiment, bucket) pairs. Two
+    requests with the same vector render the same A/B variants.
+    '''
+
+    buckets = getattr(request, BUCKETS_ATTR, None) or dict()
+    return tuple(sorted(set(
+        (experiment, bucket)
+        for (experiment, identity, cookie_name), bucket in buckets.items()
+        if bucket is not None
+    )))
+
+
+def format_bucket_vector(vector):
+    '''
+    Returns the given vector (or dict) of buckets as a header or cookie value,
+    E.g., 'checkout=12,hero=73'.
+    '''
+
+    if isinstance(vector, dict):
+        vector = sorted(vector.items())
+    return ','.join(
+        '{0}={1}'.format(urlquote(experiment, safe=''), bucket)
+        for experiment, bucket in vector
+    )
+
+
+def parse_bucket_vector(value):
+    '''
+    Returns a dict of the buckets in the given header or cookie value. Invalid
+    items are ignored.
+    '''
+
+    vector = dict()
+    for item in (value or '').split(','):
+        experiment, sep, bucket = item.strip().rpartition('=')
+        if sep and experiment and bucket.isdigit():
+            vector[urlunquote(experiment)] = int(bucket)
+    return vector
+
+
+def get_requested_vector(request):
+    '''
+    Returns the buckets that the request claims to render, from the vector
+    header that the cache in front of the site copies from the vector cookie.
+    '''
+
+    return parse_bucket_vector(
+        request.META.get(get_meta_key(get_vector_header())))
+
+
+def make_cache_key(request, key):
+    '''
+    Returns the given cache key, made specific to the A/B variants rendered
+    for this request. For caching responses or fragments in application code,
+    E.g., make_cache_key(request, 'page:' + request.path).
+    '''
+
+    vector = get_bucket_vector(request)
+    if not vector:
+        return key
+    return '{0}:{1}'.format(key, format_bucket_vector(vector))
@@ -2,3 +2,4 @@
 
 from .segment_plugins import *
 from .segment_limiter import *
+from .segment_composite import *
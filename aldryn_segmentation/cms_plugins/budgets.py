@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import logging
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import connections
+from django.utils import translation
+
+
+logger = logging.getLogger(__name__)
+
+#
+# What to decide when a condition fails (runs over budget or raises):
+#
+#   INACTIVE: the segment is not appropriate, so, a Limit Block moves on to
+#             its next child;
+#   ACTIVE:   the segment is appropriate;
+#   FALLBACK: the segment is not appropriate and neither is any other segment
+#             in the same Limit Block until its next Fallback segment.
+#
+INACTIVE = 'inactive'
+ACTIVE = 'active'
+FALLBACK = 'fallback'
+
+#
+# Reasons for failures, as recorded in the event counts
+#
+OVER_BUDGET = 'over_budget'
+EXHAUSTED = 'exhausted'
+ERROR = 'error'
+
+#
+# The time spent evaluating conditions during a request and the fallback
+# modes of those that failed (by plugin id) are remembered on the request.
+#
+SPENT_ATTR = '_segment_evaluation_spent'
+NESTED_ATTR = '_segment_evaluation_nested'
+FAILURES_ATTR = '_segment_evaluation_failures'
+
+# (plugin class, reason) -> number of failures in the current process
+_events = dict()
+_events_lock = threading.Lock()
+
+_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+def get_request_budget():
+    '''
+    Returns the total number of seconds that may be spent evaluating
+    conditions per request (settings.SEGMENTATION_EVALUATION_BUDGET), or None
+    for no limit.
+    '''
+
+    return getattr(settings, 'SEGMENTATION_EVALUATION_BUDGET', None)
+
+
+def get_remaining_budget(request):
+    '''
+    Returns the number of seconds left of the request's budget, or None if
+    there is no limit.
+    '''
+
+    request_budget = get_request_budget()
+    if request_budget is None:
+        return None
+    return request_budget - getattr(request, SPENT_ATTR, 0.0)
+
+
+def charge_budget(request, seconds):
+    '''
+    Counts the given number of seconds, spent outside of any condition (E.g.,
+    fetching visitor attributes), against the request's budget. Time spent
+    while a condition is being evaluated is already counted as part of that
+    condition.
+    '''
+
+    if request is not None and not getattr(request, NESTED_ATTR, False):
+        setattr(request, SPENT_ATTR, getattr(request, SPENT_ATTR, 0.0) + seconds)
+
+
+def get_fallback_mode(plugin):
+    return (getattr(plugin, 'evaluation_fallback', None) or
+            getattr(settings, 'SEGMENTATION_EVALUATION_FALLBACK', INACTIVE))
+
+
+def get_thread_pool():
+    '''
+    Returns this process' bounded pool of
+    settings.SEGMENTATION_EVALUATION_THREADS (default: 4) threads for
+    conditions that run in a thread (see SegmentPluginBase.run_in_thread).
+    '''
+
+    global _pool, _pool_slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                size = getattr(settings, 'SEGMENTATION_EVALUATION_THREADS', 4)
+                _pool_slots = threading.BoundedSemaphore(size)
+                _pool = ThreadPool(size)
+    return _pool
+
+
+def _submit(plugin, inputs, plugin_instance):
+    '''
+    Starts evaluating a condition on the thread pool and returns its
+    AsyncResult, or None if all of the pool's threads are busy (including
+    with abandoned conditions that are still running). Conditions are never
+    queued, as a queued condition would only start once its budget is spent.
+    '''
+
+    pool = get_thread_pool()
+    if not _pool_slots.acquire(False):
+        return None
+    try:
+        return pool.apply_async(_run_in_thread, (
+            plugin, inputs, plugin_instance, translation.get_language()))
+    except Exception:
+        _pool_slots.release()
+        raise
+
+
+def record_event(plugin_type, reason):
+    with _events_lock:
+        key = (plugin_type, reason)
+        _events[key] = _events.get(key, 0) + 1
+
+
+def get_events():
+    '''
+    Returns a copy of the failure counts of this process in the form:
+
+        { (/plugin class/, /reason/): /count/ }
+    '''
+
+    with _events_lock:
+        return dict(_events)
+
+
+def get_failure(request, plugin_instance):
+    '''
+    Returns the fallback mode used for the given plugin instance during this
+    request, or None, if its condition didn't fail.
+    '''
+
+    return (getattr(request, FAILURES_ATTR, None) or dict()).get(plugin_instance.pk)
+
+
+def _fail(request, plugin, plugin_instance, reason):
+    record_event(plugin_instance.plugin_type, reason)
+    mode = get_fallback_mode(plugin)
+    if request is not None:
+        failures = getattr(request, FAILURES_ATTR, None)
+        if failures is None:
+            failures = dict()
+            setattr(request, FAILURES_ATTR, failures)
+        failures[plugin_instance.pk] = mode
+    return mode == ACTIVE
+
+
+def _run_in_thread(plugin, inputs, plugin_instance, language):
+    '''
+    Evaluates a condition on a pool thread, in the request's language. Pool
+    threads outlive requests, so, the database connections they open are
+    closed here rather than at the end of a request. Frees the thread's slot
+    (see _submit()) once done, even if the request has moved on.
+    '''
+
+    if language:
+        translation.activate(language)
+    try:
+        return plugin.is_inputs_appropriate(inputs, plugin_instance)
+    finally:
+        translation.deactivate()
+        for connection in connections.all():
+            connection.close()
+        _pool_slots.release()
+
+
+def run_condition(context, plugin, plugin_instance):
+    '''
+    Returns the result of the plugin's is_context_appropriate(), within its
+    time budget (plugin.evaluation_budget seconds, if set) and what is left of
+    the request's budget (see get_request_budget()).
+
+    Conditions that run over budget or raise are logged, counted (see
+    get_events()) and decided according to their fallback mode. Conditions
+    can only be interrupted if they run in the thread pool; others keep
+    their decision if they run over, as it is already paid for, but are
+    counted. Conditions that would have to wait for a busy pool, or for
+    which no budget is left, are decided by their fallback mode at once.
+
+    Plugins with run_in_thread are decided by is_inputs_appropriate(), given
+    only their get_decision_inputs(), which are taken on the request's
+    thread. A thread that runs over budget is abandoned, not stopped, so, it
+    must never touch the request or context.
+    '''
+
+    request = context.get('request')
+    budget = getattr(plugin, 'evaluation_budget', None)
+
+    remaining = get_remaining_budget(request)
+    if remaining is not None:
+        if remaining <= 0:
+            return _fail(request, plugin, plugin_instance, EXHAUSTED)
+        budget = remaining if budget is None else min(budget, remaining)
+
+    #
+    # Composite segments evaluate their conditions within their own
+    # evaluation, which must only be counted once.
+    #
+    nested = getattr(request, NESTED_ATTR, False)
+    if request is not None:
+        setattr(request, NESTED_ATTR, True)
+
+    start = time.time()
+    try:
+        if getattr(plugin, 'run_in_thread', False):
+            inputs = plugin.get_decision_inputs(context, plugin_instance)
+            if budget is None:
+                decision = bool(plugin.is_inputs_appropriate(inputs, plugin_instance))
+            else:
+                result = _submit(plugin, inputs, plugin_instance)
+                if result is None:
+                    logger.warning('%s #%s was not evaluated, all threads are busy.',
+                                   plugin_instance.plugin_type, plugin_instance.pk)
+                    return _fail(request, plugin, plugin_instance, OVER_BUDGET)
+                decision = bool(result.get(budget))
+        else:
+            decision = bool(plugin.is_context_appropriate(context, plugin_instance))
+    except TimeoutError:
+        logger.warning('%s #%s ran over its budget of %.3fs.',
+                       plugin_instance.plugin_type, plugin_instance.pk, budget)
+        decision = _fail(request, plugin, plugin_instance, OVER_BUDGET)
+    except Exception:
+        logger.exception('%s #%s failed to evaluate.',
+                         plugin_instance.plugin_type, plugin_instance.pk)
+        decision = _fail(request, plugin, plugin_instance, ERROR)
+    else:
+        if budget is not None and time.time() - start > budget:
+            logger.warning('%s #%s ran over its budget of %.3fs.',
+                           plugin_instance.plugin_type, plugin_instance.pk, budget)
+            record_event(plugin_instance.plugin_type, OVER_BUDGET)
+    finally:
+        if request is not None and not nested:
+            setattr(request, NESTED_ATTR, False)
+            setattr(request, SPENT_ATTR,
+                    getattr(request, SPENT_ATTR, 0.0) + time.time() - start)
+
+    return decision
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.utils.encoding import force_text
+
+from ..metrics import VISITOR_CACHE, record_cache
+
+
+SESSION = 'session'
+COOKIE = 'cookie'
+
+#
+# Where the entries live in the session, and the signing salt of the cookie.
+# Either way, they are in the form:
+#
+#   { /digest of (class, configuration key)/: [ /decision/, /expiry/,
+#                                               /digest of the inputs/ ] }
+#
+SESSION_KEY = '_segment_decisions'
+SALT = 'aldryn_segmentation.decisions'
+DIGEST_LENGTH = 10
+
+#
+# The entries are loaded at most once per request and remembered here, along
+# with whether they need writing back to the cookie.
+#
+ENTRIES_ATTR = '_segment_decision_cache'
+PENDING_ATTR = '_segment_decision_cache_pending'
+
+
+def get_backend():
+    '''
+    Returns settings.SEGMENTATION_DECISION_CACHE: None (decisions are not
+    cached across requests), 'session' or 'cookie' (a signed cookie).
+    '''
+
+    return getattr(settings, 'SEGMENTATION_DECISION_CACHE', None)
+
+
+def get_cookie_name():
+    return getattr(settings, 'SEGMENTATION_DECISION_COOKIE_NAME', 'segment_decisions')
+
+
+def get_cookie_age():
+    return getattr(settings, 'SEGMENTATION_DECISION_COOKIE_AGE', 24 * 60 * 60)
+
+
+def get_digest(value):
+    return hashlib.sha1(force_text(value).encode('utf-8')).hexdigest()[:DIGEST_LENGTH]
+
+
+def get_entry_key(plugin_instance):
+    # This can't be defined at the file level, else circular imports
+    from ..segment_pool import segment_pool
+
+    config_key = segment_pool.get_config_key(plugin_instance.configuration_string)
+    return get_digest('{0}\0{1}'.format(
+        plugin_instance.get_plugin_class().__name__, config_key))
+
+
+def _load(request):
+    entries = getattr(request, ENTRIES_ATTR, None)
+    if entries is None:
+        entries = dict()
+        if get_backend() == SESSION:
+            session = getattr(request, 'session', None)
+            if session is not None:
+                entries = dict(session.get(SESSION_KEY) or dict())
+        else:
+            value = request.COOKIES.get(get_cookie_name())
+            if value:
+                try:
+                    entries = signing.loads(value, salt=SALT,
+                                            max_age=get_cookie_age())
+                except signing.BadSignature:
+                    pass
+        setattr(request, ENTRIES_ATTR, entries)
+    return entries
+
+
+def _store(request, entries):
+    now = time.time()
+    for key, (decision, expiry, inputs) in list(entries.items()):
+        if expiry <= now:
+            del entries[key]
+
+    if get_backend() == SESSION:
+        session = getattr(request, 'session', None)
+        if session is not None:
+            session[SESSION_KEY] = entries
+    else:
+        setattr(request, PENDING_ATTR, True)
+
+
+def is_cacheable(plugin):
+    return bool(get_backend() and getattr(plugin, 'decision_ttl', None))
+
+
+def get_inputs_digest(context, plugin, plugin_instance):
+    return get_digest(repr(plugin.get_decision_inputs(context, plugin_instance)))
+
+
+def get_cached_decision(context, plugin, plugin_instance):
+    '''
+    Returns the decision cached for the given segment in an earlier request,
+    or None, if there is none, it has expired or the inputs it was made from
+    have changed since (see SegmentPluginBase.get_decision_inputs()).
+    '''
+
+    request = context.get('request')
+    if request is None or not is_cacheable(plugin):
+        return None
+
+    entry = _load(request).get(get_entry_key(plugin_instance))
+    if (not entry or entry[1] <= time.time() or
+            entry[2] != get_inputs_digest(context, plugin, plugin_instance)):
+        record_cache(VISITOR_CACHE, False)
+        return None
+
+    record_cache(VISITOR_CACHE, True)
+    return bool(entry[0])
+
+
+def cache_decision(context, plugin, plugin_instance, decision):
+    '''
+    Caches the given decision for plugin.decision_ttl seconds, if the
+    plugin's class declares one.
+    '''
+
+    request = context.get('request')
+    if request is None or not is_cacheable(plugin):
+        return
+
+    entries = _load(request)
+    entries[get_entry_key(plugin_instance)] = [
+        int(decision),
+        int(time.time() + plugin.decision_ttl),
+        get_inputs_digest(context, plugin, plugin_instance),
+    ]
+    _store(request, entries)
+
+
+def update_response(request, response):
+    '''
+    Writes the decisions cached during this request to the signed cookie, if
+    that is the configured backend. See SegmentDecisionCacheMiddleware.
+    '''
+
+    if get_backend() != COOKIE or not getattr(request, PENDING_ATTR, False):
+        return
+
+    entries = getattr(request, ENTRIES_ATTR, None)
+    if entries:
+        response.set_cookie(
+            get_cookie_name(),
+            signing.dumps(entries, salt=SALT, compress=True),
+            max_age=get_cookie_age(),
+            httponly=True,
+        )
+    else:
+        response.delete_cookie(get_cookie_name())
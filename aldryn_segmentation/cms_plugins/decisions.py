@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from .budgets import get_failure, run_condition
+from .decision_cache import cache_decision, get_cached_decision
+from ..metrics import (
+    EVALUATION_SECONDS,
+    EVALUATIONS,
+    MATCHES,
+    OVERRIDES_APPLIED,
+    REQUEST_CACHE,
+    increment,
+    observe,
+    record_cache,
+)
+
+
+#
+# The decisions made during a request are remembered on the request itself.
+#
+DECISIONS_ATTR = '_segment_decisions'
+
+#
+# The earliest instant at which any of those decisions may change.
+#
+VALID_UNTIL_ATTR = '_segment_valid_until'
+
+#
+# The measured cost of evaluating each segment plugin class, in seconds, as an
+# exponentially weighted moving average. This lives in the memory of the
+# current process.
+#
+COST_WEIGHT = 0.1
+_costs = dict()
+_costs_lock = threading.Lock()
+
+
+def get_decision_store(request):
+    '''
+    Returns the dict of segment decisions already made during this request,
+    keyed by plugin id.
+    '''
+
+    if request is None:
+        return dict()
+
+    decisions = getattr(request, DECISIONS_ATTR, None)
+    if decisions is None:
+        decisions = dict()
+        setattr(request, DECISIONS_ATTR, decisions)
+    return decisions
+
+
+def expire_decisions_at(request, valid_until):
+    '''
+    Records that a decision made during this request may change at the given
+    (aware) instant, E.g., at the end of a time window. Caching layers can
+    then expire whatever depends on the request's decisions exactly then (see
+    get_decisions_valid_until()).
+    '''
+
+    if request is None or valid_until is None:
+        return
+
+    current = getattr(request, VALID_UNTIL_ATTR, None)
+    if current is None or valid_until < current:
+        setattr(request, VALID_UNTIL_ATTR, valid_until)
+
+
+def get_decisions_valid_until(request):
+    '''
+    Returns the earliest instant at which any of the decisions made during
+    this request may change, or None, if none of them expires.
+    '''
+
+    return getattr(request, VALID_UNTIL_ATTR, None)
+
+
+def get_cost(plugin_type):
+    '''
+    Returns the measured cost of evaluating a segment plugin of the given
+    class. Classes that have not been measured yet cost nothing, so that they
+    are measured as soon as possible.
+    '''
+
+    return _costs.get(plugin_type, 0.0)
+
+
+def get_costs():
+    '''
+    Returns a copy of the measured costs of this process in the form:
+
+        { /plugin class/: /seconds/ }
+    '''
+
+    with _costs_lock:
+        return dict(_costs)
+
+
+def record_cost(plugin_type, seconds):
+    with _costs_lock:
+        cost = _costs.get(plugin_type)
+        if cost is None:
+            _costs[plugin_type] = seconds
+        else:
+            _costs[plugin_type] = cost + COST_WEIGHT * (seconds - cost)
+
+
+def evaluate_segment(context, plugin_instance, plugin=None):
+    '''
+    Returns True if the given segment plugin instance is appropriate in this
+    context, honouring the current user's override for the segment.
+
+    Each segment is evaluated at most once per request, within its time
+    budget (see budgets.run_condition()), and the time it takes is recorded
+    against its plugin class (see get_cost()). Plugin classes with a
+    decision_ttl may also have their decisions reused across requests (see
+    decision_cache).
+    '''
+
+    # This can't be defined at the file level, else circular imports
+    from ..segment_pool import SegmentOverride
+
+    decisions = get_decision_store(context.get('request'))
+    try:
+        decision = decisions[plugin_instance.pk]
+    except KeyError:
+        record_cache(REQUEST_CACHE, False)
+    else:
+        record_cache(REQUEST_CACHE, True)
+        return decision
+
+    if plugin is None:
+        plugin = plugin_instance.get_plugin_class_instance()
+
+    start = time.time()
+
+    override = SegmentOverride.NoOverride
+    if (getattr(plugin, 'allow_overrides', False) and
+            hasattr(plugin, 'get_segment_override')):
+        override = plugin.get_segment_override(context, plugin_instance)
+
+    plugin_type = plugin_instance.plugin_type
+    if override == SegmentOverride.ForcedActive:
+        decision = True
+    elif override == SegmentOverride.ForcedInactive:
+        decision = False
+    else:
+        #
+        # There's no override, so, just let the segment decide, unless it
+        # already has in an earlier request of the same visitor...
+        #
+        decision = get_cached_decision(context, plugin, plugin_instance)
+        if decision is None:
+            evaluation_start = time.time()
+            decision = run_condition(context, plugin, plugin_instance)
+            observe(EVALUATION_SECONDS, time.time() - evaluation_start,
+                    segment_class=plugin_type)
+            increment(EVALUATIONS, segment_class=plugin_type)
+            if decision:
+                increment(MATCHES, segment_class=plugin_type)
+
+            request = context.get('request')
+            if get_failure(request, plugin_instance) is None:
+                cache_decision(context, plugin, plugin_instance, decision)
+
+    if override != SegmentOverride.NoOverride:
+        increment(OVERRIDES_APPLIED, segment_class=plugin_type,
+                  override=SegmentOverride.names.get(override, 'unknown'))
+
+    record_cost(plugin_type, time.time() - start)
+    decisions[plugin_instance.pk] = decision
+    return decision
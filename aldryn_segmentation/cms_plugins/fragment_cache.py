@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import force_bytes
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+from .segment_renderers import is_edit_mode
+from ..metrics import FRAGMENT_CACHE, record_cache
+
+try:
+    from sekizai.data import UniqueSequence
+    from sekizai.helpers import get_varname
+except ImportError:
+    get_varname = None
+
+
+FRAGMENT_KEY = 'aldryn_segmentation:fragment:{plugin_id}:{version}:{language}'
+
+
+def is_enabled():
+    return getattr(settings, 'SEGMENTATION_FRAGMENT_CACHE', False)
+
+
+def get_timeout():
+    return getattr(settings, 'SEGMENTATION_FRAGMENT_CACHE_TIMEOUT', 3600)
+
+
+def get_subtree_version(plugin_instance):
+    '''
+    Returns a digest of the given plugin and all of its descendants, their
+    positions and when each of them was last changed. Saving, adding, moving
+    or deleting a plugin in the subtree changes it, so that the fragments of
+    other subtrees stay cached.
+    '''
+
+    digest = hashlib.md5()
+
+    def walk(instance):
+        digest.update(force_bytes('{0}:{1}:{2};'.format(
+            instance.pk, instance.position, instance.changed_date)))
+        for child in instance.child_plugin_instances or []:
+            walk(child)
+        digest.update(b'.')
+
+    walk(plugin_instance)
+    return digest.hexdigest()
+
+
+def get_sekizai_holder(context):
+    '''
+    Returns the context's sekizai blocks (as filled by {% addtoblock %}), or
+    None without sekizai.
+    '''
+
+    if get_varname is None or not hasattr(context, 'push'):
+        return None
+    return context.get(get_varname())
+
+
+def render_with_blocks(context, render):
+    '''
+    Returns the output of the given callable and what it added to each of
+    the context's sekizai blocks, in the form:
+
+        (/output/, { /block name/: [ /item/, ... ] })
+
+    The additions also end up in the context's blocks, as usual.
+    '''
+
+    holder = get_sekizai_holder(context)
+    if holder is None:
+        return render(), dict()
+
+    context.push()
+    context[get_varname()] = defaultdict(UniqueSequence)
+    try:
+        output = render()
+        blocks = dict(
+            (name, list(items))
+            for name, items in context[get_varname()].items()
+            if items
+        )
+    finally:
+        context.pop()
+
+    replay_blocks(context, blocks)
+    return output, blocks
+
+
+def replay_blocks(context, blocks):
+    '''
+    Adds the sekizai block items of a cached fragment to the context's blocks,
+    as if the fragment had been rendered.
+    '''
+
+    holder = get_sekizai_holder(context)
+    if holder is None:
+        return
+
+    for name, items in blocks.items():
+        for item in items:
+            holder[name].append(item)
+
+
+def is_cacheable(plugin_instance, root=True):
+    '''
+    Returns True if the output of the given plugin depends only on the plugin
+    tree. This is not the case if any of its descendants is itself a segment
+    plugin or a Limit Block, or any other plugin that has opted out of caching
+    (cache = False).
+
+    The given plugin itself is only checked if it is not a segment plugin.
+    Segment plugins opt out of caching because their decision depends on the
+    request, but once they've decided, their output does not.
+    '''
+
+    plugin_class = plugin_instance.get_plugin_class()
+    if (not (root and hasattr(plugin_class, 'is_context_appropriate')) and
+            not getattr(plugin_class, 'cache', True)):
+        return False
+
+    return all(
+        is_cacheable(child, root=False)
+        for child in plugin_instance.child_plugin_instances or []
+    )
+
+
+def render_cached(context, plugin_instance, render):
+    '''
+    Returns the output of the given child of a Limit Block (or composite
+    segment), which is rendered with the given callable on a cache miss.
+
+    Fragments are cached per plugin, version of its subtree (see
+    get_subtree_version()) and language, but only when
+    settings.SEGMENTATION_FRAGMENT_CACHE is True, outside of edit mode and if
+    the plugin is_cacheable(). What a fragment adds to sekizai blocks (E.g.,
+    its CSS and JavaScript) is cached along with it and added again on a hit.
+    '''
+
+    request = context.get('request')
+    if (not is_enabled() or is_edit_mode(request) or
+            not is_cacheable(plugin_instance)):
+        return render()
+
+    key = FRAGMENT_KEY.format(
+        plugin_id=plugin_instance.pk,
+        version=get_subtree_version(plugin_instance),
+        language=get_language(),
+    )
+    cached = cache.get(key)
+    record_cache(FRAGMENT_CACHE, cached is not None)
+    if cached is None:
+        fragment, blocks = render_with_blocks(context, render)
+        cache.set(key, (fragment, blocks), get_timeout())
+    else:
+        fragment, blocks = cached
+        replay_blocks(context, blocks)
+    return mark_safe(fragment)
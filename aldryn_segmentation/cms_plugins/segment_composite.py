@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import operator
+from functools import reduce
+
+from django.utils.translation import ugettext_lazy as _
+from cms.plugin_pool import plugin_pool
+
+from ..attributes import prefetch_attributes
+from ..models import CompositeSegmentPluginModel, SegmentBasePluginModel
+from .decisions import evaluate_segment, get_cost
+from .segment_plugin_base import SegmentPluginBase
+from .segment_renderers import RenderTemplate, SegmentLimiterRenderer
+
+
+class CompositeSegmentPlugin(SegmentPluginBase):
+    '''
+    This segment plugin combines the conditions of its child segment plugins
+    with AND, OR or NOT (none of them) and displays its other children when
+    the combination is met. A composite without any conditions never matches.
+
+    The conditions are evaluated cheapest first, as measured, and only until
+    the outcome is known.
+    '''
+
+    model = CompositeSegmentPluginModel
+    name = _('Composite segment')
+    parent_classes = ['SegmentLimitPlugin', 'CompositeSegmentPlugin', ]
+    render_template = RenderTemplate(
+        'aldryn_segmentation/_composite.html', SegmentLimiterRenderer())
+
+    def render(self, context, instance, placeholder):
+        context = super(CompositeSegmentPlugin, self).render(
+            context, instance, placeholder)
+        #
+        # Conditions are never displayed, but in edit mode, they are passed
+        # on (as not renderable) so that the structureboard displays properly.
+        #
+        context['child_plugins'] = [
+            (child, not self.is_condition(child))
+            for child in instance.child_plugin_instances or []
+        ]
+        return context
+
+
+    @staticmethod
+    def is_condition(child_instance):
+        return isinstance(child_instance, SegmentBasePluginModel)
+
+
+    def get_conditions(self, instance):
+        '''
+        Returns the child segment plugin instances of this composite, cheapest
+        to evaluate first.
+        '''
+        conditions = [
+            child for child in instance.child_plugin_instances or []
+            if self.is_condition(child)
+        ]
+        return sorted(conditions, key=lambda child: get_cost(child.plugin_type))
+
+
+    def is_context_appropriate(self, context, instance):
+        conditions = self.get_conditions(instance)
+        if not conditions:
+            return False
+
+        prefetch_attributes(context, instance)
+
+        results = (
+            evaluate_segment(context, condition) for condition in conditions
+        )
+        if instance.operator == instance.AND:
+            return all(results)
+        elif instance.operator == instance.OR:
+            return any(results)
+        else:
+            return not any(results)
+
+
+    def evaluate_batch(self, batch, instance):
+        conditions = self.get_conditions(instance)
+        if not conditions:
+            return batch.constant(False)
+
+        results = [batch.decide(condition) for condition in conditions]
+        if instance.operator == instance.AND:
+            return reduce(operator.and_, results)
+        elif instance.operator == instance.OR:
+            return reduce(operator.or_, results)
+        else:
+            return ~reduce(operator.or_, results)
+
+
+plugin_pool.register_plugin(CompositeSegmentPlugin)
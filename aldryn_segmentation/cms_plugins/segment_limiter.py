@@ -4,8 +4,16 @@ from __future__ import unicode_literals
 from django.utils.translation import ugettext_lazy as _
 from cms.plugin_pool import plugin_pool
 
-from ..models import SegmentLimitPluginModel
+from ..attributes import prefetch_attributes
+from ..models import FallbackSegmentPluginModel, SegmentLimitPluginModel
+from .budgets import FALLBACK, get_failure
+from .decisions import evaluate_segment
 from .segment_plugin_base import SegmentPluginBase
+from .segment_renderers import (
+    RenderTemplate,
+    SegmentLimiterRenderer,
+    is_edit_mode,
+)
 
 
 class SegmentLimitPlugin(SegmentPluginBase):
@@ -20,14 +28,15 @@ class SegmentLimitPlugin(SegmentPluginBase):
     module = _('Segmentation')
     name = _('Limit Block')
     parent_classes = None
-    render_template = 'aldryn_segmentation/_limiter.html'
+    render_template = RenderTemplate(
+        'aldryn_segmentation/_limiter.html', SegmentLimiterRenderer())
 
     allow_overrides = False
 
     def render(self, context, instance, placeholder):
         context = super(SegmentLimitPlugin, self).render(
             context, instance, placeholder)
-        context['child_plugins'] = self.get_context_appropriate_children(
+        context['child_plugins'] = self.iter_context_appropriate_children(
             context, instance)
         return context
 
@@ -35,26 +44,85 @@ class SegmentLimitPlugin(SegmentPluginBase):
     def is_context_appropriate(self, context, instance):
         '''
         Returns True if any of its children are context-appropriate,
-        else False.
+        else False. Stops evaluating children at the first match.
         '''
-        apt_children = self.get_context_appropriate_children(context, instance)
-        num_apt = sum( 1 for child in apt_children if child[1] )
-        return num_apt > 0
+        return any(
+            apt for child, apt in self.iter_context_appropriate_children(
+                context, instance, include_skipped=False)
+        )
+
+
+    def evaluate_batch(self, batch, instance):
+        '''
+        Returns, for each request in the batch, True if any of its children
+        are context-appropriate (see is_context_appropriate()).
+        '''
+        decision = batch.constant(False)
+        for child_instance in instance.child_plugin_instances or []:
+            child_plugin = child_instance.get_plugin_class_instance()
+            if child_plugin.model != child_instance.__class__:
+                # An orphan plugin
+                continue
+            if not hasattr(child_plugin, 'is_context_appropriate'):
+                return batch.constant(True)
+            decision = decision | batch.decide(child_instance)
+        return decision
 
 
     def get_context_appropriate_children(self, context, instance):
-        from ..segment_pool import SegmentOverride
         '''
         Returns a LIST OF TUPLES each containing a child plugin instance and a
         Boolean representing the plugin's appropriateness for rendering in
         this context.
         '''
+        return list(self.iter_context_appropriate_children(context, instance))
+
+
+    def needs_all_children(self, context):
+        '''
+        Returns True if every child must be passed on for rendering, even
+        those that won't be displayed. This is the case when the toolbar is in
+        edit (structure) mode, so that the structureboard displays properly.
+        '''
+        return is_edit_mode(context.get('request'))
+
+
+    def iter_context_appropriate_children(self, context, instance, include_skipped=None):
+        '''
+        Yields TUPLES each containing a child plugin instance and a Boolean
+        representing the plugin's appropriateness for rendering in this
+        context.
+
+        Children are evaluated lazily, one at a time, as they are pulled, and
+        at most once per request (see decisions.evaluate_segment()). Once
+        all of the slots are filled, the remaining children are not evaluated
+        at all. They are yielded as (instance, False) only if
+        `include_skipped` is True, which defaults to needs_all_children().
+
+        The visitor attributes that the segments on the page (up to
+        max_children per Limit Block) will need are fetched up front, in one
+        batch per provider (see attributes.prefetch_attributes()).
+
+        If a child's condition fails in the 'fallback' mode (see
+        budgets.run_condition()), all following children are skipped until
+        the next Fallback segment.
+        '''
+        if include_skipped is None:
+            include_skipped = self.needs_all_children(context)
+
+        prefetch_attributes(context, instance)
 
-        children = []
         # child_plugin_instances can sometimes be None
         generic_children = instance.child_plugin_instances or []
         render_all = (instance.max_children == 0)
         slots_remaining = instance.max_children
+        request = context.get('request')
+
+        #
+        # Set once a child's condition failed with the FALLBACK mode (see
+        # budgets.run_condition()), until the next Fallback segment.
+        #
+        skip_to_fallback = False
 
         for child_instance in generic_children:
 
@@ -66,65 +134,44 @@ class SegmentLimitPlugin(SegmentPluginBase):
                 # then we're dealing with an orphan plugin.
                 continue
 
-            if render_all or slots_remaining > 0:
-
-                if hasattr(child_plugin, 'is_context_appropriate'):
-                    #
-                    # This quacks like a segment plugin...
-                    #
-                    if (hasattr(child_plugin, 'allow_overrides') and
-                            child_plugin.allow_overrides and
-                            hasattr(child_plugin, 'get_segment_override')):
-
-                        override = child_plugin.get_segment_override(
-                            context, child_instance)
-
-                        if override == SegmentOverride.ForcedActive:
-                            child = (child_instance, True)
-                        elif override == SegmentOverride.ForcedInactive:
-                            child = (child_instance, False)
-                        else:
-                            #
-                            # There's no override, so, just let the segment
-                            # decide...
-                            #
-                            child = (
-                                child_instance,
-                                child_plugin.is_context_appropriate(
-                                    context, child_instance
-                                ),
-                            )
-                    else:
-                        #
-                        # Hmmm, this segment plugin appears to have no
-                        # allow_overrides property or get_segment_override()
-                        # method. OK then, let the plugin decide if it is
-                        # appropriate to render.
-                        #
-                        child = (
-                            child_instance,
-                            child_plugin.is_context_appropriate(
-                                context, child_instance
-                            ),
-                        )
+            if not (render_all or slots_remaining > 0):
+                #
+                # We've run out of available slots...
+                #
+                if not include_skipped:
+                    return
+                yield ( child_instance, False, )
+                continue
+
+            if skip_to_fallback:
+                if isinstance(child_instance, FallbackSegmentPluginModel):
+                    skip_to_fallback = False
+                    child = ( child_instance, True, )
                 else:
-                    #
-                    # This doesn't quack like a Segment Plugin, so, it is
-                    # always OK to render.
-                    #
-                    child =  ( child_instance, True, )
-
-                if child[1]:
-                    slots_remaining -= 1
+                    child = ( child_instance, False, )
+
+            elif hasattr(child_plugin, 'is_context_appropriate'):
+                #
+                # This quacks like a segment plugin, so, let it (or the
+                # operator's override) decide...
+                #
+                child = (
+                    child_instance,
+                    evaluate_segment(context, child_instance, child_plugin),
+                )
+                if get_failure(request, child_instance) == FALLBACK:
+                    skip_to_fallback = True
             else:
                 #
-                # We've run out of available slots...
+                # This doesn't quack like a Segment Plugin, so, it is
+                # always OK to render.
                 #
-                child = ( child_instance, False, )
+                child =  ( child_instance, True, )
 
-            children.append(child)
+            if child[1]:
+                slots_remaining -= 1
 
-        return children
+            yield child
 
 
 plugin_pool.register_plugin(SegmentLimitPlugin)
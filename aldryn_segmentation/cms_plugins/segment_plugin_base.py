@@ -6,6 +6,8 @@ from django.utils.translation import ugettext_lazy as _
 
 from cms.plugin_base import CMSPluginBase
 
+from .segment_renderers import RenderTemplate, SegmentChildrenRenderer
+
 
 class SegmentPluginBase(CMSPluginBase):
     '''
@@ -17,7 +19,7 @@ class SegmentPluginBase(CMSPluginBase):
 
     Also, by using this base class, the Segmentation Group Plugin will be able
     accept the plugin (The Segmentation Group plugin has child_classes set to
-    this class).
+    this class), as will a Composite Segment, which uses it as a condition.
     '''
 
     class Meta:
@@ -26,8 +28,9 @@ class SegmentPluginBase(CMSPluginBase):
     allow_children = True
     cache = False
     module = _('Segmentation')
-    parent_classes = ['SegmentLimitPlugin', ]
-    render_template = 'aldryn_segmentation/_segment.html'
+    parent_classes = ['SegmentLimitPlugin', 'CompositeSegmentPlugin', ]
+    render_template = RenderTemplate(
+        'aldryn_segmentation/_segment.html', SegmentChildrenRenderer())
     text_enabled = False
 
     #
@@ -36,6 +39,27 @@ class SegmentPluginBase(CMSPluginBase):
     #
     allow_overrides = True
 
+    #
+    # The number of seconds is_context_appropriate() may take before it is
+    # decided by the fallback mode (see aldryn_segmentation.cms_plugins.budgets)
+    # instead: 'inactive', 'active' or 'fallback', which defaults to
+    # settings.SEGMENTATION_EVALUATION_FALLBACK. Set run_in_thread to True for
+    # conditions that block (E.g., on a remote service), so that they can be
+    # interrupted once their budget is spent. Such plugins are decided by
+    # is_inputs_appropriate() rather than is_context_appropriate().
+    #
+    evaluation_budget = None
+    evaluation_fallback = None
+    run_in_thread = False
+
+    #
+    # The number of seconds this plugin's decisions may be reused across the
+    # requests of a visitor, if settings.SEGMENTATION_DECISION_CACHE is set
+    # (see aldryn_segmentation.cms_plugins.decision_cache). Leave as None for
+    # conditions that are cheap or must be re-evaluated on every request.
+    #
+    decision_ttl = None
+
 
     def get_segment_override(self, context, instance):
         '''
@@ -52,12 +76,63 @@ class SegmentPluginBase(CMSPluginBase):
         request = context['request']
         if request.user.is_authenticated():
             return segment_pool.get_override_for_segment(
-                request.user, self, instance
+                request.user, self, instance, request=request
             )
 
         return SegmentOverride.NoOverride
 
 
+    def get_attribute_keys(self, instance):
+        '''
+        Return the visitor attribute keys (see aldryn_segmentation.attributes)
+        that is_context_appropriate() will read for the given instance, so
+        that they can be fetched in one batch with those of the other segments
+        on the page. Segment plugins that use visitor attributes should
+        override this.
+        '''
+
+        return ()
+
+
+    def get_decision_inputs(self, context, instance):
+        '''
+        Return the values from the request that the decision for the given
+        instance depends on (E.g., the visitor's IP address). A cached
+        decision is discarded as soon as these change. Only relevant for
+        plugins with a decision_ttl or run_in_thread (see
+        is_inputs_appropriate()), so, they should be immutable.
+        '''
+
+        return None
+
+
+    def is_inputs_appropriate(self, inputs, instance):
+        '''
+        Return True if this plugin is appropriate given only the values that
+        get_decision_inputs() returned for the request. Plugins with
+        run_in_thread set must implement this instead of
+        is_context_appropriate(), as they are evaluated in another thread,
+        which may be abandoned while the page continues to render. That thread
+        must not touch the request or the context (E.g., the session or the
+        visitor attributes) and must only read the instance.
+        '''
+
+        raise NotImplementedError('Segment plugins that run in a thread must '
+                                  'implement is_inputs_appropriate().')
+
+
+    def evaluate_batch(self, batch, instance):
+        '''
+        Return an array of booleans of whether the given instance is
+        appropriate for each of the requests in the given
+        aldryn_segmentation.simulation.RequestBatch, with the same semantics
+        as is_context_appropriate(), or None if this can't be determined
+        offline. This is used to simulate segments over request logs.
+        '''
+
+        return None
+
+
     def is_context_appropriate(self, context, instance):
         '''
         Return True if this plugin is appropriate for rendering in the given
@@ -1,16 +1,36 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+
 from django.utils.translation import ugettext_lazy as _
 
 from cms.plugin_pool import plugin_pool
 
+from .decisions import expire_decisions_at
 from .segment_plugin_base import SegmentPluginBase
 
+from ..buckets import get_bucket
+from ..geoip import geoip, get_client_ip, get_visitor_country
+from ..headers import (
+    get_meta_key,
+    get_user_agent,
+    match_value,
+    parse_user_agent,
+)
+from ..query import get_query_params, persist_param
+from ..schedule import get_state
+from ..user_context import get_user_context
+
 from ..models import (
     AuthenticatedSegmentPluginModel,
+    BucketSegmentPluginModel,
     CookieSegmentPluginModel,
+    CountrySegmentPluginModel,
     FallbackSegmentPluginModel,
+    GroupSegmentPluginModel,
+    HeaderSegmentPluginModel,
+    QuerySegmentPluginModel,
+    ScheduleSegmentPluginModel,
     SwitchSegmentPluginModel,
 )
 
@@ -30,6 +50,9 @@ class FallbackSegmentPlugin(SegmentPluginBase):
     def is_context_appropriate(self, context, instance):
         return True
 
+    def evaluate_batch(self, batch, instance):
+        return batch.constant(True)
+
 
 class SwitchSegmentPlugin(SegmentPluginBase):
     '''
@@ -47,6 +70,9 @@ class SwitchSegmentPlugin(SegmentPluginBase):
     def is_context_appropriate(self, context, instance):
         return instance.on_off
 
+    def evaluate_batch(self, batch, instance):
+        return batch.constant(instance.on_off)
+
 
 class CookieSegmentPlugin(SegmentPluginBase):
     '''
@@ -62,6 +88,155 @@ class CookieSegmentPlugin(SegmentPluginBase):
         value = request.COOKIES.get(instance.cookie_key)
         return (value == instance.cookie_value)
 
+    def evaluate_batch(self, batch, instance):
+        return batch.cookie(instance.cookie_key).map(
+            lambda value: value == instance.cookie_value)
+
+
+class CountrySegmentPlugin(SegmentPluginBase):
+    '''
+    This segmentation plugin renders output on the condition that the
+    visitor's IP address is located in ``country_code``, according to the
+    local GeoIP database (see aldryn_segmentation.geoip).
+    '''
+
+    model = CountrySegmentPluginModel
+    name = _('Segment by country')
+
+    # The location of an IP address rarely changes
+    decision_ttl = 60 * 60
+
+    def get_decision_inputs(self, context, instance):
+        return get_client_ip(context.get('request'))
+
+    def is_context_appropriate(self, context, instance):
+        request = context.get('request')
+        return get_visitor_country(request) == instance.country_code
+
+    def evaluate_batch(self, batch, instance):
+        return batch.ip().map(
+            lambda ip: geoip.get_country(ip) == instance.country_code)
+
+
+class HeaderSegmentPlugin(SegmentPluginBase):
+    '''
+    This segmentation plugin renders output on the condition that the request
+    header ``header_name`` equals, starts with or matches (as a regular
+    expression) ``header_value``, or, that the device class or browser parsed
+    from the User-Agent header is ``header_value``.
+    '''
+
+    model = HeaderSegmentPluginModel
+    name = _('Segment by header')
+
+    def is_context_appropriate(self, context, instance):
+        request = context.get('request')
+        model = self.model
+
+        if instance.match_type == model.DEVICE:
+            device_class, browser = get_user_agent(request)
+            return device_class == instance.header_value.lower()
+        elif instance.match_type == model.BROWSER:
+            device_class, browser = get_user_agent(request)
+            return browser.lower() == instance.header_value.lower()
+
+        value = request.META.get(get_meta_key(instance.header_name))
+        if value is None:
+            return False
+
+        return match_value(instance.match_type, instance.header_value, value)
+
+    def evaluate_batch(self, batch, instance):
+        model = self.model
+
+        if instance.match_type in (model.DEVICE, model.BROWSER):
+            index = 0 if instance.match_type == model.DEVICE else 1
+            expected = instance.header_value.lower()
+            return batch.header('HTTP_USER_AGENT').map(
+                lambda value: parse_user_agent(value or '')[index].lower() == expected)
+
+        return batch.header(get_meta_key(instance.header_name)).map(
+            lambda value: value is not None and match_value(
+                instance.match_type, instance.header_value, value))
+
+
+class ScheduleSegmentPlugin(SegmentPluginBase):
+    '''
+    This segmentation plugin renders output during a date/time window and/or
+    on recurring weekdays and hours in a given time zone, E.g., for timed
+    campaigns.
+
+    The instant at which the segment next changes its state is recorded on
+    the request, so that caches of the response can expire exactly then (see
+    decisions.expire_decisions_at()).
+    '''
+
+    model = ScheduleSegmentPluginModel
+    name = _('Segment by schedule')
+
+    def is_context_appropriate(self, context, instance):
+        active, valid_until = get_state(instance)
+        expire_decisions_at(context.get('request'), valid_until)
+        return active
+
+    def evaluate_batch(self, batch, instance):
+        active, valid_until = get_state(instance, now=batch.now)
+        return batch.constant(active)
+
+
+class BucketSegmentPlugin(SegmentPluginBase):
+    '''
+    This segmentation plugin renders output for the visitors whose bucket in
+    ``experiment`` falls between ``bucket_from`` (inclusive) and
+    ``bucket_to`` (exclusive), E.g., for A/B tests. Buckets are derived from a
+    stable identifier, so, visitors keep theirs across requests and workers.
+    '''
+
+    model = BucketSegmentPluginModel
+    name = _('Segment by A/B bucket')
+
+    def is_context_appropriate(self, context, instance):
+        request = context.get('request')
+        bucket = get_bucket(request, instance.experiment,
+                            instance.identity, instance.cookie_name)
+        return (bucket is not None and
+                instance.bucket_from <= bucket < instance.bucket_to)
+
+    def evaluate_batch(self, batch, instance):
+        buckets = batch.bucket(instance.experiment, instance.identity,
+                               instance.cookie_name)
+        return (buckets >= instance.bucket_from) & (buckets < instance.bucket_to)
+
+
+class QuerySegmentPlugin(SegmentPluginBase):
+    '''
+    This segmentation plugin renders output on the condition that the query
+    string parameter ``param_name`` (E.g., ``utm_campaign``) equals, starts
+    with or matches (as a regular expression) ``param_value``.
+
+    With ``persist`` set, the matching value is also kept in a cookie (see
+    SegmentQueryMiddleware), so that the segment still matches on the
+    visitor's later requests without the parameter.
+    '''
+
+    model = QuerySegmentPluginModel
+    name = _('Segment by query parameter')
+
+    def is_context_appropriate(self, context, instance):
+        request = context.get('request')
+        for value in get_query_params(request).get(instance.param_name, ()):
+            if match_value(instance.match_type, instance.param_value, value):
+                if instance.persist:
+                    persist_param(request, instance.param_name, value)
+                return True
+        return False
+
+    def evaluate_batch(self, batch, instance):
+        return batch.query(instance.param_name).map(
+            lambda values: any(
+                match_value(instance.match_type, instance.param_value, value)
+                for value in values or ()))
+
 
 class AuthenticatedSegmentPlugin(SegmentPluginBase):
     '''
@@ -76,8 +251,38 @@ class AuthenticatedSegmentPlugin(SegmentPluginBase):
         request = context.get('request')
         return request and request.user and request.user.is_authenticated()
 
+    def evaluate_batch(self, batch, instance):
+        return batch.authenticated()
+
+
+class GroupSegmentPlugin(SegmentPluginBase):
+    '''
+    This plugin allows segmentation based on the visitor's group membership
+    and/or permissions. The checks read from the request's UserContext, which
+    loads the visitor's groups and permissions once, with a single query.
+    '''
+
+    model = GroupSegmentPluginModel
+    name = _('Segment by group or permission')
+
+    def is_context_appropriate(self, context, instance):
+        user_context = get_user_context(context.get('request'))
+        if not user_context.is_authenticated:
+            return False
+        if instance.group_id and not user_context.is_member(instance.group_id):
+            return False
+        if instance.permission and not user_context.has_permission(instance.permission):
+            return False
+        return bool(instance.group_id or instance.permission)
+
 
 plugin_pool.register_plugin(AuthenticatedSegmentPlugin)
+plugin_pool.register_plugin(BucketSegmentPlugin)
 plugin_pool.register_plugin(CookieSegmentPlugin)
+plugin_pool.register_plugin(CountrySegmentPlugin)
 plugin_pool.register_plugin(FallbackSegmentPlugin)
+plugin_pool.register_plugin(GroupSegmentPlugin)
+plugin_pool.register_plugin(HeaderSegmentPlugin)
+plugin_pool.register_plugin(QuerySegmentPlugin)
+plugin_pool.register_plugin(ScheduleSegmentPlugin)
 plugin_pool.register_plugin(SwitchSegmentPlugin)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.template import Template
+
+
+def is_edit_mode(request):
+    '''
+    Returns True if the toolbar is in edit (or structure) mode for this
+    request.
+    '''
+    toolbar = getattr(request, 'toolbar', None)
+    return bool(toolbar and (getattr(toolbar, 'edit_mode', False) or
+                             getattr(toolbar, 'build_mode', False)))
+
+
+def get_plugin_processors(context):
+    '''
+    Returns the plugin processors that the {% render_plugin %} tag would use
+    in this context.
+    '''
+    request = context.get('request')
+    toolbar = getattr(request, 'toolbar', None)
+    page = getattr(request, 'current_page', None)
+    if (toolbar and getattr(toolbar, 'edit_mode', False) and
+            (not page or page.has_change_permission(request))):
+        from cms.middleware.toolbar import toolbar_plugin_processor
+        return (toolbar_plugin_processor, )
+    return None
+
+
+class SegmentRenderer(object):
+    '''
+    Renders a segment plugin's output directly in Python, rather than through
+    a template.
+
+    The CMS renders plugins with any object that, like a compiled Template,
+    has a `template` attribute and a `render(context)` method, so instances
+    of this class can be used as a plugin's render_template.
+    '''
+
+    # For the benefit of cms.plugin_rendering.render_plugin()
+    template = Template('')
+
+    def render(self, context):
+        raise NotImplementedError("Please Implement this method")
+
+
+class SegmentChildrenRenderer(SegmentRenderer):
+    '''
+    The equivalent of aldryn_segmentation/_segment.html: renders all of the
+    plugin's children.
+    '''
+
+    def render(self, context):
+        processors = get_plugin_processors(context)
+        children = context['instance'].child_plugin_instances or []
+        return '\n' + ''.join(
+            child.render_plugin(context, processors=processors)
+            for child in children
+        )
+
+
+class SegmentLimiterRenderer(SegmentRenderer):
+    '''
+    The equivalent of aldryn_segmentation/_limiter.html (and _composite.html):
+    renders the children the plugin found appropriate, pulling them from
+    `child_plugins` one at a time.
+    '''
+
+    def render(self, context):
+        # This can't be defined at the file level, else circular imports
+        from .fragment_cache import render_cached
+
+        processors = get_plugin_processors(context)
+        edit_mode = is_edit_mode(context.get('request'))
+        output = []
+        for child, render_plugin in context['child_plugins']:
+            if render_plugin:
+                output.append(render_cached(context, child, lambda: (
+                    child.render_plugin(context, processors=processors))))
+            elif edit_mode:
+                # See RenderSegmentPlugin.render_tag()
+                child.render_plugin(context, processors=processors)
+        return ''.join(output)
+
+
+class RenderTemplate(object):
+    '''
+    A descriptor for a segment plugin's render_template. It is the given
+    template name, unless settings.SEGMENTATION_RENDERER is 'python', in which
+    case it is the given SegmentRenderer.
+
+    Subclasses that set render_template themselves are always rendered with
+    their template, as are projects that leave SEGMENTATION_RENDERER at its
+    default of 'template', which keeps the templates available for overriding.
+    '''
+
+    def __init__(self, template_name, renderer):
+        self.template_name = template_name
+        self.renderer = renderer
+
+    def __get__(self, instance, owner):
+        if getattr(settings, 'SEGMENTATION_RENDERER', 'template') == 'python':
+            return self.renderer
+        return self.template_name
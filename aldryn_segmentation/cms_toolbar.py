@@ -2,6 +2,8 @@
 
 from __future__ import unicode_literals
 
+from django.conf import settings
+
 from cms.toolbar_base import CMSToolbar
 from cms.toolbar_pool import toolbar_pool
 
@@ -13,8 +15,15 @@ class SegmentToolbar(CMSToolbar):
 
     def populate(self):
 
+        if getattr(settings, 'SEGMENTATION_TOOLBAR_PAGE_ONLY', False):
+            page = getattr(self.request, 'current_page', None)
+        else:
+            page = None
+
+        segment_pool.sync(self.request)
         segment_pool.get_segments_toolbar_menu(
             self.request.user,
             self.request.toolbar,
-            csrf_token=self.request.COOKIES.get('csrftoken')
+            csrf_token=self.request.COOKIES.get('csrftoken'),
+            page=page
         )
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .lru import LRUCache
+
+
+#
+# The visitor's country is looked up at most once per request and remembered
+# on the request itself.
+#
+COUNTRY_ATTR = '_segment_country'
+
+#
+# Cached lookups of addresses that are not in the database.
+#
+UNKNOWN = ''
+
+
+def get_client_ip(request):
+    '''
+    Returns the visitor's IP address.
+
+    Behind reverse proxies, set settings.SEGMENTATION_GEOIP_PROXY_HEADER to
+    the META key of the header they set (E.g., 'HTTP_X_FORWARDED_FOR') and
+    settings.SEGMENTATION_GEOIP_PROXY_COUNT to the number of proxies that
+    append to it (default: 1). Entries to the left of those were supplied by
+    the client and cannot be trusted.
+    '''
+
+    header = getattr(settings, 'SEGMENTATION_GEOIP_PROXY_HEADER', None)
+    if header:
+        addresses = [
+            address.strip()
+            for address in request.META.get(header, '').split(',')
+            if address.strip()
+        ]
+        if addresses:
+            count = getattr(settings, 'SEGMENTATION_GEOIP_PROXY_COUNT', 1)
+            return addresses[max(len(addresses) - count, 0)]
+    return request.META.get('REMOTE_ADDR')
+
+
+class GeoIPLookup(object):
+    '''
+    Resolves IP addresses to ISO 3166-1 alpha-2 country codes using the local
+    MaxMind-format (.mmdb) database at settings.SEGMENTATION_GEOIP_DATABASE.
+
+    The database is opened once per process, memory-mapped, so that all
+    threads share the operating system's page cache rather than reading it
+    into memory. The latest SEGMENTATION_GEOIP_CACHE_SIZE (default: 10000)
+    lookups are kept in an LRU cache.
+    '''
+
+    def __init__(self):
+        self._reader = None
+        self._lock = threading.Lock()
+        self._cache = None
+
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = LRUCache(
+                getattr(settings, 'SEGMENTATION_GEOIP_CACHE_SIZE', 10000))
+        return self._cache
+
+
+    def get_reader(self):
+        if self._reader is None:
+            with self._lock:
+                if self._reader is None:
+                    self._reader = self.open_database()
+        return self._reader
+
+
+    @staticmethod
+    def open_database():
+        try:
+            import maxminddb
+        except ImportError:
+            raise ImproperlyConfigured('The Country segment requires the '
+                '“maxminddb” package. Install aldryn-segmentation[geoip].')
+
+        path = getattr(settings, 'SEGMENTATION_GEOIP_DATABASE', None)
+        if not path:
+            raise ImproperlyConfigured('The Country segment requires '
+                'settings.SEGMENTATION_GEOIP_DATABASE to be the path of a '
+                'MaxMind-format (.mmdb) database.')
+
+        try:
+            return maxminddb.open_database(path, maxminddb.MODE_MMAP)
+        except (IOError, OSError) as e:
+            raise ImproperlyConfigured(
+                'Unable to open the GeoIP database: {0}'.format(e))
+
+
+    def close(self):
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+            if self._cache is not None:
+                self._cache.clear()
+
+
+    def get_country(self, ip_address):
+        '''
+        Returns the country code for the given IP address, or None if it is
+        unknown (or invalid).
+        '''
+
+        if not ip_address:
+            return None
+
+        country = self.cache.get(ip_address)
+        if country is None:
+            try:
+                record = self.get_reader().get(ip_address)
+            except ValueError:
+                # Not a valid IP address
+                record = None
+            country = UNKNOWN
+            if record:
+                location = record.get('country') or record.get('registered_country') or {}
+                country = location.get('iso_code') or UNKNOWN
+            self.cache.set(ip_address, country)
+
+        return country or None
+
+
+geoip = GeoIPLookup()
+
+
+def get_visitor_country(request):
+    '''
+    Returns the country code of the visitor making the given request, or
+    None. The lookup happens once per request, no matter how many country
+    segments are on the page.
+    '''
+
+    try:
+        return getattr(request, COUNTRY_ATTR)
+    except AttributeError:
+        pass
+
+    country = geoip.get_country(get_client_ip(request))
+    setattr(request, COUNTRY_ATTR, country)
+    return country
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import re
+
+from django.conf import settings
+
+from .lru import LRUCache
+
+
+#
+# Device classes, as returned by parse_user_agent()
+#
+BOT = 'bot'
+TABLET = 'tablet'
+MOBILE = 'mobile'
+DESKTOP = 'desktop'
+
+#
+# The parsed user agent is remembered on the request itself.
+#
+USER_AGENT_ATTR = '_segment_user_agent'
+
+#
+# Checked in order, the first match wins.
+#
+DEVICE_PATTERNS = (
+    (BOT, re.compile(r'bot|crawl|spider|slurp|facebookexternalhit|'
+                     r'mediapartners|preview|monitor|curl|wget|python', re.I)),
+    (TABLET, re.compile(r'ipad|tablet|kindle|silk|playbook|'
+                        r'android(?!.*mobile)', re.I)),
+    (MOBILE, re.compile(r'mobi|iphone|ipod|android|blackberry|bb10|'
+                        r'opera mini|windows phone|iemobile', re.I)),
+)
+
+BROWSER_PATTERNS = (
+    ('Edge', re.compile(r'edge?/', re.I)),
+    ('Opera', re.compile(r'opr/|opera', re.I)),
+    ('Chrome', re.compile(r'chrome/|crios/', re.I)),
+    ('Firefox', re.compile(r'firefox/|fxios/', re.I)),
+    ('Safari', re.compile(r'safari/', re.I)),
+    ('Internet Explorer', re.compile(r'msie |trident/', re.I)),
+)
+
+OTHER = 'Other'
+
+#
+# These headers don't have the HTTP_ prefix in request.META.
+#
+UNPREFIXED_HEADERS = ('CONTENT_LENGTH', 'CONTENT_TYPE', )
+
+
+_user_agents = None
+_patterns = None
+
+
+def get_meta_key(header_name):
+    '''
+    Returns the request.META key for the given HTTP header name, E.g.,
+    'Accept-Language' -> 'HTTP_ACCEPT_LANGUAGE'.
+    '''
+
+    key = header_name.strip().upper().replace('-', '_')
+    if key in UNPREFIXED_HEADERS or key.startswith('HTTP_'):
+        return key
+    return 'HTTP_' + key
+
+
+def get_pattern(pattern):
+    '''
+    Returns the given regular expression, compiled. Each pattern is compiled
+    only once per process (while it is in use).
+    '''
+
+    global _patterns
+    if _patterns is None:
+        _patterns = LRUCache(
+            getattr(settings, 'SEGMENTATION_HEADER_PATTERN_CACHE_SIZE', 500))
+
+    compiled = _patterns.get(pattern)
+    if compiled is None:
+        compiled = re.compile(pattern)
+        _patterns.set(pattern, compiled)
+    return compiled
+
+
+def match_value(match_type, expected, value):
+    '''
+    Returns True if `value` equals (match_type 'exact'), starts with
+    ('prefix') or matches the regular expression ('regex') `expected`.
+    '''
+
+    if match_type == 'prefix':
+        return value.startswith(expected)
+    elif match_type == 'regex':
+        try:
+            return get_pattern(expected).search(value) is not None
+        except re.error:
+            return False
+    return value == expected
+
+
+def _parse_user_agent(user_agent):
+    device_class = DESKTOP
+    for name, pattern in DEVICE_PATTERNS:
+        if pattern.search(user_agent):
+            device_class = name
+            break
+
+    browser = OTHER
+    for name, pattern in BROWSER_PATTERNS:
+        if pattern.search(user_agent):
+            browser = name
+            break
+
+    return device_class, browser
+
+
+def parse_user_agent(user_agent):
+    '''
+    Returns a tuple of the device class (BOT, TABLET, MOBILE or DESKTOP) and
+    the browser family (E.g., 'Firefox' or OTHER) of the given User-Agent
+    string.
+
+    As a handful of user agents make up most traffic, the latest
+    SEGMENTATION_USER_AGENT_CACHE_SIZE (default: 1000) results are kept in an
+    LRU cache keyed by the raw string.
+    '''
+
+    global _user_agents
+    if _user_agents is None:
+        _user_agents = LRUCache(
+            getattr(settings, 'SEGMENTATION_USER_AGENT_CACHE_SIZE', 1000))
+
+    parsed = _user_agents.get(user_agent)
+    if parsed is None:
+        parsed = _parse_user_agent(user_agent)
+        _user_agents.set(user_agent, parsed)
+    return parsed
+
+
+def get_user_agent(request):
+    '''
+    Returns parse_user_agent() for the given request, at most once per
+    request.
+    '''
+
+    try:
+        return getattr(request, USER_AGENT_ATTR)
+    except AttributeError:
+        pass
+
+    parsed = parse_user_agent(request.META.get('HTTP_USER_AGENT', ''))
+    setattr(request, USER_AGENT_ATTR, parsed)
+    return parsed
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    '''
+    A small, thread-safe mapping that holds at most `max_size` entries,
+    evicting the least-recently-used ones first. It lives in the memory of
+    the current process.
+    '''
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                return default
+            # Mark as most-recently used.
+            self._entries[key] = value
+            return value
+
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
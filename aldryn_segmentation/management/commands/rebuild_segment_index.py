@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.management.base import NoArgsCommand
+
+from ...segment_pool import segment_pool
+from ...segment_pool.index import rebuild_index
+
+
+class Command(NoArgsCommand):
+    help = 'Rebuilds the SegmentPluginIndex from the CMS plugins.'
+
+    def handle_noargs(self, **options):
+        num = rebuild_index(segment_pool)
+        self.stdout.write('Indexed {0:d} segment plugin(s).'.format(num))
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from datetime import timedelta
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.utils import timezone
+
+from ...segment_pool import segment_pool
+from ...segment_pool.reconcile import reconcile_index
+
+
+class Command(NoArgsCommand):
+    help = ('Finds segment plugins that were created, changed or deleted '
+            'without sending signals (E.g., by bulk imports) and publishes '
+            'the changes to all workers\' segment pools.')
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--since',
+            dest='since',
+            type='int',
+            default=None,
+            help='Consider plugins changed in the last SINCE seconds. '
+                 'Defaults to the time of the previous run.'),
+    )
+
+    def handle_noargs(self, **options):
+        since = options.get('since')
+        if since is not None:
+            since = timezone.now() - timedelta(seconds=since)
+
+        num_changed, num_deleted = reconcile_index(segment_pool, since=since)
+        self.stdout.write('{0:d} changed and {1:d} deleted segment plugin(s) '
+                          'found.'.format(num_changed, num_deleted))
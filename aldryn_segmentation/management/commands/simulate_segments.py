@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+from optparse import make_option
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone, translation
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_text
+
+from cms.models import Placeholder
+from cms.utils.plugins import build_plugin_tree, downcast_plugins
+
+from ...segment_pool import segment_pool
+from ...simulation import (
+    CSV,
+    JSONL,
+    RequestBatch,
+    get_distribution,
+    get_numpy,
+    read_log,
+    simulate,
+)
+
+
+class Command(BaseCommand):
+    args = '<request log>'
+    help = ('Simulates which children of each Limit Block in the segment pool '
+            'the requests in a CSV or JSONL log of request contexts would '
+            'get, and prints the distribution per Limit Block. Conditions '
+            'are evaluated for all requests at once, with the same semantics '
+            'as the live segment plugins; overrides do not apply.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format',
+            dest='format',
+            choices=(CSV, JSONL, ),
+            default=None,
+            help='The format of the log. Defaults to its file extension.'),
+        make_option('--page',
+            dest='page',
+            type='int',
+            default=None,
+            help='Only simulate the Limit Blocks on the page with this id.'),
+        make_option('--language',
+            dest='language',
+            default=None,
+            help='The language of the plugins to simulate. Defaults to the '
+                 'current language.'),
+        make_option('--at',
+            dest='at',
+            default=None,
+            help='The date and time (ISO 8601) at which to decide '
+                 'schedules. Defaults to now.'),
+        make_option('--seed',
+            dest='seed',
+            type='int',
+            default=0,
+            help='Seed for the random buckets of new visitors.'),
+    )
+
+    def get_trees(self, page_id, language):
+        '''
+        Yields each placeholder holding Limit Blocks on the current site's
+        pages (or on no page at all) and its plugin trees.
+        '''
+        placeholder_ids = segment_pool.get_eligible_plugins(
+            segment_pool.get_current_site_id(),
+            plugin_types=['SegmentLimitPlugin'],
+        ).values_list('placeholder_id', flat=True).distinct()
+
+        placeholders = Placeholder.objects.filter(pk__in=list(placeholder_ids))
+        if page_id is not None:
+            placeholders = placeholders.filter(page=page_id)
+
+        for placeholder in placeholders.order_by('pk'):
+            plugins = downcast_plugins(placeholder.get_plugins(language))
+            yield placeholder, build_plugin_tree(plugins)
+
+    def get_label(self, instance):
+        plugin = instance.get_plugin_class_instance()
+        if hasattr(instance, 'configuration_string'):
+            return '{0}: {1}'.format(force_text(plugin.name),
+                                     force_text(instance.configuration_string))
+        return '{0} #{1:d}'.format(force_text(plugin.name), instance.pk)
+
+    def get_location(self, placeholder):
+        page = placeholder.page
+        if page is None:
+            return placeholder.slot
+        return '{0} / {1}'.format(force_text(page), placeholder.slot)
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Please give the path of the request log.')
+
+        try:
+            get_numpy()
+        except ImproperlyConfigured as e:
+            raise CommandError(force_text(e))
+
+        now = None
+        if options['at']:
+            now = parse_datetime(options['at'])
+            if now is None:
+                raise CommandError('Could not parse --at {0!r}.'.format(options['at']))
+            if timezone.is_naive(now):
+                now = timezone.make_aware(now, timezone.get_current_timezone())
+
+        language = options['language'] or translation.get_language()
+
+        start = time.time()
+        try:
+            batch = RequestBatch.from_rows(
+                read_log(args[0], options['format']),
+                now=now, seed=options['seed'])
+        except (IOError, ValueError) as e:
+            raise CommandError('Could not read the log: {0}'.format(e))
+        if not batch.size:
+            raise CommandError('The log has no requests.')
+        self.stdout.write('Read {0:d} request(s) in {1:.2f} s.'.format(
+            batch.size, time.time() - start))
+
+        start = time.time()
+        with translation.override(language):
+            for placeholder, roots in self.get_trees(options['page'], language):
+                for limiter, rendered, children in simulate(batch, roots):
+                    self.stdout.write('\nLimit Block #{0:d} {1}in {2}:'.format(
+                        limiter.pk,
+                        '“{0}” '.format(limiter.label) if limiter.label else '',
+                        self.get_location(placeholder)))
+                    for count, shown in get_distribution(limiter, rendered, children):
+                        if shown is None:
+                            label = '(not displayed)'
+                        else:
+                            label = ' + '.join(
+                                self.get_label(child) for child in shown
+                            ) or '(nothing)'
+                        self.stdout.write('  {0:7.2%} {1:10d}  {2}'.format(
+                            float(count) / batch.size, count, label))
+
+        self.stdout.write('\nSimulated in {0:.2f} s.'.format(time.time() - start))
+        if batch.unsupported:
+            self.stdout.write('These segment classes cannot be simulated and '
+                              'never matched: {0}.'.format(
+                                  ', '.join(sorted(batch.unsupported))))
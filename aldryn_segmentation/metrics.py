@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import bisect
+import threading
+
+from django.utils.encoding import force_text
+
+
+PREFIX = 'aldryn_segmentation_'
+
+#
+# The upper bounds, in seconds, of the latency histogram buckets. Each
+# histogram also has an implicit +Inf bucket.
+#
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0)
+
+#
+# Hits and misses of the decision and fragment caches, as counted under
+# CACHE_REQUESTS with these `cache` labels.
+#
+REQUEST_CACHE = 'request'
+VISITOR_CACHE = 'visitor'
+FRAGMENT_CACHE = 'fragment'
+
+CACHE_REQUESTS = 'cache_requests_total'
+DISCOVERY_SECONDS = 'pool_discovery_seconds'
+EVALUATION_SECONDS = 'evaluation_seconds'
+EVALUATIONS = 'evaluations_total'
+INVALIDATIONS = 'pool_invalidations_total'
+MATCHES = 'matches_total'
+OVERRIDES_APPLIED = 'overrides_applied_total'
+OVERRIDES_SET = 'overrides_set_total'
+SORTS = 'pool_sorts_total'
+
+HELP = {
+    CACHE_REQUESTS: 'Lookups in the segment decision and fragment caches.',
+    DISCOVERY_SECONDS: 'Time spent discovering a site partition of the segment pool.',
+    EVALUATION_SECONDS: 'Time spent evaluating segment conditions.',
+    EVALUATIONS: 'Segment conditions evaluated.',
+    INVALIDATIONS: 'Invalidations of the sorted copies of the segment pool.',
+    MATCHES: 'Segment conditions evaluated as appropriate.',
+    OVERRIDES_APPLIED: 'Segment decisions made by an operator override.',
+    OVERRIDES_SET: 'Segment overrides set by operators.',
+    SORTS: 'Sorted copies of the segment pool made.',
+}
+
+#
+# All of the metrics live in the memory of the current process, in the form:
+#
+#   counters:   { (/name/, /labels/): /value/ }
+#   histograms: { (/name/, /labels/): [ /count per bucket/..., /sum/ ] }
+#
+# where /labels/ is a tuple of (/label/, /value/) pairs. Updates only hold the
+# lock for a dict operation and the rendering only for a copy.
+#
+_counters = dict()
+_histograms = dict()
+_lock = threading.Lock()
+
+
+def increment(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, seconds, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    index = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        histogram[index] += 1
+        histogram[-1] += seconds
+
+
+def record_cache(cache, hit):
+    increment(CACHE_REQUESTS, cache=cache, result='hit' if hit else 'miss')
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def get_metrics():
+    '''
+    Returns copies of this process' counters and histograms (see above).
+    '''
+
+    with _lock:
+        return (
+            dict(_counters),
+            dict((key, list(value)) for key, value in _histograms.items()),
+        )
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return force_text(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{{{0}}}'.format(','.join(
+        '{0}="{1}"'.format(label, force_text(value).replace(
+            '\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for label, value in labels
+    ))
+
+
+def format_family(lines, name, metric_type, help_text, samples):
+    '''
+    Appends a metric family in the Prometheus text format to lines. samples
+    is a list of (/suffix/, /labels/, /value/).
+    '''
+
+    if not samples:
+        return
+    lines.append('# HELP {0}{1} {2}'.format(PREFIX, name, help_text))
+    lines.append('# TYPE {0}{1} {2}'.format(PREFIX, name, metric_type))
+    for suffix, labels, value in samples:
+        lines.append('{0}{1}{2}{3} {4}'.format(
+            PREFIX, name, suffix, format_labels(labels), format_value(value)))
+
+
+def get_pool_samples(pool):
+    '''
+    Returns the numbers of configurations and of plugin instances in the pool
+    per site and segment class. Configurations are not used as labels, as
+    they are entered by operators (E.g., cookie values) and unbounded.
+    '''
+
+    configurations, instances = [], []
+    for site_id, segments in sorted(pool._partitions.items(),
+                                    key=lambda item: force_text(item[0])):
+        for class_name, segment_class in sorted(segments.items()):
+            labels = (('site', site_id), ('segment_class', class_name), )
+            configs = segment_class[pool.CFGS]
+            configurations.append(('', labels, len(configs)))
+            instances.append(('', labels, sum(
+                len(config[pool.INSTANCES]) for config in configs.values())))
+    return configurations, instances
+
+
+def render_metrics():
+    '''
+    Returns all of this process' metrics in the Prometheus text format.
+    '''
+
+    # These can't be defined at the file level, else circular imports
+    from .cms_plugins.budgets import get_events
+    from .cms_plugins.decisions import get_costs
+    from .segment_pool import segment_pool
+
+    counters, histograms = get_metrics()
+    lines = []
+
+    configurations, instances = get_pool_samples(segment_pool)
+    format_family(lines, 'pool_configurations', 'gauge',
+                  'Distinct segment configurations in the pool.',
+                  configurations)
+    format_family(lines, 'pool_segments', 'gauge',
+                  'Segment plugin instances in the pool.',
+                  instances)
+
+    backend = segment_pool.override_backend
+    if hasattr(backend, '__len__'):
+        format_family(lines, 'overrides_stored', 'gauge',
+                      'Segment overrides held in the memory of this process.',
+                      [('', (), len(backend))])
+
+    format_family(lines, 'evaluation_cost_seconds', 'gauge',
+                  'Moving average of the time spent evaluating a segment condition.',
+                  [('', (('segment_class', plugin_type), ), cost)
+                   for plugin_type, cost in sorted(get_costs().items())])
+
+    format_family(lines, 'evaluation_failures_total', 'counter',
+                  'Segment conditions that ran over budget or raised.',
+                  [('', (('segment_class', plugin_type), ('reason', reason)), count)
+                   for (plugin_type, reason), count in sorted(get_events().items())])
+
+    for name in sorted(set(name for name, labels in counters)):
+        format_family(lines, name, 'counter', HELP.get(name, name), [
+            ('', labels, value)
+            for (counter, labels), value in sorted(counters.items())
+            if counter == name
+        ])
+
+    hits = dict()
+    for (name, labels), value in counters.items():
+        if name == CACHE_REQUESTS:
+            labels = dict(labels)
+            totals = hits.setdefault(labels['cache'], [0, 0])
+            totals[1] += value
+            if labels['result'] == 'hit':
+                totals[0] += value
+    format_family(lines, 'cache_hit_ratio', 'gauge',
+                  'Share of lookups in the segment decision and fragment caches that hit.',
+                  [('', (('cache', cache), ), float(hit) / total)
+                   for cache, (hit, total) in sorted(hits.items()) if total])
+
+    for name in sorted(set(name for name, labels in histograms)):
+        samples = []
+        for (histogram, labels), values in sorted(histograms.items()):
+            if histogram != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf', ), values):
+                cumulative += count
+                samples.append(('_bucket', labels + (('le', bound), ), cumulative))
+            samples.append(('_sum', labels, values[-1]))
+            samples.append(('_count', labels, cumulative))
+        format_family(lines, name, 'histogram', HELP.get(name, name), samples)
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import math
+import time
+
+from django.utils.cache import (
+    get_max_age,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, parse_http_date_safe
+
+from .buckets import (
+    NEW_VISITOR_ATTR,
+    format_bucket_vector,
+    get_bucket_vector,
+    get_cookie_age,
+    get_cookie_name,
+    get_requested_vector,
+    get_vector_cookie_name,
+    get_vector_header,
+    parse_bucket_vector,
+)
+from .cms_plugins import decision_cache
+from .cms_plugins.decisions import get_decisions_valid_until
+from .query import (
+    get_cookie_age as get_query_cookie_age,
+    get_cookie_prefix as get_query_cookie_prefix,
+    get_persisted_params,
+)
+from .schedule import get_now
+from .segment_pool import segment_pool
+
+
+class SegmentPoolSyncMiddleware(object):
+    '''
+    Applies the segment plugin changes made by other worker processes to this
+    worker's segment_pool at the start of every request. Without it, the pool
+    is only synchronised when the toolbar is displayed.
+    '''
+
+    def process_request(self, request):
+        segment_pool.sync(request)
+
+
+class SegmentCacheControlMiddleware(object):
+    '''
+    Caps the lifetime of cacheable responses at the instant that one of the
+    segment decisions made while rendering them next changes (E.g., the end
+    of a schedule segment's time window), so that cached variants expire
+    exactly at the boundary rather than with a short global TTL.
+    '''
+
+    def process_response(self, request, response):
+        valid_until = get_decisions_valid_until(request)
+        if valid_until is None:
+            return response
+
+        seconds = max(0, int(math.ceil(
+            (valid_until - get_now()).total_seconds())))
+        max_age = get_max_age(response)
+        if max_age is not None and max_age > seconds:
+            patch_cache_control(response, max_age=seconds)
+        if response.has_header('Expires'):
+            expires = time.time() + seconds
+            current = parse_http_date_safe(response['Expires'])
+            if current is None or expires < current:
+                response['Expires'] = http_date(expires)
+        return response
+
+
+class SegmentBucketMiddleware(object):
+    '''
+    Sends new visitors the cookie that the A/B Bucket segment identifies them
+    by, so that their buckets are sticky.
+
+    Responses that depend on buckets carry the visitor's bucket vector (E.g.,
+    'checkout=12') in the SEGMENTATION_BUCKET_VECTOR_HEADER header and vary
+    on it, so a cache that copies the vector cookie into that request header
+    keeps one variant per combination of buckets rather than one per visitor.
+    Responses rendered for a request that didn't claim the right buckets are
+    marked private, so they are never stored under the wrong variant.
+    '''
+
+    def process_response(self, request, response):
+        vector = get_bucket_vector(request)
+        if vector:
+            header = get_vector_header()
+            response[header] = format_bucket_vector(vector)
+            patch_vary_headers(response, (header, ))
+
+            requested = get_requested_vector(request)
+            if any(requested.get(experiment) != bucket
+                   for experiment, bucket in vector):
+                patch_cache_control(response, private=True)
+
+            known = parse_bucket_vector(
+                request.COOKIES.get(get_vector_cookie_name()))
+            merged = dict(known)
+            merged.update(vector)
+            if merged != known:
+                response.set_cookie(
+                    get_vector_cookie_name(),
+                    format_bucket_vector(merged),
+                    max_age=get_cookie_age(),
+                    httponly=True,
+                )
+
+        visitor_id = getattr(request, NEW_VISITOR_ATTR, None)
+        if visitor_id is not None:
+            response.set_cookie(
+                get_cookie_name(),
+                visitor_id,
+                max_age=get_cookie_age(),
+                httponly=True,
+            )
+        return response
+
+
+class SegmentQueryMiddleware(object):
+    '''
+    Persists the query string parameter values matched by Segment by Query
+    Parameter plugins with ``persist`` set into cookies, for later requests.
+    '''
+
+    def process_response(self, request, response):
+        prefix = get_query_cookie_prefix()
+        for name, value in get_persisted_params(request).items():
+            response.set_cookie(
+                prefix + name,
+                value,
+                max_age=get_query_cookie_age(),
+                httponly=True,
+            )
+        return response
+
+
+class SegmentDecisionCacheMiddleware(object):
+    '''
+    Sends the segment decisions cached during the request back to the visitor
+    in a signed cookie, when settings.SEGMENTATION_DECISION_CACHE is 'cookie'.
+    Not needed with the 'session' backend.
+    '''
+
+    def process_response(self, request, response):
+        decision_cache.update_response(request, response)
+        return response
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aldryn_segmentation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentOverrideRecord',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('user_id', models.PositiveIntegerField(verbose_name='user id')),
+                ('segment_class', models.CharField(max_length=128, verbose_name='segment class')),
+                ('segment_config', models.TextField(verbose_name='segment configuration')),
+                ('segment_config_hash', models.CharField(max_length=40, verbose_name='segment configuration hash')),
+                ('override', models.PositiveSmallIntegerField(default=0, verbose_name='override')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='segmentoverriderecord',
+            unique_together=set([('user_id', 'segment_class', 'segment_config_hash')]),
+        ),
+    ]
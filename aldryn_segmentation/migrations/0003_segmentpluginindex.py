@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0001_initial'),
+        ('cms', '0003_auto_20140926_2347'),
+        ('aldryn_segmentation', '0002_segmentoverriderecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentPluginIndex',
+            fields=[
+                ('plugin', models.OneToOneField(related_name='+', primary_key=True, serialize=False, to='cms.CMSPlugin')),
+                ('plugin_type', models.CharField(max_length=50, verbose_name='plugin class', db_index=True)),
+                ('config_key', models.TextField(verbose_name='configuration key')),
+                ('labels', models.TextField(default='{}', verbose_name='labels')),
+                ('placeholder', models.ForeignKey(related_name='+', blank=True, to='cms.Placeholder', null=True)),
+                ('site', models.ForeignKey(related_name='+', blank=True, to='sites.Site', null=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aldryn_segmentation', '0003_segmentpluginindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompositeSegmentPluginModel',
+            fields=[
+                ('cmsplugin_ptr', models.OneToOneField(parent_link=True, auto_created=True, primary_key=True, serialize=False, to='cms.CMSPlugin')),
+                ('label', models.CharField(default='', max_length=128, verbose_name='label', blank=True)),
+                ('operator', models.CharField(default='and', help_text="How to combine the child segments' conditions.", max_length=3, verbose_name='active when', choices=[('and', 'all conditions are met (AND)'), ('or', 'any condition is met (OR)'), ('not', 'no condition is met (NOT)')])),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=('cms.cmsplugin',),
+        ),
+    ]
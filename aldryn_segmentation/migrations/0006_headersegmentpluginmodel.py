@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aldryn_segmentation', '0005_countrysegmentpluginmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeaderSegmentPluginModel',
+            fields=[
+                ('cmsplugin_ptr', models.OneToOneField(parent_link=True, auto_created=True, primary_key=True, serialize=False, to='cms.CMSPlugin')),
+                ('label', models.CharField(default='', max_length=128, verbose_name='label', blank=True)),
+                ('header_name', models.CharField(default='', help_text='E.g., “Accept-Language” or “Referer”. Not used for device class or browser.', max_length=256, verbose_name='name of header', blank=True)),
+                ('match_type', models.CharField(default='exact', max_length=8, verbose_name='match', choices=[('exact', 'header equals value'), ('prefix', 'header starts with value'), ('regex', 'header matches regular expression'), ('device', 'device class (from User-Agent) is value'), ('browser', 'browser (from User-Agent) is value')])),
+                ('header_value', models.CharField(default='', help_text='For the device class, one of “bot”, “tablet”, “mobile” or “desktop”. For the browser, E.g., “Firefox”.', max_length=4096, verbose_name='value to compare')),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=('cms.cmsplugin',),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.core.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aldryn_segmentation', '0006_headersegmentpluginmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleSegmentPluginModel',
+            fields=[
+                ('cmsplugin_ptr', models.OneToOneField(parent_link=True, auto_created=True, primary_key=True, serialize=False, to='cms.CMSPlugin')),
+                ('label', models.CharField(default='', max_length=128, verbose_name='label', blank=True)),
+                ('active_from', models.DateTimeField(null=True, verbose_name='active from', blank=True)),
+                ('active_until', models.DateTimeField(null=True, verbose_name='active until', blank=True)),
+                ('weekdays', models.CharField(default='', validators=[django.core.validators.RegexValidator('^[0-6]*$')], max_length=7, blank=True, help_text='Days of the week on which to be active, from 0 (Monday) to 6 (Sunday), E.g., “01234” for Monday to Friday. Leave empty for every day.', verbose_name='weekdays')),
+                ('start_time', models.TimeField(null=True, verbose_name='daily start time', blank=True)),
+                ('end_time', models.TimeField(help_text='May be earlier than the start time for hours that span midnight.', null=True, verbose_name='daily end time', blank=True)),
+                ('timezone', models.CharField(default='', help_text="E.g., “Europe/Zurich”. Leave empty for the site's time zone.", max_length=64, verbose_name='time zone', blank=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=('cms.cmsplugin',),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.core.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aldryn_segmentation', '0007_schedulesegmentpluginmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BucketSegmentPluginModel',
+            fields=[
+                ('cmsplugin_ptr', models.OneToOneField(parent_link=True, auto_created=True, primary_key=True, serialize=False, to='cms.CMSPlugin')),
+                ('label', models.CharField(default='', max_length=128, verbose_name='label', blank=True)),
+                ('experiment', models.CharField(default='', help_text='Visitors are bucketed independently for each experiment.', max_length=64, verbose_name='experiment')),
+                ('identity', models.CharField(default='visitor', max_length=8, verbose_name='identify visitors by', choices=[('visitor', 'bucket cookie (set as necessary)'), ('session', 'session'), ('cookie', 'existing cookie')])),
+                ('cookie_name', models.CharField(default='', help_text='Only used to identify visitors by an existing cookie.', max_length=4096, verbose_name='name of cookie', blank=True)),
+                ('bucket_from', models.PositiveSmallIntegerField(default=0, verbose_name='from (%)', validators=[django.core.validators.MaxValueValidator(100)])),
+                ('bucket_to', models.PositiveSmallIntegerField(default=50, help_text='Exclusive.', verbose_name='to (%)', validators=[django.core.validators.MaxValueValidator(100)])),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=('cms.cmsplugin',),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0001_initial'),
+        ('aldryn_segmentation', '0008_bucketsegmentpluginmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupSegmentPluginModel',
+            fields=[
+                ('cmsplugin_ptr', models.OneToOneField(parent_link=True, auto_created=True, primary_key=True, serialize=False, to='cms.CMSPlugin')),
+                ('label', models.CharField(default='', max_length=128, verbose_name='label', blank=True)),
+                ('permission', models.CharField(default='', help_text='The visitor must have this permission, either directly or through a group, E.g., “cms.change_page”.', max_length=255, verbose_name='permission', blank=True)),
+                ('group', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, blank=True, to='auth.Group', help_text='The visitor must be a member of this group.', null=True, verbose_name='group')),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=('cms.cmsplugin',),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aldryn_segmentation', '0009_groupsegmentpluginmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuerySegmentPluginModel',
+            fields=[
+                ('cmsplugin_ptr', models.OneToOneField(parent_link=True, auto_created=True, primary_key=True, serialize=False, to='cms.CMSPlugin')),
+                ('label', models.CharField(default='', max_length=128, verbose_name='label', blank=True)),
+                ('param_name', models.CharField(default='', help_text='E.g., “utm_source” or “utm_campaign”.', max_length=256, verbose_name='name of parameter')),
+                ('match_type', models.CharField(default='exact', max_length=8, verbose_name='match', choices=[('exact', 'parameter equals value'), ('prefix', 'parameter starts with value'), ('regex', 'parameter matches regular expression')])),
+                ('param_value', models.CharField(default='', max_length=4096, verbose_name='value to compare')),
+                ('persist', models.BooleanField(default=False, help_text='Keep a matching value in a cookie, so that the segment still matches on later requests without the parameter.', verbose_name='remember?')),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=('cms.cmsplugin',),
+        ),
+    ]
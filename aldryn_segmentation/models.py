@@ -2,13 +2,22 @@
 
 from __future__ import unicode_literals
 
+import hashlib
+import re
+
+from django.contrib.auth.models import Group
+from django.contrib.sites.models import Site
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, RegexValidator
 from django.db import models
 from django.utils import six
 from django.utils.encoding import python_2_unicode_compatible, force_text
 from django.utils.functional import lazy
 from django.utils.translation import ugettext_lazy as _, string_concat
 
-from cms.models import CMSPlugin
+from cms.models import CMSPlugin, Placeholder
+
+from .countries import COUNTRY_CHOICES, COUNTRY_NAMES
 
 
 #
@@ -227,6 +236,544 @@ class AuthenticatedSegmentPluginModel(SegmentBasePluginModel):
         return _('is Authenticated')
 
 
+class CountrySegmentPluginModel(SegmentBasePluginModel):
+
+    country_code = models.CharField(_('country'),
+        blank=False,
+        choices=COUNTRY_CHOICES,
+        default='',
+        max_length=2,
+    )
+
+    @property
+    def configuration_string(self):
+
+        def wrapper():
+            return _('Country is {country}').format(
+                country=force_text(COUNTRY_NAMES.get(
+                    self.country_code, self.country_code)))
+
+        return lazy(
+            wrapper,
+            six.text_type
+        )()
+
+
+class HeaderSegmentPluginModel(SegmentBasePluginModel):
+
+    EXACT = 'exact'
+    PREFIX = 'prefix'
+    REGEX = 'regex'
+    DEVICE = 'device'
+    BROWSER = 'browser'
+
+    MATCH_CHOICES = (
+        (EXACT, _('header equals value')),
+        (PREFIX, _('header starts with value')),
+        (REGEX, _('header matches regular expression')),
+        (DEVICE, _('device class (from User-Agent) is value')),
+        (BROWSER, _('browser (from User-Agent) is value')),
+    )
+
+    header_name = models.CharField(_('name of header'),
+        blank=True,
+        default='',
+        help_text=_('E.g., “Accept-Language” or “Referer”. Not used for '
+                    'device class or browser.'),
+        max_length=256,
+    )
+
+    match_type = models.CharField(_('match'),
+        choices=MATCH_CHOICES,
+        default=EXACT,
+        max_length=8,
+    )
+
+    header_value = models.CharField(_('value to compare'),
+        blank=False,
+        default='',
+        help_text=_('For the device class, one of “bot”, “tablet”, “mobile” '
+                    'or “desktop”. For the browser, E.g., “Firefox”.'),
+        max_length=4096,
+    )
+
+    def clean(self):
+        from .headers import BOT, DESKTOP, MOBILE, TABLET
+
+        if self.match_type in (self.DEVICE, self.BROWSER, ):
+            if (self.match_type == self.DEVICE and self.header_value.lower()
+                    not in (BOT, TABLET, MOBILE, DESKTOP, )):
+                raise ValidationError(_('Unknown device class.'))
+        elif not self.header_name:
+            raise ValidationError(_('Please provide the name of the header.'))
+        elif self.match_type == self.REGEX:
+            try:
+                re.compile(self.header_value)
+            except re.error as e:
+                raise ValidationError(
+                    _('Invalid regular expression: {error}').format(error=e))
+
+    @property
+    def configuration_string(self):
+
+        def wrapper():
+            if self.match_type == self.DEVICE:
+                return _('Device is “{value}”').format(value=self.header_value)
+            elif self.match_type == self.BROWSER:
+                return _('Browser is “{value}”').format(value=self.header_value)
+            elif self.match_type == self.PREFIX:
+                return _('“{key}” starts with “{value}”').format(
+                    key=self.header_name, value=self.header_value)
+            elif self.match_type == self.REGEX:
+                return _('“{key}” matches “{value}”').format(
+                    key=self.header_name, value=self.header_value)
+            return _('“{key}” equals “{value}”').format(
+                key=self.header_name, value=self.header_value)
+
+        return lazy(
+            wrapper,
+            six.text_type
+        )()
+
+
+class QuerySegmentPluginModel(SegmentBasePluginModel):
+
+    MATCH_CHOICES = (
+        ('exact', _('parameter equals value')),
+        ('prefix', _('parameter starts with value')),
+        ('regex', _('parameter matches regular expression')),
+    )
+
+    param_name = models.CharField(_('name of parameter'),
+        blank=False,
+        default='',
+        help_text=_('E.g., “utm_source” or “utm_campaign”.'),
+        max_length=256,
+    )
+
+    match_type = models.CharField(_('match'),
+        choices=MATCH_CHOICES,
+        default='exact',
+        max_length=8,
+    )
+
+    param_value = models.CharField(_('value to compare'),
+        blank=False,
+        default='',
+        max_length=4096,
+    )
+
+    persist = models.BooleanField(_('remember?'),
+        default=False,
+        help_text=_('Keep a matching value in a cookie, so that the segment '
+                    'still matches on later requests without the parameter.'),
+    )
+
+    def clean(self):
+        if self.match_type == 'regex':
+            try:
+                re.compile(self.param_value)
+            except re.error as e:
+                raise ValidationError(
+                    _('Invalid regular expression: {error}').format(error=e))
+
+    @property
+    def configuration_string(self):
+
+        def wrapper():
+            if self.match_type == 'prefix':
+                return _('?{key} starts with “{value}”').format(
+                    key=self.param_name, value=self.param_value)
+            elif self.match_type == 'regex':
+                return _('?{key} matches “{value}”').format(
+                    key=self.param_name, value=self.param_value)
+            return _('?{key} equals “{value}”').format(
+                key=self.param_name, value=self.param_value)
+
+        return lazy(
+            wrapper,
+            six.text_type
+        )()
+
+
+class ScheduleSegmentPluginModel(SegmentBasePluginModel):
+
+    #
+    # All of the given criteria must be met: the date/time window, the
+    # weekdays and the hours (which may span midnight). Weekdays and hours are
+    # those in the given time zone.
+    #
+
+    WEEKDAY_NAMES = (
+        _('Mon'), _('Tue'), _('Wed'), _('Thu'), _('Fri'), _('Sat'), _('Sun'),
+    )
+
+    active_from = models.DateTimeField(_('active from'),
+        blank=True,
+        null=True,
+    )
+
+    active_until = models.DateTimeField(_('active until'),
+        blank=True,
+        null=True,
+    )
+
+    weekdays = models.CharField(_('weekdays'),
+        blank=True,
+        default='',
+        help_text=_('Days of the week on which to be active, from 0 (Monday) '
+                    'to 6 (Sunday), E.g., “01234” for Monday to Friday. '
+                    'Leave empty for every day.'),
+        max_length=7,
+        validators=[RegexValidator(r'^[0-6]*$')],
+    )
+
+    start_time = models.TimeField(_('daily start time'),
+        blank=True,
+        null=True,
+    )
+
+    end_time = models.TimeField(_('daily end time'),
+        blank=True,
+        help_text=_('May be earlier than the start time for hours that span '
+                    'midnight.'),
+        null=True,
+    )
+
+    timezone = models.CharField(_('time zone'),
+        blank=True,
+        default='',
+        help_text=_('E.g., “Europe/Zurich”. Leave empty for the site\'s time '
+                    'zone.'),
+        max_length=64,
+    )
+
+    def get_weekdays(self):
+        return set(int(day) for day in self.weekdays if day.isdigit())
+
+    @property
+    def configuration_string(self):
+
+        def wrapper():
+            parts = []
+            if self.active_from or self.active_until:
+                parts.append(_('{start} – {end}').format(
+                    start=self.active_from.strftime('%Y-%m-%d %H:%M') if self.active_from else '…',
+                    end=self.active_until.strftime('%Y-%m-%d %H:%M') if self.active_until else '…',
+                ))
+            if self.weekdays:
+                parts.append(', '.join(
+                    force_text(self.WEEKDAY_NAMES[day])
+                    for day in sorted(self.get_weekdays())
+                ))
+            if self.start_time or self.end_time:
+                parts.append(_('{start} – {end}').format(
+                    start=self.start_time.strftime('%H:%M') if self.start_time else '00:00',
+                    end=self.end_time.strftime('%H:%M') if self.end_time else '24:00',
+                ))
+            if not parts:
+                return _('Always')
+            if self.timezone:
+                parts.append('({0})'.format(self.timezone))
+            return ' '.join(force_text(part) for part in parts)
+
+        return lazy(
+            wrapper,
+            six.text_type
+        )()
+
+
+class BucketSegmentPluginModel(SegmentBasePluginModel):
+
+    #
+    # Visitors are put into one of 100 buckets per experiment (see
+    # aldryn_segmentation.buckets), so, an experiment with variants A and B is
+    # made of two segments, E.g., one for buckets 0-50 and one for 50-100.
+    #
+
+    IDENTITY_CHOICES = (
+        ('visitor', _('bucket cookie (set as necessary)')),
+        ('session', _('session')),
+        ('cookie', _('existing cookie')),
+    )
+
+    experiment = models.CharField(_('experiment'),
+        blank=False,
+        default='',
+        help_text=_('Visitors are bucketed independently for each experiment.'),
+        max_length=64,
+    )
+
+    identity = models.CharField(_('identify visitors by'),
+        choices=IDENTITY_CHOICES,
+        default='visitor',
+        max_length=8,
+    )
+
+    cookie_name = models.CharField(_('name of cookie'),
+        blank=True,
+        default='',
+        help_text=_('Only used to identify visitors by an existing cookie.'),
+        max_length=4096,
+    )
+
+    bucket_from = models.PositiveSmallIntegerField(_('from (%)'),
+        default=0,
+        validators=[MaxValueValidator(100)],
+    )
+
+    bucket_to = models.PositiveSmallIntegerField(_('to (%)'),
+        default=50,
+        help_text=_('Exclusive.'),
+        validators=[MaxValueValidator(100)],
+    )
+
+    def clean(self):
+        if self.bucket_from >= self.bucket_to:
+            raise ValidationError(_('“From” must be less than “to”.'))
+        if self.identity == 'cookie' and not self.cookie_name:
+            raise ValidationError(_('Please provide the name of the cookie.'))
+
+    @property
+    def configuration_string(self):
+
+        def wrapper():
+            return _('“{experiment}” bucket {start}–{end}%').format(
+                experiment=self.experiment,
+                start=self.bucket_from,
+                end=self.bucket_to,
+            )
+
+        return lazy(
+            wrapper,
+            six.text_type
+        )()
+
+
+class GroupSegmentPluginModel(SegmentBasePluginModel):
+
+    #
+    # If both a group and a permission are given, the visitor must be a
+    # member of the group AND have the permission.
+    #
+
+    group = models.ForeignKey(Group,
+        blank=True,
+        help_text=_('The visitor must be a member of this group.'),
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name=_('group'),
+    )
+
+    permission = models.CharField(_('permission'),
+        blank=True,
+        default='',
+        help_text=_('The visitor must have this permission, either directly '
+                    'or through a group, E.g., “cms.change_page”.'),
+        max_length=255,
+    )
+
+    def clean(self):
+        if not (self.group_id or self.permission):
+            raise ValidationError(
+                _('Please provide a group and/or a permission.'))
+        if self.permission and '.' not in self.permission:
+            raise ValidationError(_('Please provide the permission in the '
+                                    'form “app_label.codename”.'))
+
+    @property
+    def configuration_string(self):
+
+        def wrapper():
+            parts = []
+            if self.group_id:
+                parts.append(_('Member of “{group}”').format(
+                    group=self.group.name if self.group else self.group_id))
+            if self.permission:
+                parts.append(_('Has permission “{permission}”').format(
+                    permission=self.permission))
+            if not parts:
+                return _('No group or permission')
+            return force_text(_(' AND ')).join(force_text(part) for part in parts)
+
+        return lazy(
+            wrapper,
+            six.text_type
+        )()
+
+
+class CompositeSegmentPluginModel(SegmentBasePluginModel):
+
+    #
+    # The conditions of a composite segment are its child segment plugins
+    # (including other composite segments). All of its other children are the
+    # content to display when the combined condition is met.
+    #
+
+    AND = 'and'
+    OR = 'or'
+    NOT = 'not'
+
+    OPERATOR_CHOICES = (
+        (AND, _('all conditions are met (AND)')),
+        (OR, _('any condition is met (OR)')),
+        (NOT, _('no condition is met (NOT)')),
+    )
+
+    operator = models.CharField(_('active when'),
+        choices=OPERATOR_CHOICES,
+        default=AND,
+        help_text=_('How to combine the child segments\' conditions.'),
+        max_length=3,
+    )
+
+    # See get_conditions()
+    _conditions = None
+
+    def get_conditions(self):
+        '''
+        Returns the (downcasted) child segment plugins of this composite, in
+        order. They are taken from the plugin tree if it has been built (E.g.,
+        for rendering), else from the database, and only looked up once per
+        instance, as the configuration string is built from them often.
+        '''
+
+        # This can't be defined at the file level, else circular imports
+        from cms.utils.plugins import downcast_plugins
+
+        if self._conditions is None:
+            children = self.child_plugin_instances
+            if children is None:
+                children = downcast_plugins(
+                    CMSPlugin.objects.filter(parent=self.pk).order_by('position'))
+                children = sorted(children, key=lambda child: child.position)
+            self._conditions = [
+                child for child in children
+                if isinstance(child, SegmentBasePluginModel)
+            ]
+        return self._conditions
+
+    @property
+    def configuration_string(self):
+
+        def wrapper():
+            conditions = [
+                force_text(condition.configuration_string)
+                for condition in self.get_conditions()
+            ]
+            if not conditions:
+                return force_text(_('No conditions'))
+            if self.operator == self.NOT:
+                return force_text(_(' AND ')).join(
+                    force_text(_('NOT {condition}')).format(condition=condition)
+                    for condition in conditions
+                )
+            if self.operator == self.OR:
+                return force_text(_(' OR ')).join(conditions)
+            return force_text(_(' AND ')).join(conditions)
+
+        return lazy(
+            wrapper,
+            six.text_type
+        )()
+
+
+@python_2_unicode_compatible
+class SegmentOverrideRecord(models.Model):
+    '''
+    A durable, per-user segment override. This is only used when the
+    DatabaseOverrideBackend is configured (see
+    settings.SEGMENTATION_OVERRIDE_BACKEND), otherwise, overrides live only in
+    the memory of the current process.
+
+    Configuration keys can be up to several KB in length (see
+    CookieSegmentPluginModel), which is far too long for a portable unique
+    index, so, the index is built over a SHA1 digest of the key instead.
+    '''
+
+    class Meta:
+        unique_together = (
+            ('user_id', 'segment_class', 'segment_config_hash', ),
+        )
+
+    user_id = models.PositiveIntegerField(_('user id'))
+
+    segment_class = models.CharField(_('segment class'),
+        max_length=128,
+    )
+
+    segment_config = models.TextField(_('segment configuration'))
+
+    segment_config_hash = models.CharField(_('segment configuration hash'),
+        max_length=40,
+    )
+
+    override = models.PositiveSmallIntegerField(_('override'),
+        default=0,
+    )
+
+    @staticmethod
+    def hash_config(segment_config):
+        return hashlib.sha1(force_text(segment_config).encode('utf-8')).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.segment_config_hash = self.hash_config(self.segment_config)
+        super(SegmentOverrideRecord, self).save(*args, **kwargs)
+
+    def __str__(self):
+        return '{0}: {1} [{2}] = {3}'.format(
+            self.user_id, self.segment_class, self.segment_config, self.override)
+
+
+@python_2_unicode_compatible
+class SegmentPluginIndex(models.Model):
+    '''
+    A narrow, denormalized index of the segment plugins that belong in the
+    segment_pool, so that the pool can be (re-)built with a single query
+    rather than scanning CMSPlugin and each segment plugin's own table.
+
+    It is maintained by the signals in aldryn_segmentation.segment_pool and
+    can be rebuilt with the ``rebuild_segment_index`` management command. It
+    is only read when settings.SEGMENTATION_USE_INDEX is True.
+    '''
+
+    plugin = models.OneToOneField(CMSPlugin,
+        primary_key=True,
+        related_name='+',
+    )
+
+    plugin_type = models.CharField(_('plugin class'),
+        db_index=True,
+        max_length=50,
+    )
+
+    config_key = models.TextField(_('configuration key'))
+
+    #
+    # A JSON-encoded dict of the configuration_string realised in each of
+    # settings.LANGUAGES, used to label the segment in the toolbar.
+    #
+    labels = models.TextField(_('labels'),
+        default='{}',
+    )
+
+    site = models.ForeignKey(Site,
+        blank=True,
+        null=True,
+        related_name='+',
+    )
+
+    placeholder = models.ForeignKey(Placeholder,
+        blank=True,
+        null=True,
+        related_name='+',
+    )
+
+    def __str__(self):
+        return '{0} [{1}]'.format(self.plugin_type, self.config_key)
+
+
 @python_2_unicode_compatible
 class Segment(models.Model):
     '''
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+
+
+#
+# The parsed query string (and the values to persist) are remembered on the
+# request itself.
+#
+QUERY_PARAMS_ATTR = '_segment_query_params'
+PERSIST_ATTR = '_segment_query_persist'
+
+
+def get_cookie_prefix():
+    return getattr(settings, 'SEGMENTATION_QUERY_COOKIE_PREFIX', 'segment_q_')
+
+
+def get_cookie_age():
+    return getattr(settings, 'SEGMENTATION_QUERY_COOKIE_AGE', 30 * 24 * 60 * 60)
+
+
+def get_query_params(request):
+    '''
+    Returns a dict of each query string parameter of the given request to the
+    list of its values. Parameters that are missing from the query string but
+    were persisted to a cookie by an earlier request (see persist_param())
+    take their value from that cookie.
+
+    This is built once per request and shared by all query segments.
+    '''
+
+    try:
+        return getattr(request, QUERY_PARAMS_ATTR)
+    except AttributeError:
+        pass
+
+    params = dict(request.GET.lists())
+    prefix = get_cookie_prefix()
+    for name, value in request.COOKIES.items():
+        if name.startswith(prefix):
+            params.setdefault(name[len(prefix):], [value])
+
+    setattr(request, QUERY_PARAMS_ATTR, params)
+    return params
+
+
+def persist_param(request, name, value):
+    '''
+    Records that the given parameter value is to be persisted to a cookie by
+    SegmentQueryMiddleware. Values that came from the cookie in the first
+    place are not persisted again.
+    '''
+
+    if value in request.GET.getlist(name):
+        persist = getattr(request, PERSIST_ATTR, None)
+        if persist is None:
+            persist = dict()
+            setattr(request, PERSIST_ATTR, persist)
+        persist[name] = value
+
+
+def get_persisted_params(request):
+    return getattr(request, PERSIST_ATTR, None) or dict()
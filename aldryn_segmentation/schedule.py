@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from .lru import LRUCache
+
+
+#
+# How many days of recurring (weekday and hour) boundaries to consider when
+# looking for the next change of state. A week (plus a day for overnight
+# hours) covers every recurring schedule.
+#
+HORIZON_DAYS = 8
+
+_states = None
+
+
+def get_timezone(name):
+    '''
+    Returns the tzinfo for the given name, or the default time zone if no name
+    is given.
+    '''
+
+    if not name:
+        return timezone.get_default_timezone()
+
+    try:
+        import pytz
+    except ImportError:
+        raise ImproperlyConfigured(
+            'Schedule segments with a time zone require the “pytz” package.')
+
+    try:
+        return pytz.timezone(name)
+    except pytz.UnknownTimeZoneError:
+        raise ImproperlyConfigured('Unknown time zone: {0}'.format(name))
+
+
+def make_aware(value, tz):
+    '''
+    Returns the given naive datetime as an aware one in the given time zone.
+    '''
+
+    if timezone.is_aware(value):
+        return value
+    if hasattr(tz, 'localize'):
+        return tz.normalize(tz.localize(value))
+    return value.replace(tzinfo=tz)
+
+
+def get_now():
+    return make_aware(timezone.now(), timezone.get_default_timezone())
+
+
+def is_in_hours(value, start_time, end_time):
+    start_time = start_time or time.min
+    if end_time is None:
+        return value >= start_time
+    if start_time <= end_time:
+        return start_time <= value < end_time
+    # The hours span midnight
+    return value >= start_time or value < end_time
+
+
+def is_active_at(instance, moment, tz):
+    '''
+    Returns True if the given schedule segment instance is active at the given
+    (aware) moment.
+    '''
+
+    default_tz = timezone.get_default_timezone()
+    if instance.active_from and moment < make_aware(instance.active_from, default_tz):
+        return False
+    if instance.active_until and moment >= make_aware(instance.active_until, default_tz):
+        return False
+
+    local = moment.astimezone(tz)
+    weekdays = instance.get_weekdays()
+    if weekdays and local.weekday() not in weekdays:
+        return False
+    if instance.start_time or instance.end_time:
+        return is_in_hours(local.time(), instance.start_time, instance.end_time)
+    return True
+
+
+def get_boundaries(instance, now, tz):
+    '''
+    Returns a sorted list of every instant after `now` at which the given
+    schedule segment instance may change its state.
+    '''
+
+    default_tz = timezone.get_default_timezone()
+    boundaries = set()
+    first_day = now
+    for value in (instance.active_from, instance.active_until, ):
+        if value:
+            value = make_aware(value, default_tz)
+            boundaries.add(value)
+    if instance.active_from:
+        first_day = max(now, make_aware(instance.active_from, default_tz))
+
+    if instance.get_weekdays() or instance.start_time or instance.end_time:
+        times = set([time.min, ])
+        times.update(t for t in (instance.start_time, instance.end_time) if t)
+        first_date = first_day.astimezone(tz).date() - timedelta(days=1)
+        for days in range(HORIZON_DAYS + 1):
+            date = first_date + timedelta(days=days)
+            for value in times:
+                boundaries.add(make_aware(datetime.combine(date, value), tz))
+
+    return sorted(moment for moment in boundaries if moment > now)
+
+
+def compute_state(instance, now):
+    '''
+    Returns a tuple of whether the given schedule segment instance is active
+    at `now` and the instant its state next changes (or None, if it never
+    does).
+    '''
+
+    tz = get_timezone(instance.timezone)
+    active = is_active_at(instance, now, tz)
+
+    if instance.active_until and now >= make_aware(
+            instance.active_until, timezone.get_default_timezone()):
+        # Over, for good.
+        return active, None
+
+    for boundary in get_boundaries(instance, now, tz):
+        if is_active_at(instance, boundary, tz) != active:
+            return active, boundary
+    return active, None
+
+
+def get_state(instance, now=None):
+    '''
+    Returns compute_state() for the given instance, which is only recomputed
+    once its state has changed (or the instance was changed). In between,
+    this costs a single comparison.
+
+    The latest SEGMENTATION_SCHEDULE_CACHE_SIZE (default: 1000) states are
+    kept in the memory of the current process.
+    '''
+
+    global _states
+    if _states is None:
+        _states = LRUCache(
+            getattr(settings, 'SEGMENTATION_SCHEDULE_CACHE_SIZE', 1000))
+
+    now = now or get_now()
+    key = (instance.pk, instance.changed_date)
+    state = _states.get(key)
+    if state is not None:
+        active, valid_until = state
+        if valid_until is None or now < valid_until:
+            return state
+
+    state = compute_state(instance, now)
+    _states.set(key, state)
+    return state
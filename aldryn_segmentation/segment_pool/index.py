@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import six
+from django.utils.encoding import force_text
+from django.utils.functional import lazy
+from django.utils.translation import activate, get_language
+
+from cms.plugin_pool import plugin_pool
+
+from ..models import SegmentPluginIndex
+
+
+def get_labels(plugin_config):
+    '''
+    Returns a dict of the given configuration_string realised in each of
+    settings.LANGUAGES.
+    '''
+
+    lang = get_language()
+    labels = dict()
+    for code, name in settings.LANGUAGES:
+        activate(code)
+        labels[code] = force_text(plugin_config)
+    activate(lang)
+    return labels
+
+
+def get_label(labels, config_key):
+    '''
+    Returns a lazy object that realises as the label in the language active at
+    the time, falling back to the configuration key.
+    '''
+
+    def wrapper():
+        return labels.get(get_language()) or config_key
+
+    return lazy(wrapper, six.text_type)()
+
+
+def get_index_entry(plugin_instance, pool, placement):
+    '''
+    Returns an unsaved SegmentPluginIndex for the plugin instance at the given
+    placement (see SegmentPool.get_site_id_for_plugin()).
+    '''
+
+    eligible, site_id = placement
+    plugin_config = plugin_instance.configuration_string
+    return SegmentPluginIndex(
+        plugin_id=plugin_instance.pk,
+        plugin_type=plugin_instance.plugin_type,
+        config_key=pool.get_config_key(plugin_config),
+        labels=json.dumps(get_labels(plugin_config)),
+        site_id=site_id,
+        placeholder_id=plugin_instance.placeholder_id,
+    )
+
+
+def update_index(plugin_instance, pool, placement=None):
+    '''
+    Adds, updates or removes the index entry of the given plugin instance,
+    depending on whether it (still) belongs in the pool.
+    '''
+
+    if placement is None:
+        placement = pool.get_site_id_for_plugin(plugin_instance)
+
+    eligible, site_id = placement
+    if eligible:
+        get_index_entry(plugin_instance, pool, placement).save()
+    else:
+        remove_from_index(plugin_instance)
+
+
+def remove_from_index(plugin_instance):
+    SegmentPluginIndex.objects.filter(plugin=plugin_instance.pk).delete()
+
+
+def _build_entries(pool, placements, plugin_ids_by_type, batch_size):
+    '''
+    Returns unsaved index entries for the given plugins, loading their
+    instances with one query per plugin class and batch.
+    '''
+
+    entries = []
+    for plugin_type, plugin_ids in plugin_ids_by_type.items():
+        try:
+            model = plugin_pool.get_plugin(plugin_type).model
+        except KeyError:
+            continue
+        for start in range(0, len(plugin_ids), batch_size):
+            batch = plugin_ids[start:start + batch_size]
+            for plugin_instance in model.objects.filter(pk__in=batch):
+                entries.append(get_index_entry(
+                    plugin_instance, pool, placements[plugin_instance.pk]))
+    return entries
+
+
+def rebuild_index(pool, batch_size=500):
+    '''
+    Replaces the whole index with entries for every plugin that belongs in the
+    pool. Returns the number of entries.
+    '''
+
+    placements = dict()
+    plugin_ids_by_type = dict()
+    eligible_plugins = pool.get_eligible_plugins().values_list(
+        'pk', 'plugin_type', 'placeholder__page__site')
+    for plugin_id, plugin_type, site_id in eligible_plugins:
+        placements[plugin_id] = (True, site_id)
+        plugin_ids_by_type.setdefault(plugin_type, []).append(plugin_id)
+
+    entries = _build_entries(pool, placements, plugin_ids_by_type, batch_size)
+
+    SegmentPluginIndex.objects.all().delete()
+    SegmentPluginIndex.objects.bulk_create(entries, batch_size=batch_size)
+    return len(entries)
+
+
+def refresh_index(pool, plugin_ids, batch_size=500):
+    '''
+    Replaces the index entries of the given plugins in one batch, dropping
+    those that no longer belong in the pool.
+    '''
+
+    if not plugin_ids:
+        return
+
+    placements = dict()
+    plugin_ids_by_type = dict()
+    eligible_plugins = pool.get_eligible_plugins().filter(
+        pk__in=plugin_ids).values_list('pk', 'plugin_type', 'placeholder__page__site')
+    for plugin_id, plugin_type, site_id in eligible_plugins:
+        placements[plugin_id] = (True, site_id)
+        plugin_ids_by_type.setdefault(plugin_type, []).append(plugin_id)
+
+    entries = _build_entries(pool, placements, plugin_ids_by_type, batch_size)
+
+    SegmentPluginIndex.objects.filter(plugin__in=plugin_ids).delete()
+    SegmentPluginIndex.objects.bulk_create(entries, batch_size=batch_size)
+
+
+def get_index_rows(site_id=None, plugin_ids=None):
+    '''
+    Returns (plugin_id, plugin_type, config_key, labels, site_id) tuples for
+    the given
+    site's pages (plus those not on any page) or for the given plugin ids,
+    using a single query on the index.
+    '''
+
+    entries = SegmentPluginIndex.objects.all()
+    if site_id is not None:
+        entries = entries.filter(Q(site=site_id) | Q(site__isnull=True))
+    if plugin_ids is not None:
+        entries = entries.filter(plugin__in=plugin_ids)
+    for plugin_id, plugin_type, config_key, labels, site_id in entries.values_list(
+            'plugin', 'plugin_type', 'config_key', 'labels', 'site'):
+        yield plugin_id, plugin_type, config_key, json.loads(labels), site_id
+
+
+def get_page_segment_keys(page):
+    '''
+    Returns a set of the (plugin class, configuration key) tuples of the
+    segment plugins in the given page's placeholders.
+    '''
+
+    return set(SegmentPluginIndex.objects.filter(
+        placeholder__page=page
+    ).values_list('plugin_type', 'config_key'))
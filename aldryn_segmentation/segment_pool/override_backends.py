@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.utils.encoding import force_text
+
+
+DEFAULT_OVERRIDE_BACKEND = (
+    'aldryn_segmentation.segment_pool.override_backends.PoolOverrideBackend')
+
+
+def get_override_backend(pool):
+    '''
+    Returns an instance of the override backend configured in
+    settings.SEGMENTATION_OVERRIDE_BACKEND (a dotted path) for the given pool.
+    '''
+
+    path = getattr(settings, 'SEGMENTATION_OVERRIDE_BACKEND',
+                   DEFAULT_OVERRIDE_BACKEND)
+    module_path, _, class_name = path.rpartition('.')
+    try:
+        backend_class = getattr(import_module(module_path), class_name)
+    except (ImportError, AttributeError, ValueError):
+        raise ImproperlyConfigured('Could not import the segment override '
+            'backend {0!r}.'.format(path))
+    return backend_class(pool)
+
+
+class BaseOverrideBackend(object):
+    '''
+    Defines where the operators' segment overrides are stored. Overrides are
+    addressed by the user, the plugin's class name and the 'en' version of the
+    instance's configuration_string (the "configuration key").
+
+    Subclasses must implement get_overrides(), set_override() and
+    reset_overrides().
+    '''
+
+    def __init__(self, pool):
+        self.pool = pool
+
+
+    def get_overrides(self, user, request=None):
+        '''
+        Returns a dict of all of the user's overrides in the form:
+
+            { (/class/, /configuration key/): /SegmentOverride enum value/ }
+
+        Segments with no override may be omitted.
+        '''
+        raise NotImplementedError("Please Implement this method")
+
+
+    def get_override(self, user, segment_class, segment_config, request=None):
+        '''
+        Returns the user's override for the given segment, or
+        SegmentOverride.NoOverride if there is none.
+        '''
+
+        from .segment_pool import SegmentOverride
+
+        return self.get_overrides(user, request=request).get(
+            (segment_class, segment_config), SegmentOverride.NoOverride)
+
+
+    def set_override(self, user, segment_class, segment_config, override, request=None):
+        raise NotImplementedError("Please Implement this method")
+
+
+    def reset_overrides(self, user, request=None):
+        raise NotImplementedError("Please Implement this method")
+
+
+    def update_response(self, request, response):
+        '''
+        Called by the override views with their response, so that backends
+        which keep state client-side can write it out. Does nothing by default.
+        '''
+        pass
+
+
+class PoolOverrideBackend(BaseOverrideBackend):
+    '''
+    The default backend. Overrides are kept in the memory of the current
+    process, keyed by username, so they are lost whenever the process ends.
+
+    Overrides are stored independently of the pool's structure, so an
+    override survives its configuration briefly disappearing from the pool
+    (E.g., when a page is re-published). To keep the memory of long-running
+    workers flat, each entry is time-stamped and:
+
+        * expires SEGMENTATION_OVERRIDE_TTL seconds after it was set (never,
+          if None). Expired entries are evicted lazily when accessed and by a
+          sweep that runs at most every SEGMENTATION_OVERRIDE_SWEEP_INTERVAL
+          seconds;
+        * once there are more than SEGMENTATION_OVERRIDE_MAX_ENTRIES entries
+          in total, the least-recently-used ones are evicted.
+    '''
+
+    def __init__(self, pool):
+        super(PoolOverrideBackend, self).__init__(pool)
+        # (username, class, configuration key) -> (override, timestamp)
+        self._entries = OrderedDict()
+        # username -> set of (class, configuration key)
+        self._user_keys = dict()
+        self._lock = threading.RLock()
+        self._last_sweep = time.time()
+
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'SEGMENTATION_OVERRIDE_TTL', None)
+
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'SEGMENTATION_OVERRIDE_MAX_ENTRIES', 10000)
+
+
+    @property
+    def sweep_interval(self):
+        return getattr(settings, 'SEGMENTATION_OVERRIDE_SWEEP_INTERVAL', 300)
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def _is_expired(self, timestamp, now):
+        ttl = self.ttl
+        return ttl is not None and now - timestamp > ttl
+
+
+    def _remove(self, key):
+        username, segment_class, segment_config = key
+        del self._entries[key]
+        user_keys = self._user_keys.get(username)
+        if user_keys is not None:
+            user_keys.discard((segment_class, segment_config))
+            if not user_keys:
+                del self._user_keys[username]
+
+
+    def _lookup(self, key, now):
+        '''
+        Returns the live override for key, or None. Must be called with the
+        lock held.
+        '''
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        override, timestamp = entry
+        if self._is_expired(timestamp, now):
+            self._remove(key)
+            return None
+        # Mark as most-recently used.
+        del self._entries[key]
+        self._entries[key] = entry
+        return override
+
+
+    def _maybe_sweep(self, now):
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+
+
+    def sweep(self, now=None):
+        '''
+        Evicts all expired overrides.
+        '''
+
+        now = now or time.time()
+        with self._lock:
+            self._last_sweep = now
+            if self.ttl is None:
+                return
+            for key, (override, timestamp) in list(self._entries.items()):
+                if self._is_expired(timestamp, now):
+                    self._remove(key)
+
+
+    def get_overrides(self, user, request=None):
+        now = time.time()
+        overrides = dict()
+        with self._lock:
+            self._maybe_sweep(now)
+            for segment_class, segment_config in list(self._user_keys.get(user.username, ())):
+                override = self._lookup(
+                    (user.username, segment_class, segment_config), now)
+                if override:
+                    overrides[(segment_class, segment_config)] = override
+        return overrides
+
+
+    def get_override(self, user, segment_class, segment_config, request=None):
+        from .segment_pool import SegmentOverride
+
+        if not self._entries:
+            return SegmentOverride.NoOverride
+
+        now = time.time()
+        with self._lock:
+            self._maybe_sweep(now)
+            override = self._lookup(
+                (user.username, segment_class, segment_config), now)
+        return override or SegmentOverride.NoOverride
+
+
+    def set_override(self, user, segment_class, segment_config, override, request=None):
+        from .segment_pool import SegmentOverride
+
+        key = (user.username, segment_class, segment_config)
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if override != SegmentOverride.NoOverride:
+                self._entries[key] = (override, now)
+                self._user_keys.setdefault(user.username, set()).add(
+                    (segment_class, segment_config))
+                while len(self._entries) > self.max_entries:
+                    oldest_key = next(iter(self._entries))
+                    self._remove(oldest_key)
+            self._maybe_sweep(now)
+
+
+    def reset_overrides(self, user, request=None):
+        with self._lock:
+            for segment_class, segment_config in list(self._user_keys.get(user.username, ())):
+                self._remove((user.username, segment_class, segment_config))
+
+
+class DatabaseOverrideBackend(BaseOverrideBackend):
+    '''
+    Persists overrides in the SegmentOverrideRecord model so that they
+    survive deploys and worker recycling.
+
+    All of a user's overrides are fetched with a single query and then kept:
+
+        * on the user object, which lives exactly as long as the request, so
+          render-time lookups hit the database at most once per request; and
+        * in the Django cache, so that subsequent requests usually don't hit
+          the database at all. The cache entry is dropped on every write.
+    '''
+
+    CACHE_KEY = 'aldryn_segmentation:overrides:{user_id}'
+    USER_ATTR = '_segment_overrides'
+
+
+    def _get_cache_key(self, user):
+        return self.CACHE_KEY.format(user_id=user.pk)
+
+
+    def _invalidate(self, user):
+        if hasattr(user, self.USER_ATTR):
+            delattr(user, self.USER_ATTR)
+        cache.delete(self._get_cache_key(user))
+
+
+    def get_overrides(self, user, request=None):
+        from ..models import SegmentOverrideRecord
+
+        if not user.pk:
+            return dict()
+
+        overrides = getattr(user, self.USER_ATTR, None)
+        if overrides is not None:
+            return overrides
+
+        cache_key = self._get_cache_key(user)
+        overrides = cache.get(cache_key)
+        if overrides is None:
+            records = SegmentOverrideRecord.objects.filter(
+                user_id=user.pk).values_list(
+                    'segment_class', 'segment_config', 'override')
+            overrides = dict(
+                ((segment_class, segment_config), override)
+                for segment_class, segment_config, override in records
+                if override
+            )
+            cache.set(cache_key, overrides)
+
+        setattr(user, self.USER_ATTR, overrides)
+        return overrides
+
+
+    def set_override(self, user, segment_class, segment_config, override, request=None):
+        from ..models import SegmentOverrideRecord
+        from .segment_pool import SegmentOverride
+
+        records = SegmentOverrideRecord.objects.filter(
+            user_id=user.pk,
+            segment_class=segment_class,
+            segment_config_hash=SegmentOverrideRecord.hash_config(segment_config),
+        )
+
+        if override == SegmentOverride.NoOverride:
+            records.delete()
+        elif not records.update(override=override):
+            #
+            # Nothing to update, so insert. Should a concurrent request beat
+            # us to it, we fall back to updating its row.
+            #
+            try:
+                with transaction.atomic():
+                    SegmentOverrideRecord.objects.create(
+                        user_id=user.pk,
+                        segment_class=segment_class,
+                        segment_config=segment_config,
+                        override=override,
+                    )
+            except IntegrityError:
+                records.update(override=override)
+
+        self._invalidate(user)
+
+
+    def reset_overrides(self, user, request=None):
+        from ..models import SegmentOverrideRecord
+
+        SegmentOverrideRecord.objects.filter(user_id=user.pk).delete()
+        self._invalidate(user)
+
+
+class SignedCookieOverrideBackend(BaseOverrideBackend):
+    '''
+    Keeps each operator's overrides in a compact, signed cookie so that no
+    server-side state is required at all. This suits horizontally scaled
+    deployments without a shared cache: every worker sees the same overrides.
+
+    The cookie holds a small map of short digests of (class, configuration
+    key) to override values. It is decoded at most once per request, after
+    which every lookup is answered from memory. The signature is salted with
+    the user's pk so a cookie cannot be replayed for another operator.
+
+    Settings:
+        SEGMENTATION_OVERRIDE_COOKIE_NAME (default: 'segment_overrides')
+        SEGMENTATION_OVERRIDE_COOKIE_AGE (seconds, default: 30 days)
+    '''
+
+    REQUEST_ATTR = '_segment_override_cookie'
+    PENDING_ATTR = '_segment_override_cookie_pending'
+    SALT = 'aldryn_segmentation.overrides.{user_id}'
+    DIGEST_LENGTH = 10
+
+
+    @property
+    def cookie_name(self):
+        return getattr(settings, 'SEGMENTATION_OVERRIDE_COOKIE_NAME',
+                       'segment_overrides')
+
+
+    @property
+    def cookie_age(self):
+        return getattr(settings, 'SEGMENTATION_OVERRIDE_COOKIE_AGE',
+                       30 * 24 * 60 * 60)
+
+
+    @classmethod
+    def get_digest(cls, segment_class, segment_config):
+        key = '{0}\0{1}'.format(segment_class, force_text(segment_config))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:cls.DIGEST_LENGTH]
+
+
+    def _decode(self, user, request):
+        '''
+        Returns the {digest: override} map carried by the request, decoding
+        the cookie only the first time this is called for the request.
+        '''
+
+        if request is None or not user.pk:
+            return dict()
+
+        digests = getattr(request, self.REQUEST_ATTR, None)
+        if digests is None:
+            digests = dict()
+            value = request.COOKIES.get(self.cookie_name)
+            if value:
+                try:
+                    digests = signing.loads(value,
+                        salt=self.SALT.format(user_id=user.pk),
+                        max_age=self.cookie_age,
+                    )
+                except signing.BadSignature:
+                    pass
+            setattr(request, self.REQUEST_ATTR, digests)
+        return digests
+
+
+    def _store(self, user, request, digests):
+        if request is None:
+            raise ImproperlyConfigured('The SignedCookieOverrideBackend '
+                'requires the current request to change overrides.')
+        setattr(request, self.REQUEST_ATTR, digests)
+        if digests:
+            value = signing.dumps(digests,
+                salt=self.SALT.format(user_id=user.pk),
+                compress=True,
+            )
+        else:
+            value = None
+        setattr(request, self.PENDING_ATTR, value)
+
+
+    def get_overrides(self, user, request=None):
+        digests = self._decode(user, request)
+        overrides = dict()
+        if digests:
+            pool = self.pool
+            for segment_class_name, segment_class in pool.segments.items():
+                for config_key in segment_class[pool.CFGS]:
+                    override = digests.get(
+                        self.get_digest(segment_class_name, config_key))
+                    if override:
+                        overrides[(segment_class_name, config_key)] = override
+        return overrides
+
+
+    def get_override(self, user, segment_class, segment_config, request=None):
+        from .segment_pool import SegmentOverride
+
+        digests = self._decode(user, request)
+        if not digests:
+            return SegmentOverride.NoOverride
+        return digests.get(self.get_digest(segment_class, segment_config),
+                           SegmentOverride.NoOverride)
+
+
+    def set_override(self, user, segment_class, segment_config, override, request=None):
+        from .segment_pool import SegmentOverride
+
+        digests = dict(self._decode(user, request))
+        digest = self.get_digest(segment_class, segment_config)
+        if override == SegmentOverride.NoOverride:
+            digests.pop(digest, None)
+        else:
+            digests[digest] = override
+        self._store(user, request, digests)
+
+
+    def reset_overrides(self, user, request=None):
+        self._store(user, request, dict())
+
+
+    def update_response(self, request, response):
+        if not hasattr(request, self.PENDING_ATTR):
+            return
+        value = getattr(request, self.PENDING_ATTR)
+        if value:
+            response.set_cookie(self.cookie_name, value,
+                max_age=self.cookie_age,
+                path=settings.SESSION_COOKIE_PATH,
+                secure=settings.SESSION_COOKIE_SECURE or None,
+                httponly=True,
+            )
+        else:
+            response.delete_cookie(self.cookie_name,
+                                   path=settings.SESSION_COOKIE_PATH)
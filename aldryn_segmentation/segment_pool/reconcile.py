@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from ..models import SegmentPluginIndex
+from .index import refresh_index
+
+
+RECONCILED_KEY = 'aldryn_segmentation:pool:reconciled'
+
+
+def diff_plugins(pool, known, since, site_id=None):
+    '''
+    Compares the plugins that are believed to belong in the pool with the
+    database.
+
+    `known` is a dict of {plugin_id: plugin_type}. `since` is a high-water
+    mark: plugins whose CMSPlugin.changed_date is later are considered
+    changed. If it is None, only new and deleted plugins are found.
+
+    Returns a tuple of dicts ({plugin_id: plugin_type}) of the changed (or
+    new) plugins and of the deleted (or no longer eligible) plugins.
+    '''
+
+    eligible_plugins = pool.get_eligible_plugins(site_id)
+
+    current_ids = set(eligible_plugins.values_list('pk', flat=True))
+    deleted = dict(
+        (plugin_id, plugin_type) for plugin_id, plugin_type in known.items()
+        if plugin_id not in current_ids
+    )
+
+    if since is not None:
+        changed = dict(eligible_plugins.filter(
+            changed_date__gt=since).values_list('pk', 'plugin_type'))
+    else:
+        changed = dict()
+
+    missing = current_ids.difference(known, changed)
+    if missing:
+        changed.update(eligible_plugins.filter(
+            pk__in=missing).values_list('pk', 'plugin_type'))
+
+    return changed, deleted
+
+
+def reconcile_index(pool, since=None):
+    '''
+    Brings the SegmentPluginIndex (if settings.SEGMENTATION_USE_INDEX is set)
+    up-to-date with the changes made without sending signals, and publishes
+    them so that every worker's pool picks them up in its next sync(). If
+    `since` is None, the high-water mark left by the previous run is used.
+
+    Without the index, there is no record of the plugins to compare with, so
+    only the plugins changed since the high-water mark are found, not the
+    deleted ones. Those are found by each worker's own reconcile() instead.
+
+    Returns a tuple of the numbers of changed and deleted plugins.
+    '''
+
+    start = timezone.now()
+    if since is None:
+        since = cache.get(RECONCILED_KEY)
+
+    if pool.use_index:
+        known = dict(SegmentPluginIndex.objects.values_list('plugin', 'plugin_type'))
+        changed, deleted = diff_plugins(pool, known, since)
+        refresh_index(pool, list(changed) + list(deleted))
+    elif since is not None:
+        changed = dict(pool.get_eligible_plugins().filter(
+            changed_date__gt=since).values_list('pk', 'plugin_type'))
+        deleted = dict()
+    else:
+        changed, deleted = dict(), dict()
+
+    pool.publish_changes(
+        [(True, plugin_type, pk) for pk, plugin_type in deleted.items()] +
+        [(False, plugin_type, pk) for pk, plugin_type in changed.items()]
+    )
+
+    cache.set(RECONCILED_KEY, start - pool.RECONCILE_MARGIN, None)
+    return len(changed), len(deleted)
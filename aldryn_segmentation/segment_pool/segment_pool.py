@@ -2,13 +2,23 @@
 
 from __future__ import unicode_literals
 
+import logging
 import sys
+import threading
+import time
 import warnings
+from datetime import timedelta
 
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse
+from django.db import connections
+from django.db.models import Q
 from django.utils import six
 from django.utils.encoding import force_text, python_2_unicode_compatible
+from django.utils import timezone
 from django.utils.functional import Promise
 from django.utils.translation import activate, get_language, ugettext_lazy as _
 
@@ -18,7 +28,32 @@ from cms.plugin_pool import plugin_pool
 from cms.toolbar.items import SubMenu, Break, AjaxItem
 
 from ..cms_plugins import SegmentPluginBase
+from ..metrics import (
+    DISCOVERY_SECONDS,
+    INVALIDATIONS,
+    OVERRIDES_SET,
+    SORTS,
+    increment,
+    observe,
+)
 from ..models import SegmentBasePluginModel
+from .index import (
+    get_index_rows,
+    get_label,
+    get_page_segment_keys,
+)
+from .reconcile import diff_plugins
+from .override_backends import get_override_backend
+from .snapshot import (
+    dump_partition,
+    get_snapshot_location,
+    get_snapshot_rows,
+    load_snapshot,
+    save_snapshot,
+)
+
+
+logger = logging.getLogger(__name__)
 
 
 #
@@ -33,6 +68,13 @@ class SegmentOverride:
         (ForcedInactive, _('Forced inactive')),
     ]
 
+    # As reported in metrics
+    names = {
+        NoOverride: 'none',
+        ForcedActive: 'active',
+        ForcedInactive: 'inactive',
+    }
+
 
 @python_2_unicode_compatible
 class SegmentPool(object):
@@ -46,10 +88,6 @@ class SegmentPool(object):
             CFGS: {
                 /configuration_string/ : {
                     LABEL: _(/configuration_string/),
-                    OVERRIDES: {
-                        /user.id/: /SegmentOverride enum value/,
-                        ...
-                    },
                     INSTANCES: [ ... ]
                 }
             }
@@ -69,9 +107,27 @@ class SegmentPool(object):
     current language.
 
     This is implmented as a non-persistent, system-wide singleton, it is
-    shared by all operators of the system. In order to keep overrides for each
-    user distinct, they are stored in the OVERRIDES dict, keyed with the
-    user's username.
+    shared by all operators of the system. Each user's overrides are kept
+    distinct by the override backend (see override_backends and
+    settings.SEGMENTATION_OVERRIDE_BACKEND), which by default keeps them in
+    process memory, keyed with the user's username.
+
+    Each worker process has its own pool. To keep them consistent, every
+    change seen by one worker is published, with a version number, via the
+    Django cache. The other workers check the version at most once per request
+    (see sync() and SegmentPoolSyncMiddleware) and apply the changes they
+    missed.
+
+    Optionally (settings.SEGMENTATION_USE_INDEX), discovery, synchronisation
+    and page-scoped toolbar menus are all served from the narrow
+    SegmentPluginIndex table instead of CMSPlugin and the plugins' own tables.
+
+    The pool is partitioned by Site: there is one such structure per site,
+    holding the segment plugins on that site's pages (as found via their
+    placeholder's page) plus those in placeholders that are not attached to
+    any page. A site's partition is only discovered the first time it is
+    needed, E.g., by the first request for that site. The `segments`
+    attribute always refers to the current site's partition.
 
     Plugin instances are recorded in the INSTANCES list. As well as allowing
     us to find instances that have changed their configuration (likely to
@@ -86,52 +142,629 @@ class SegmentPool(object):
     CFGS = 'CFGS'
     NAME = 'NAME'
     LABEL = 'LABEL'
-    OVERRIDES = 'OVERRIDES'
     INSTANCES = 'INSTANCES'
 
+    #
+    # Cache keys (and request attribute) for synchronising workers.
+    #
+    VERSION_KEY = 'aldryn_segmentation:pool:version'
+    CHANGE_KEY = 'aldryn_segmentation:pool:change:{version}'
+    SYNCED_ATTR = '_segment_pool_synced'
+    # Beyond this many missed changes, rediscovering is cheaper.
+    MAX_SYNC_CHANGES = 1000
+    # Allows for transactions that commit after reconcile() has looked.
+    RECONCILE_MARGIN = timedelta(seconds=60)
+
 
     def __init__(self):
-        self.segments = dict()
+        # site_id -> segments structure (see above)
+        self._partitions = dict()
+        # site_id -> language -> sorted copy (see _get_sorted_copy())
         self._sorted_segments = dict()
+        self._override_backend = None
+        # The shared version this worker's pool is in sync with.
+        self._version = None
+        # site_id -> CMSPlugin.changed_date up to which the partition is known
+        # to be complete (see reconcile()).
+        self._high_water = dict()
+        self._last_reconcile = time.time()
+        # The background reconcile (see start_reconcile()) and its results.
+        self._reconcile_lock = threading.Lock()
+        self._reconcile_thread = None
+        self._reconciled = []
+
 
+    @property
+    def override_backend(self):
+        if self._override_backend is None:
+            self._override_backend = get_override_backend(self)
+        return self._override_backend
 
-    def discover(self):
+
+    @staticmethod
+    def get_current_site_id():
+        return Site.objects.get_current().pk
+
+
+    @staticmethod
+    def get_plugin_types():
         '''
-        Find and register any SegmentPlugins already configured in the CMS and
-        register them.
+        Returns the names of the plugin classes whose instances belong in the
+        pool.
+
+        In this case, 'eligible' means that the plugin class subclasses
+        SegmentPluginBase and that it has allow_overrides = True. Segment
+        plugins that have allow_overrides = False are not registered. This
+        should not hit the database at all (provided that the plugin_pool is
+        already populated.)
         '''
 
-        #
-        # To reduce the number of queries we'll be making against CMSPlugin,
-        # let's build a set of eligible plugin_types. This part should not hit
-        # the database at all (provided that the plugin_pool is already
-        # populated.)
-        #
-        # In this case, 'eligible' means that the plugin class subclasses
-        # SegmentPluginBase and that it has allow_overrides = True. Segment
-        # plugins that have allow_overrides = False are not registered.
-        #
         plugin_types = []
         for plugin_class in plugin_pool.get_all_plugins():
             if (issubclass(plugin_class, SegmentPluginBase) and
                     plugin_class.allow_overrides):
                 plugin_types.append(plugin_class.__name__)
+        return plugin_types
 
-        #
-        # Process the plugins that are one of these types.
-        #
-        for plugin_instance in CMSPlugin.objects.filter(plugin_type__in=plugin_types):
+
+    def get_eligible_plugins(self, site_id=None, plugin_types=None):
+        '''
+        Returns a queryset of the CMSPlugins that belong in the pool, limited
+        to the given site's pages, if any. Other plugin_types may be given to
+        find plugins in the same places, E.g., Limit Blocks.
+
+        Every published plugin exists twice, once on the draft and once on the
+        public version of its page (the same goes for static placeholders).
+        Only one side is considered: the draft side unless
+        settings.SEGMENTATION_DISCOVER_DRAFTS is False. Plugins on the
+        clipboard are never considered. All of this is done with joins on the
+        placeholders, not per plugin.
+        '''
+
+        drafts = getattr(settings, 'SEGMENTATION_DISCOVER_DRAFTS', True)
+
+        on_page = Q(placeholder__page__publisher_is_draft=drafts)
+        if site_id is not None:
+            on_page &= Q(placeholder__page__site=site_id)
+
+        if drafts:
+            static = Q(placeholder__static_public__isnull=True)
+        else:
+            static = Q(placeholder__static_draft__isnull=True)
+        off_page = (
+            Q(placeholder__page__isnull=True) &
+            static &
+            ~Q(placeholder__slot='clipboard')
+        )
+
+        return CMSPlugin.objects.filter(
+            on_page | off_page,
+            plugin_type__in=plugin_types or self.get_plugin_types(),
+        )
+
+
+    def get_site_id_for_plugin(self, plugin_instance):
+        '''
+        Returns a tuple (eligible, site_id) where eligible is True if the
+        plugin instance belongs in the pool at all (see get_eligible_plugins())
+        and site_id is the id of the site it belongs to (via its placeholder's
+        page), or None if the placeholder is not attached to a page (E.g.,
+        static placeholders).
+        '''
+
+        site_ids = list(self.get_eligible_plugins().filter(
+            pk=plugin_instance.pk
+        ).values_list('placeholder__page__site', flat=True)[:1])
+        if not site_ids:
+            return False, None
+        return True, site_ids[0]
+
+
+    def get_site_ids_for_plugins(self, plugin_ids):
+        '''
+        Batch version of get_site_id_for_plugin(). Returns a dict of
+        {plugin_id: site_id} containing only the eligible plugins.
+        '''
+
+        return dict(self.get_eligible_plugins().filter(
+            pk__in=plugin_ids
+        ).values_list('pk', 'placeholder__page__site'))
+
+
+    @property
+    def use_index(self):
+        return getattr(settings, 'SEGMENTATION_USE_INDEX', False)
+
+
+    @property
+    def segments(self):
+        '''
+        The segments structure of the current site's partition.
+        '''
+
+        return self.get_partition(self.get_current_site_id())
+
+
+    def get_partition(self, site_id):
+        '''
+        Returns the segments structure for the given site, restoring it from a
+        snapshot or else discovering its segment plugins the first time the
+        site is asked for.
+        '''
+
+        if site_id not in self._partitions:
+            if not self.restore_snapshot(site_id):
+                self.discover(site_id)
+        return self._partitions[site_id]
+
+
+    def restore_snapshot(self, site_id):
+        '''
+        Loads the given site's partition from the snapshot taken by the last
+        worker to discover it (see settings.SEGMENTATION_POOL_SNAPSHOT).
+        Returns False if there is no snapshot or it is not for the current
+        shared pool version.
+        '''
+
+        snapshot = load_snapshot(site_id)
+        if not snapshot:
+            return False
+
+        version = self.get_shared_version()
+        rows, high_water = get_snapshot_rows(snapshot, version)
+        if rows is None:
+            return False
+
+        if self._version is None:
+            self._version = version
+
+        self._partitions[site_id] = segments = dict()
+        self._high_water[site_id] = high_water
+        self._invalidate_sorted_segments()
+        self._register_indexed(rows, [segments])
+        return True
+
+
+    def discover(self, site_id=None):
+        '''
+        Find and register any SegmentPlugins already configured in the CMS and
+        register them. Only plugins on the given site's pages (the current
+        site if None) and plugins in placeholders that are not attached to any
+        page are considered.
+        '''
+
+        if site_id is None:
+            site_id = self.get_current_site_id()
+
+        start = time.time()
+        version = self.get_shared_version()
+        if self._version is None:
+            self._version = version
+
+        self._partitions[site_id] = segments = dict()
+        self._high_water[site_id] = timezone.now() - self.RECONCILE_MARGIN
+        self._invalidate_sorted_segments()
+
+        if self.use_index:
+            self._register_indexed(get_index_rows(site_id=site_id), [segments])
+        else:
+            for plugin_instance in self.get_eligible_plugins(site_id):
+                #
+                # Get the instance as an instance of its proper class rather
+                # than this CMSPlugin object.
+                #
+                plugin_instance = plugin_instance.get_plugin_instance()[0]
+                if plugin_instance is not None:
+                    self._register_in(segments, plugin_instance)
+
+        if get_snapshot_location():
+            save_snapshot(site_id, dump_partition(
+                self, segments, version, self._high_water[site_id]))
+
+        observe(DISCOVERY_SECONDS, time.time() - start)
+
+
+    def get_shared_version(self):
+        '''
+        Returns the pool version shared by all workers via the Django cache.
+        It is bumped by publish_change() whenever any worker sees a segment
+        plugin being saved or deleted.
+        '''
+
+        return cache.get(self.VERSION_KEY) or 0
+
+
+    def publish_change(self, plugin_instance, deleted=False):
+        '''
+        Records that the given segment plugin was saved (or deleted) so that
+        the other workers can apply the change in their next sync().
+
+        This must only be called once the change is committed, else the other
+        workers may look for it before they can see it (see the signal
+        receivers, which defer this with transaction.on_commit()).
+        '''
+
+        self.publish_changes(
+            [(deleted, plugin_instance.plugin_type, plugin_instance.pk)])
+
+
+    def publish_changes(self, changes):
+        '''
+        Batch version of publish_change(). Takes a list of (deleted,
+        plugin_type, plugin_id) tuples and assumes that the caller applies
+        them to this worker's pool itself.
+        '''
+
+        if not changes:
+            return
+
+        try:
+            version = cache.incr(self.VERSION_KEY, len(changes))
+        except ValueError:
+            # The key doesn't exist (yet, or any more)
+            cache.add(self.VERSION_KEY, 0, None)
+            version = cache.incr(self.VERSION_KEY, len(changes))
+
+        first = version - len(changes) + 1
+        cache.set_many(
+            dict(
+                (self.CHANGE_KEY.format(version=first + offset), change)
+                for offset, change in enumerate(changes)
+            ),
+            getattr(settings, 'SEGMENTATION_POOL_CHANGE_TIMEOUT', 3600),
+        )
+
+        if self._version is not None and first == self._version + 1:
+            #
+            # Nobody else changed anything in the meantime and the caller
+            # applies these changes to our own pool, so we're still in sync.
+            #
+            self._version = version
+
+
+    def sync(self, request=None):
+        '''
+        Brings this worker's pool up-to-date with the changes published by
+        other workers. When given a request, this does its work at most once
+        for that request, so it is cheap to call from several places. Usually,
+        this costs a single cache get.
+
+        Changes are applied incrementally. Only if the change log is not
+        available anymore (E.g., it expired or was evicted) are the loaded
+        partitions dropped, to be rediscovered on demand.
+
+        Every settings.SEGMENTATION_RECONCILE_INTERVAL seconds (if set), this
+        starts a reconcile in the background (see start_reconcile()). Its
+        results are applied by the next sync() after it has finished, so, the
+        request never waits for its queries.
+        '''
+
+        if request is not None:
+            if getattr(request, self.SYNCED_ATTR, False):
+                return
+            setattr(request, self.SYNCED_ATTR, True)
+
+        if self._version is None:
+            # Nothing has been discovered yet, so there's nothing to sync.
+            return
+
+        self._apply_reconciled()
+
+        interval = getattr(settings, 'SEGMENTATION_RECONCILE_INTERVAL', None)
+        if interval is not None and time.time() - self._last_reconcile >= interval:
+            self.start_reconcile()
+
+        version = self.get_shared_version()
+        if version == self._version:
+            return
+
+        if 0 < version - self._version <= self.MAX_SYNC_CHANGES:
+            keys = [
+                self.CHANGE_KEY.format(version=change)
+                for change in range(self._version + 1, version + 1)
+            ]
+            changes = cache.get_many(keys)
+        else:
+            keys, changes = [], {}
+
+        if not keys or len(changes) != len(keys):
+            self._partitions = dict()
+            self._high_water = dict()
+            self._invalidate_sorted_segments()
+        else:
+            self._apply_changes([changes[key] for key in keys])
+
+        self._version = version
+
+
+    def reconcile(self):
+        '''
+        Finds the changes to segment plugins that were made without sending
+        signals (E.g., by bulk_create(), raw SQL imports or some page copy
+        operations) and applies them to the loaded partitions.
+
+        For each partition, this asks the database only for the ids of the
+        eligible plugins, to find deleted and new ones, and for the plugins
+        whose changed_date is past the partition's high-water mark. The
+        differences are then applied as one batch of unregister and register
+        operations.
+
+        This is only ever applied to this worker's pool. Nothing is written to
+        the database, so the changed plugins are registered from their own
+        tables, bypassing the index. The reconcile_segments command brings the
+        index up-to-date.
+        '''
+
+        self._last_reconcile = time.time()
+        self._apply_reconciled(self._find_changes(self._get_known_plugins()))
+
+
+    def start_reconcile(self):
+        '''
+        Starts reconcile() in a background thread, unless one is running
+        already. Only what is known to be loaded is read here; the queries run
+        in the thread and the results are applied by the next sync().
+        '''
+
+        with self._reconcile_lock:
+            if (self._reconcile_thread is not None and
+                    self._reconcile_thread.is_alive()):
+                return
+            self._last_reconcile = time.time()
+            thread = threading.Thread(
+                target=self._reconcile_in_thread,
+                args=(self._get_known_plugins(), ),
+            )
+            thread.daemon = True
+            self._reconcile_thread = thread
+        thread.start()
+
+
+    def _get_known_plugins(self):
+        '''
+        Returns the plugins registered in each loaded partition, in the form:
+
+            { /site_id/: { /plugin_id/: /plugin_type/ } }
+        '''
+
+        return dict(
+            (site_id, dict(
+                (plugin_instance.pk, plugin_instance.plugin_type)
+                for segment_class in segments.values()
+                for config in segment_class[self.CFGS].values()
+                for plugin_instance in config[self.INSTANCES]
+            ))
+            for site_id, segments in list(self._partitions.items())
+        )
+
+
+    def _find_changes(self, known_plugins):
+        '''
+        Returns a list of (site_id, changes, high_water) for the given known
+        plugins of each partition (see _get_known_plugins()), where changes
+        are in the form of publish_changes().
+        '''
+
+        start = timezone.now()
+        results = []
+        for site_id, known in known_plugins.items():
+            changed, deleted = diff_plugins(
+                self, known, self._high_water.get(site_id), site_id=site_id)
+            changes = (
+                [(True, plugin_type, pk) for pk, plugin_type in deleted.items()] +
+                [(False, plugin_type, pk) for pk, plugin_type in changed.items()]
+            )
+            results.append((site_id, changes, start - self.RECONCILE_MARGIN))
+        return results
+
+
+    def _reconcile_in_thread(self, known_plugins):
+        '''
+        Runs the queries of a reconcile on a background thread. The thread
+        has its own database connections, which are closed here.
+        '''
+
+        try:
+            results = self._find_changes(known_plugins)
+        except Exception:
+            logger.exception('Failed to reconcile the segment pool.')
+            return
+        finally:
+            for connection in connections.all():
+                connection.close()
+
+        with self._reconcile_lock:
+            self._reconciled.extend(results)
+
+
+    def _apply_reconciled(self, results=None):
+        '''
+        Applies the given results of _find_changes(), or else those left by
+        the background reconcile. Partitions that were dropped since are
+        skipped, they'll be rediscovered complete.
+        '''
+
+        if results is None:
+            with self._reconcile_lock:
+                results, self._reconciled = self._reconciled, []
+
+        for site_id, changes, high_water in results:
+            if site_id not in self._partitions:
+                continue
+            if changes:
+                self._apply_changes(changes, use_index=False)
+            current = self._high_water.get(site_id)
+            if current is None or current < high_water:
+                self._high_water[site_id] = high_water
+
+
+    def _register_indexed(self, rows, partitions=None):
+        '''
+        Registers the plugins described by the given SegmentPluginIndex rows
+        (see index.get_index_rows()) into the given partitions, or else into
+        the loaded partitions their sites call for. No segment plugin
+        instances are loaded, the pool records lightweight stand-ins (with
+        only their pk) instead.
+        '''
+
+        for plugin_id, plugin_type, config_key, labels, site_id in rows:
+            try:
+                plugin_class = plugin_pool.get_plugin(plugin_type)
+            except KeyError:
+                continue
+            if not plugin_class.allow_overrides:
+                continue
+            plugin_instance = plugin_class.model(
+                pk=plugin_id, plugin_type=plugin_type)
+            label = get_label(labels, config_key)
+            if partitions is not None:
+                targets = partitions
+            elif site_id is None:
+                targets = list(self._partitions.values())
+            else:
+                targets = [self._partitions[site_id]] if site_id in self._partitions else []
+            for segments in targets:
+                self._register_in(segments, plugin_instance,
+                    plugin_config=label, plugin_config_key=config_key)
+
+
+    def _apply_changes(self, changes, use_index=None):
+        '''
+        Applies a list of published changes (see publish_change()) as one
+        batch of unregister and register operations. The changed plugins are
+        registered from the index if settings.SEGMENTATION_USE_INDEX is set,
+        unless use_index is False.
+        '''
+
+        if use_index is None:
+            use_index = self.use_index
+
+        # Only the latest change of each plugin matters.
+        latest = dict()
+        for deleted, plugin_type, plugin_id in changes:
+            latest[plugin_id] = (deleted, plugin_type)
+
+        to_register = dict()
+        for plugin_id, (deleted, plugin_type) in latest.items():
+            try:
+                model = plugin_pool.get_plugin(plugin_type).model
+            except KeyError:
+                continue
+            try:
+                self.unregister_segment_plugin(
+                    model(pk=plugin_id, plugin_type=plugin_type))
+            except (PluginNotRegistered, ImproperlyConfigured):
+                pass
             #
-            # Get the instance as an instance of its proper class rather than
-            # this CMSPlugin object.
+            # Saved plugins are registered again from the database below. If
+            # one is not found there (E.g., it was deleted since), it simply
+            # stays unregistered.
             #
-            plugin_instance = plugin_instance.get_plugin_instance()[0]
-            self.register_segment_plugin(plugin_instance, suppress_discovery=True)
+            if not deleted:
+                to_register.setdefault(model, []).append(plugin_id)
+
+        if use_index:
+            plugin_ids = [pk for pks in to_register.values() for pk in pks]
+            if plugin_ids:
+                self._register_indexed(get_index_rows(plugin_ids=plugin_ids))
+            return
+
+        for model, plugin_ids in to_register.items():
+            self.register_segment_plugins(
+                list(model.objects.filter(pk__in=plugin_ids)))
+
+
+    @staticmethod
+    def get_config_key(plugin_config):
+        '''
+        Returns the key under which a segment with the given configuration
+        (a plugin instance's configuration_string) is registered.
+
+        NOTE: We always use the 'en' version of the configuration string as
+        the key.
+        '''
+
+        lang = get_language()
+        activate('en')
+
+        if isinstance(plugin_config, Promise):
+            plugin_config_key = force_text(plugin_config)
+        elif isinstance(plugin_config, six.text_type):
+            plugin_config_key = plugin_config
+        else:
+            warnings.warn('register_segment: Not really sure what '
+                        '‘plugin_instance.configuration_string’ returned!')
+            plugin_config_key = force_text(plugin_config)
+
+        activate(lang)
+        return plugin_config_key
 
 
-    def register_segment_plugin(self, plugin_instance, suppress_discovery=False):
+    def _invalidate_sorted_segments(self):
         '''
-        Registers the provided plugin_instance into the SegmentPool.
+        Drops the sorted copies of the pool (see get_registered_segments())
+        after a change to the pool.
+        '''
+
+        if self._sorted_segments:
+            increment(INVALIDATIONS)
+        self._sorted_segments = dict()
+
+
+    def _register_in(self, segments, plugin_instance, plugin_config=None, plugin_config_key=None):
+        '''
+        Registers plugin_instance into the given segments structure. Returns
+        False if it was already registered there, else True.
+
+        The configuration (the LABEL) and its key are taken from the instance
+        unless given, E.g., when registering from the SegmentPluginIndex.
+        '''
+
+        plugin_class_instance = plugin_instance.get_plugin_class_instance()
+        plugin_class_name = plugin_class_instance.__class__.__name__
+        plugin_name = plugin_class_instance.name
+
+        if plugin_class_name not in segments:
+            segments[plugin_class_name] = {
+                self.NAME: plugin_name,
+                self.CFGS: dict(),
+            }
+            self._invalidate_sorted_segments()
+        segment_class = segments[plugin_class_name]
+
+        if plugin_config is None:
+            plugin_config = plugin_instance.configuration_string
+        if plugin_config_key is None:
+            plugin_config_key = self.get_config_key(plugin_config)
+
+        segment_configs = segment_class[self.CFGS]
+
+        if plugin_config_key not in segment_configs:
+            # We store the un-translated version as the LABEL
+            segment_configs[plugin_config_key] = {
+                self.LABEL : plugin_config,
+                self.INSTANCES : list(),
+            }
+            self._invalidate_sorted_segments()
+
+        segment = segment_configs[plugin_config_key]
+
+        if plugin_instance in segment[self.INSTANCES]:
+            return False
+
+        segment[self.INSTANCES].append( plugin_instance )
+        self._invalidate_sorted_segments()
+        return True
+
+
+    def register_segment_plugin(self, plugin_instance, suppress_discovery=False, placement=None):
+        '''
+        Registers the provided plugin_instance into the SegmentPool partition
+        of its site. Plugins that are not on any page are registered into all
+        partitions. Partitions that have not been loaded yet are left alone,
+        they'll find the plugin when they are discovered. Plugins that are not
+        eligible (see get_eligible_plugins()) are ignored.
+
         Raises:
             PluginAlreadyRegistered: if the plugin is already registered and
             ImproperlyConfigured: if not an appropriate type of plugin.
@@ -142,13 +775,12 @@ class SegmentPool(object):
             2. A gettext_lazy object,
             3. A extra-lazy object (Promise to return a gettext_lazy object)
 
-        the `suppress_discovery` flag, when set to true, prevents recursion
-        and should be only used by the self.discovery() method.
+        The `suppress_discovery` flag is no longer used, partitions are
+        discovered lazily on first use. Callers that already know the result
+        of get_site_id_for_plugin() may pass it as `placement` to save the
+        query (see register_segment_plugins()).
         '''
 
-        if not suppress_discovery and not self.segments:
-            self.discover()
-
         if isinstance(plugin_instance, SegmentBasePluginModel):
             plugin_class_instance = plugin_instance.get_plugin_class_instance()
 
@@ -157,54 +789,26 @@ class SegmentPool(object):
                 # There is no need to register a plugin that doesn't
                 # allow overrides.
                 #
-                plugin_class_name = plugin_class_instance.__class__.__name__
-                plugin_name = plugin_class_instance.name
-
-                if plugin_class_name not in self.segments:
-                    self.segments[plugin_class_name] = {
-                        self.NAME: plugin_name,
-                        self.CFGS: dict(),
-                    }
-                    self._sorted_segments = dict()
-                segment_class = self.segments[plugin_class_name]
-
-                plugin_config = plugin_instance.configuration_string
-
-                #
-                # NOTE: We always use the 'en' version of the configuration string
-                # as the key.
-                #
-                lang = get_language()
-                activate('en')
-
-                if isinstance(plugin_config, Promise):
-                    plugin_config_key = force_text(plugin_config)
-                elif isinstance(plugin_config, six.text_type):
-                    plugin_config_key = plugin_config
+                if placement is None:
+                    placement = self.get_site_id_for_plugin(plugin_instance)
+                eligible, site_id = placement
+                if not eligible:
+                    # E.g., the public copy of a page's plugin.
+                    partitions = []
+                elif site_id is None:
+                    partitions = list(self._partitions.values())
+                elif site_id in self._partitions:
+                    partitions = [self._partitions[site_id]]
                 else:
-                    warnings.warn('register_segment: Not really sure what '
-                                '‘plugin_instance.configuration_string’ returned!')
-
-                activate(lang)
-
-                segment_configs = segment_class[self.CFGS]
-
-                if plugin_config_key not in segment_configs:
-                    # We store the un-translated version as the LABEL
-                    segment_configs[plugin_config_key] = {
-                        self.LABEL : plugin_config,
-                        self.OVERRIDES : dict(),
-                        self.INSTANCES : list(),
-                    }
-                    self._sorted_segments = dict()
+                    partitions = []
 
-                segment = segment_configs[plugin_config_key]
+                registered = [
+                    self._register_in(segments, plugin_instance)
+                    for segments in partitions
+                ]
 
-                if plugin_instance not in segment[self.INSTANCES]:
-                    segment[self.INSTANCES].append( plugin_instance )
-                    self._sorted_segments = dict()
-                else:
-                    cls = plugin_instance.get_plugin_class_instance().__class__.__name__
+                if registered and not any(registered):
+                    cls = plugin_class_instance.__class__.__name__
                     raise PluginAlreadyRegistered('The segment plugin {0} cannot '
                         'be registered because it already is.'.format(cls))
 
@@ -214,6 +818,23 @@ class SegmentPool(object):
                 'subclass SegmentBasePluginModel. {0!r} does not.'.format(cls))
 
 
+    def register_segment_plugins(self, plugin_instances):
+        '''
+        Registers all of the given plugin instances, which must not be
+        registered already, using a single query to place them.
+        '''
+
+        site_ids = self.get_site_ids_for_plugins(
+            [plugin_instance.pk for plugin_instance in plugin_instances])
+        for plugin_instance in plugin_instances:
+            placement = (plugin_instance.pk in site_ids,
+                         site_ids.get(plugin_instance.pk))
+            try:
+                self.register_segment_plugin(plugin_instance, placement=placement)
+            except (PluginAlreadyRegistered, ImproperlyConfigured):
+                pass
+
+
     def unregister_segment_plugin(self, plugin_instance):
         '''
         Removes the given plugin from the SegmentPool.
@@ -222,12 +843,11 @@ class SegmentPool(object):
         #
         # NOTE: In many cases, the configuration of a given plugin may have
         # changed before we receive the call to unregister it. So, we'll look
-        # for the plugin in all CFGS for this plugin's class.
+        # for the plugin in all CFGS for this plugin's class. Likewise, the
+        # plugin may have moved to another site, so we look in all loaded
+        # partitions.
         #
 
-        if not self.segments:
-            self.discover()
-
         if not isinstance(plugin_instance, SegmentBasePluginModel):
             raise ImproperlyConfigured('Segment Plugins must subclasses of '
                 'SegmentBasePluginModel. {0} is not.'.format(
@@ -242,23 +862,24 @@ class SegmentPool(object):
                 #
                 plugin_class_name = plugin_class_instance.__class__.__name__
 
-                if plugin_class_name in self.segments:
-                    segment_class = self.segments[plugin_class_name]
-                    segment_configs = segment_class[self.CFGS]
-                    for configuration, data in segment_configs.items():
-                        if plugin_instance in data[self.INSTANCES]:
-                            # Found it! Now remove it...
-                            data[self.INSTANCES].remove(plugin_instance)
-                            self._sorted_segments = dict()
-
-                            # Clean-up any empty elements caused by this removal...
-                            if len(data[self.INSTANCES]) == 0:
-                                # OK, this was the last one, so...
-                                del segment_configs[configuration]
-
-                                if len(segment_configs) == 0:
-                                    # This too was the last one
-                                    del self.segments[plugin_class_name]
+                for segments in self._partitions.values():
+                    if plugin_class_name in segments:
+                        segment_class = segments[plugin_class_name]
+                        segment_configs = segment_class[self.CFGS]
+                        for configuration, data in list(segment_configs.items()):
+                            if plugin_instance in data[self.INSTANCES]:
+                                # Found it! Now remove it...
+                                data[self.INSTANCES].remove(plugin_instance)
+                                self._invalidate_sorted_segments()
+
+                                # Clean-up any empty elements caused by this removal...
+                                if len(data[self.INSTANCES]) == 0:
+                                    # OK, this was the last one, so...
+                                    del segment_configs[configuration]
+
+                                    if len(segment_configs) == 0:
+                                        # This too was the last one
+                                        del segments[plugin_class_name]
             return
 
         try:
@@ -270,58 +891,54 @@ class SegmentPool(object):
             raise PluginNotRegistered()
 
 
-    def set_override(self, user, segment_class, segment_config, override):
+    def set_override(self, user, segment_class, segment_config, override, request=None):
         '''
         (Re-)Set an override on a segment (segment_class x segment_config).
+
+        Some override backends keep their state client-side and need the
+        current `request` for this (see override_backends).
         '''
 
-        if not self.segments:
-            self.discover()
+        # Raises KeyError for segments that are not in the pool.
+        self.segments[segment_class][self.CFGS][segment_config]
 
-        overrides = self.segments[segment_class][self.CFGS][segment_config][self.OVERRIDES]
-        if override == SegmentOverride.NoOverride:
-            del overrides[user.username]
-        else:
-            overrides[user.username] = override
-        self._sorted_segments = dict()
+        # Overrides arrive from the toolbar as POSTed strings.
+        override = int(override)
+
+        self.override_backend.set_override(
+            user, segment_class, segment_config, override, request=request)
+        increment(OVERRIDES_SET, override=SegmentOverride.names.get(override, 'unknown'))
 
 
-    def reset_all_segment_overrides(self, user):
+    def reset_all_segment_overrides(self, user, request=None):
         '''
         Resets (disables) the overrides for all segments.
         '''
 
-        if not self.segments:
-            self.discover()
-
-        for segment_class in self.segments.values():
-            for configuration in segment_class[self.CFGS].values():
-                for username, override in configuration[self.OVERRIDES].items():
-                    if username == user.username:
-                        configuration[self.OVERRIDES][username] = SegmentOverride.NoOverride
-        self._sorted_segments = dict()
+        self.override_backend.reset_overrides(user, request=request)
 
 
-    def get_num_overrides_for_user(self, user):
+    def get_num_overrides_for_user(self, user, request=None):
         '''
         Returns a count of the number of overrides for all segments for the
         given user. This is used for the toolbar menu where we show the number
         of active overrides.
         '''
 
-        if not self.segments:
-            self.discover()
-
+        segments = self.segments
         num = 0
-        for segment_class_name, segment_class in self.segments.items():
-            for config_str, config in segment_class[self.CFGS].items():
-                for username, override in config[self.OVERRIDES].items():
-                    if username == user.username and int(override):
-                        num += 1
+        for (segment_class_name, config_str), override in self.override_backend.get_overrides(user, request=request).items():
+            #
+            # Persistent backends may still hold overrides for segments that
+            # have since disappeared from the pool. Don't count those.
+            #
+            if (int(override) and segment_class_name in segments and
+                    config_str in segments[segment_class_name][self.CFGS]):
+                num += 1
         return num
 
 
-    def get_override_for_classname(self, user, plugin_class_name, segment_config):
+    def get_override_for_classname(self, user, plugin_class_name, segment_config, request=None):
         '''
         Given the user, plugin_class_name and segment_config, return the
         current override, if any.
@@ -334,9 +951,6 @@ class SegmentPool(object):
         # 2. A lazy translation object (Promise)
         #
 
-        if not self.segments:
-            self.discover()
-
         lang = get_language()
         activate('en')
         if isinstance(segment_config, Promise):
@@ -348,11 +962,12 @@ class SegmentPool(object):
         activate(lang)
 
         try:
-            overrides = self.segments[plugin_class_name][self.CFGS][segment_key][self.OVERRIDES]
+            # Raises KeyError for segments that are not in the pool.
+            self.segments[plugin_class_name][self.CFGS][segment_key]
 
-            if user.username in overrides:
-                #  TODO: I don't like this int-casting used here or anywhere.
-                return int(overrides[user.username])
+            #  TODO: I don't like this int-casting used here or anywhere.
+            return int(self.override_backend.get_override(
+                user, plugin_class_name, segment_key, request=request))
 
         except KeyError:
             if not isinstance(segment_config, Promise):
@@ -370,7 +985,7 @@ class SegmentPool(object):
         return SegmentOverride.NoOverride
 
 
-    def get_override_for_segment(self, user, plugin_class_instance, plugin_instance):
+    def get_override_for_segment(self, user, plugin_class_instance, plugin_instance, request=None):
         '''
         Given a specific user, plugin class and instance, return the current
         override. This is a wrapper around get_override_for_classname() and
@@ -378,9 +993,6 @@ class SegmentPool(object):
         an external entry-point into the segment_pool.
         '''
 
-        if not self.segments:
-            self.discover()
-
         if (hasattr(plugin_class_instance, 'allow_overrides') and
                 plugin_class_instance.allow_overrides and
                 hasattr(plugin_instance, 'configuration_string')):
@@ -388,7 +1000,8 @@ class SegmentPool(object):
             segment_class = plugin_class_instance.__class__.__name__
             segment_config = plugin_instance.configuration_string
 
-            return self.get_override_for_classname(user, segment_class, segment_config)
+            return self.get_override_for_classname(
+                user, segment_class, segment_config, request=request)
 
         return SegmentOverride.NoOverride
 
@@ -415,10 +1028,6 @@ class SegmentPool(object):
                 CFGS: [
                     (/configuration_string/, {
                         LABEL: _(/configuration_string/),
-                        OVERRIDES: {
-                            /user.id/: /SegmentOverride enum value/,
-                            ...
-                        },
                         INSTANCES: [ ... ]
                     })
                 ]
@@ -468,11 +1077,8 @@ class SegmentPool(object):
             for cfg_key in pool[cls_key][self.CFGS]:
                 cfg_dict = {
                     self.LABEL: pool[cls_key][self.CFGS][cfg_key][self.LABEL],
-                    self.OVERRIDES: dict(),
                     self.INSTANCES: list(),
                 }
-                for username, override in pool[cls_key][self.CFGS][cfg_key][self.OVERRIDES].items():
-                    cfg_dict[self.OVERRIDES][username] = override
                 for instance in pool[cls_key][self.CFGS][cfg_key][self.INSTANCES]:
                     cfg_dict[self.INSTANCES].append(instance)
                 cls_dict[self.CFGS].append( (cfg_key, cfg_dict) )
@@ -491,30 +1097,39 @@ class SegmentPool(object):
         sorted for the current language.
         '''
 
-        if not self.segments:
-            self.discover()
+        site_id = self.get_current_site_id()
+        self.get_partition(site_id)
 
+        sorted_segments = self._sorted_segments.setdefault(site_id, dict())
         lang = get_language()
-        if not lang in self._sorted_segments:
-            self._sorted_segments[lang] = self._get_sorted_copy()
+        if not lang in sorted_segments:
+            sorted_segments[lang] = self._get_sorted_copy()
+            increment(SORTS)
 
-        return self._sorted_segments[lang]
+        return sorted_segments[lang]
 
 
-    def get_segments_toolbar_menu(self, user, toolbar, csrf_token):
+    def get_segments_toolbar_menu(self, user, toolbar, csrf_token, page=None):
         '''
-        Returns a CMSToolbar "Segments" menu from the pool.
+        Returns a CMSToolbar "Segments" menu from the pool. If a page is given,
+        the menu only offers the segments used on that page. This requires
+        the SegmentPluginIndex (settings.SEGMENTATION_USE_INDEX).
         '''
 
         #
-        # NOTE: This is usually when the discovery process starts.
+        # NOTE: This is usually when the discovery process of the current
+        # site's partition starts.
         #
-        if not self.segments:
-            self.discover()
 
         pool = self.get_registered_segments()
 
-        num_overrides = self.get_num_overrides_for_user(user)
+        if page is not None and self.use_index:
+            page_keys = get_page_segment_keys(page)
+        else:
+            page_keys = None
+
+        request = getattr(toolbar, 'request', None)
+        num_overrides = self.get_num_overrides_for_user(user, request=request)
 
         if num_overrides:
             segment_menu_name = _('Segments ({num:d})'.format(num=num_overrides))
@@ -529,17 +1144,27 @@ class SegmentPool(object):
         for segment_class_name, segment_class in pool:
             segment_name = segment_class[self.NAME]
 
+            configs = segment_class[self.CFGS]
+            if page_keys is not None:
+                configs = [
+                    (config_str, config) for config_str, config in configs
+                    if (segment_class_name, config_str) in page_keys
+                ]
+                if not configs:
+                    continue
+
             segment_class_menu = segment_menu.get_or_create_menu(
                 segment_class_name,
                 segment_name
             )
 
-            for config_str, config in segment_class[self.CFGS]:
+            for config_str, config in configs:
 
                 user_override = segment_pool.get_override_for_classname(
                     user,
                     segment_class_name,
-                    config_str
+                    config_str,
+                    request=request
                 )
 
                 config_menu = SubMenu(config[self.LABEL], csrf_token)
@@ -594,7 +1219,7 @@ class SegmentPool(object):
         much else.
         '''
 
-        return self.segments
+        return force_text(self._partitions)
 
 
 segment_pool = SegmentPool()
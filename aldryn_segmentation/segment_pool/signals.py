@@ -1,12 +1,37 @@
 # -*- coding: utf-8 -*-
 
-from django.db.models.signals import post_save, pre_delete
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.core.exceptions import ImproperlyConfigured
 
 from cms.exceptions import PluginAlreadyRegistered, PluginNotRegistered
+from .index import remove_from_index, update_index
 from .segment_pool import segment_pool
-from ..models import SegmentBasePluginModel
+from ..models import CompositeSegmentPluginModel, SegmentBasePluginModel
+
+
+def on_commit(func):
+    '''
+    Calls func once the current transaction is committed (or right away,
+    outside of a transaction), so that what it announces to the other
+    workers is visible to them by then. It is dropped if the transaction is
+    rolled back. Django < 1.9 can't defer it, so there it is called right
+    away.
+    '''
+
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(func)
+    else:
+        func()
+
+
+def publish_change(instance, deleted=False):
+    # The pk is taken now, as it is unset once the plugin has been deleted.
+    on_commit(partial(segment_pool.publish_changes,
+                      [(deleted, instance.plugin_type, instance.pk)]))
 
 
 @receiver(post_save)
@@ -17,6 +42,20 @@ def register_segment(sender, instance, created, **kwargs):
     '''
 
     if isinstance(instance, SegmentBasePluginModel):
+        placement = segment_pool.get_site_id_for_plugin(instance)
+        eligible, site_id = placement
+        #
+        # Plugins that don't belong in the pool (E.g., the public copies made
+        # when a page is published, or plugins on the clipboard) are neither
+        # indexed nor announced to the other workers. A plugin that was saved
+        # before may have belonged there, E.g., until it was cut to the
+        # clipboard, so, it is announced as gone.
+        #
+        if eligible or not created:
+            if segment_pool.use_index:
+                update_index(instance, segment_pool, placement)
+            publish_change(instance, deleted=not eligible)
+
         if not created:
             try:
                 segment_pool.unregister_segment_plugin(instance)
@@ -25,10 +64,12 @@ def register_segment(sender, instance, created, **kwargs):
 
         # Either way, we register it.
         try:
-            segment_pool.register_segment_plugin(instance)
+            segment_pool.register_segment_plugin(instance, placement=placement)
         except (PluginAlreadyRegistered, ImproperlyConfigured):
             pass
 
+        refresh_composite_parent(instance)
+
 
 @receiver(pre_delete)
 def unregister_segment(sender, instance, **kwargs):
@@ -38,7 +79,49 @@ def unregister_segment(sender, instance, **kwargs):
     '''
 
     if isinstance(instance, SegmentBasePluginModel):
+        eligible, site_id = segment_pool.get_site_id_for_plugin(instance)
+        if eligible:
+            if segment_pool.use_index:
+                remove_from_index(instance)
+            publish_change(instance, deleted=True)
+
         try:
             segment_pool.unregister_segment_plugin(instance)
         except (PluginNotRegistered, ImproperlyConfigured):
             pass
+
+
+@receiver(post_delete)
+def unregister_condition(sender, instance, **kwargs):
+    '''
+    Once a segment plugin is deleted, its parent composite segment (if any)
+    has one condition less.
+    '''
+
+    if isinstance(instance, SegmentBasePluginModel):
+        refresh_composite_parent(instance)
+
+
+def refresh_composite_parent(instance):
+    '''
+    The configuration of a composite segment is made up of its conditions, so,
+    when one of them changes, the composite is re-registered as if it had
+    been saved itself.
+    '''
+
+    if not instance.parent_id:
+        return
+
+    #
+    # When the parent is already at hand (E.g., the CMS assigned it when
+    # adding the plugin), there's no need to ask the database about it.
+    #
+    parent = getattr(instance, '_parent_cache', None)
+    if parent is not None and parent.plugin_type != 'CompositeSegmentPlugin':
+        return
+
+    # Only composites are found here, all other parents are not loaded.
+    parent_instance = CompositeSegmentPluginModel.objects.filter(
+        pk=instance.parent_id).first()
+    if parent_instance is not None:
+        register_segment(parent_instance.__class__, parent_instance, created=False)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+
+from .. import __version__
+from .index import get_labels
+
+
+#
+# Bump this whenever the structure below changes.
+#
+SNAPSHOT_FORMAT = 2
+
+CACHE_KEY = 'aldryn_segmentation:pool:snapshot:{site_id}'
+FILE_NAME = 'segment-pool-{site_id}.json'
+
+
+def get_snapshot_location():
+    '''
+    Returns settings.SEGMENTATION_POOL_SNAPSHOT, which is either None
+    (snapshots are disabled), 'cache' (use the Django cache) or the path of a
+    directory to keep snapshot files in.
+    '''
+
+    return getattr(settings, 'SEGMENTATION_POOL_SNAPSHOT', None)
+
+
+def get_languages():
+    return [code for code, name in settings.LANGUAGES]
+
+
+def dump_partition(pool, segments, version, high_water):
+    '''
+    Returns a JSON string of the given partition of the pool in the form:
+
+    {
+        'format': SNAPSHOT_FORMAT,
+        'app_version': /aldryn_segmentation.__version__/,
+        'languages': [ /language code/, ... ],
+        'version': /shared pool version/,
+        'high_water': /ISO 8601 high-water mark (see SegmentPool.reconcile())/,
+        'segments': [
+            [/class/, [
+                [/configuration key/, { /language code/: /label/, ... }, [
+                    [/plugin_type/, /plugin id/],
+                    ...
+                ]],
+                ...
+            ]],
+            ...
+        ]
+    }
+    '''
+
+    return json.dumps({
+        'format': SNAPSHOT_FORMAT,
+        'app_version': __version__,
+        'languages': get_languages(),
+        'version': version,
+        'high_water': high_water.isoformat(),
+        'segments': [
+            [segment_class_name, [
+                [config_key, get_labels(config[pool.LABEL]), [
+                    [plugin_instance.plugin_type, plugin_instance.pk]
+                    for plugin_instance in config[pool.INSTANCES]
+                ]]
+                for config_key, config in segment_class[pool.CFGS].items()
+            ]]
+            for segment_class_name, segment_class in segments.items()
+        ],
+    }, separators=(',', ':'))
+
+
+def get_snapshot_rows(snapshot, version):
+    '''
+    Returns a tuple of the partition in the given JSON snapshot as a list of
+    SegmentPluginIndex-style rows (see index.get_index_rows()) and its
+    high-water mark, or (None, None) if the snapshot is unreadable or stale.
+    It is stale if it was taken at another shared pool version, by another
+    version of this application or with other settings.LANGUAGES.
+    '''
+
+    try:
+        data = json.loads(snapshot)
+    except ValueError:
+        return None, None
+
+    if (data.get('format') != SNAPSHOT_FORMAT or
+            data.get('app_version') != __version__ or
+            data.get('languages') != get_languages() or
+            data.get('version') != version):
+        return None, None
+
+    rows = [
+        (plugin_id, plugin_type, config_key, labels, None)
+        for segment_class_name, configs in data['segments']
+        for config_key, labels, instances in configs
+        for plugin_type, plugin_id in instances
+    ]
+    return rows, parse_datetime(data['high_water'])
+
+
+def save_snapshot(site_id, snapshot):
+    location = get_snapshot_location()
+    if not location:
+        return
+
+    if location == 'cache':
+        cache.set(CACHE_KEY.format(site_id=site_id), snapshot, None)
+        return
+
+    #
+    # Write to a temporary file first so that other workers never read a
+    # partially written snapshot.
+    #
+    fd, temp_path = tempfile.mkstemp(dir=location)
+    with os.fdopen(fd, 'w') as temp_file:
+        temp_file.write(snapshot)
+    os.rename(temp_path, os.path.join(location, FILE_NAME.format(site_id=site_id)))
+
+
+def load_snapshot(site_id):
+    location = get_snapshot_location()
+    if not location:
+        return None
+
+    if location == 'cache':
+        return cache.get(CACHE_KEY.format(site_id=site_id))
+
+    try:
+        with open(os.path.join(location, FILE_NAME.format(site_id=site_id))) as snapshot_file:
+            return snapshot_file.read()
+    except (IOError, OSError):
+        return None
@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import csv
+import io
+import json
+from array import array
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import six
+from django.utils.encoding import force_text
+from django.utils.six.moves.urllib.parse import parse_qs
+
+from .buckets import (
+    COOKIE,
+    NUM_BUCKETS,
+    SESSION,
+    get_cookie_name as get_bucket_cookie_name,
+    hash_bucket,
+)
+from .headers import get_meta_key
+from .query import get_cookie_prefix as get_query_cookie_prefix
+
+
+#
+# The kinds of field in a request log, see read_log().
+#
+COOKIE_FIELD = 'cookie'
+HEADER_FIELD = 'header'
+QUERY_FIELD = 'query'
+IP_FIELD = 'ip'
+AUTHENTICATED_FIELD = 'authenticated'
+
+CSV = 'csv'
+JSONL = 'jsonl'
+
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 't', 'on', )
+
+
+def get_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImproperlyConfigured('Simulating segments requires the “numpy” '
+            'package. Install aldryn-segmentation[simulation].')
+    return numpy
+
+
+def parse_flag(value):
+    if isinstance(value, six.string_types):
+        return value.strip().lower() in TRUE_VALUES
+    return bool(value)
+
+
+def parse_query(value):
+    '''
+    Returns {/name/: /tuple of values/} for the given query string or (as
+    stored by read_log()) tuple of (/name/, /tuple of values/).
+    '''
+
+    if isinstance(value, tuple):
+        return dict(value)
+    return dict(
+        (name, tuple(values))
+        for name, values in parse_qs(value or '', keep_blank_values=True).items()
+    )
+
+
+def normalize_query(value):
+    '''
+    Returns the given query string as is, or the given dict of parameters
+    (whose values may be single values or lists) as a tuple of (/name/,
+    /tuple of values/), so that it can be factorized.
+    '''
+
+    if isinstance(value, dict):
+        return tuple(sorted(
+            (name, tuple(force_text(item) for item in values)
+                   if isinstance(values, (list, tuple)) else (force_text(values), ))
+            for name, values in value.items()
+        ))
+    return force_text(value)
+
+
+def iter_json_fields(row, meta_keys):
+    for name, value in (row.get('cookies') or dict()).items():
+        yield (COOKIE_FIELD, name), force_text(value)
+    for name, value in (row.get('headers') or dict()).items():
+        meta_key = meta_keys.get(name)
+        if meta_key is None:
+            meta_key = meta_keys[name] = get_meta_key(name)
+        yield (HEADER_FIELD, meta_key), force_text(value)
+    if row.get('query'):
+        yield (QUERY_FIELD, None), normalize_query(row['query'])
+    if row.get('ip'):
+        yield (IP_FIELD, None), force_text(row['ip'])
+    yield (AUTHENTICATED_FIELD, None), parse_flag(row.get('authenticated'))
+
+
+def iter_csv_fields(row, meta_keys):
+    for column, value in row.items():
+        if value is None or value == '':
+            continue
+        kind, _, name = column.partition(':')
+        if kind == COOKIE_FIELD and name:
+            yield (COOKIE_FIELD, name), value
+        elif kind == HEADER_FIELD and name:
+            meta_key = meta_keys.get(name)
+            if meta_key is None:
+                meta_key = meta_keys[name] = get_meta_key(name)
+            yield (HEADER_FIELD, meta_key), value
+        elif column == QUERY_FIELD:
+            yield (QUERY_FIELD, None), value
+        elif column == IP_FIELD:
+            yield (IP_FIELD, None), value
+        elif column == AUTHENTICATED_FIELD:
+            yield (AUTHENTICATED_FIELD, None), parse_flag(value)
+
+
+def iter_csv_rows(path):
+    if six.PY2:
+        with open(path, 'rb') as log:
+            for row in csv.DictReader(log):
+                yield dict(
+                    (column.decode('utf-8'), (value or b'').decode('utf-8'))
+                    for column, value in row.items() if column is not None
+                )
+    else:
+        with io.open(path, encoding='utf-8', newline='') as log:
+            for row in csv.DictReader(log):
+                yield row
+
+
+def iter_jsonl_rows(path):
+    with io.open(path, encoding='utf-8') as log:
+        for line in log:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_log(path, log_format=None):
+    '''
+    Yields the fields of each request in the given log, as dicts of
+    {(/kind/, /name/): /value/}, where the query is kept whole (see
+    parse_query()). The log is either:
+
+        * JSONL (one JSON object per line), with the keys `cookies` and
+          `headers` (objects of names to values), `query` (a query string,
+          or an object of names to values or lists of values), `ip` and
+          `authenticated`; or
+        * CSV, with the columns `cookie:NAME`, `header:NAME`, `query` (a
+          query string), `ip` and `authenticated`. Empty cells are missing.
+
+    The format is taken from the file's extension unless given.
+    '''
+
+    if log_format is None:
+        log_format = CSV if path.lower().endswith('.csv') else JSONL
+
+    if log_format == CSV:
+        rows, iter_fields = iter_csv_rows(path), iter_csv_fields
+    elif log_format == JSONL:
+        rows, iter_fields = iter_jsonl_rows(path), iter_json_fields
+    else:
+        raise ValueError('Unknown log format {0!r}.'.format(log_format))
+
+    # Header names repeat, so, their META keys are only computed once
+    meta_keys = dict()
+    for row in rows:
+        yield dict(iter_fields(row, meta_keys))
+
+
+class Column(object):
+    '''
+    A column of a RequestBatch, factorized: the distinct values, the first of
+    which is always None (missing), and the index of each row's value.
+    '''
+
+    def __init__(self, values, codes):
+        self.values = values
+        self.codes = codes
+
+
+    def map(self, func):
+        '''
+        Returns a boolean array of func(value) for each row, calling func once
+        per distinct value only.
+        '''
+
+        numpy = get_numpy()
+        mask = numpy.fromiter(
+            (bool(func(value)) for value in self.values),
+            dtype=bool, count=len(self.values))
+        return mask[self.codes]
+
+
+class ColumnBuilder(object):
+    '''
+    Factorizes a column as it is read: the rows that have a value and their
+    values' codes. Rows without a value get the code 0 (None) when built.
+    '''
+
+    def __init__(self):
+        self.index = {None: 0}
+        self.values = [None]
+        self.rows = array(str('l'))
+        self.codes = array(str('l'))
+
+
+    def add(self, row_num, value):
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        self.rows.append(row_num)
+        self.codes.append(code)
+
+
+    def build(self, num_rows):
+        numpy = get_numpy()
+        codes = numpy.zeros(num_rows, dtype=numpy.intp)
+        if self.rows:
+            codes[numpy.frombuffer(self.rows, dtype=self.rows.typecode)] = \
+                numpy.frombuffer(self.codes, dtype=self.codes.typecode)
+        return Column(self.values, codes)
+
+
+class RequestBatch(object):
+    '''
+    The contexts of many requests (E.g., read from a log, see read_log()),
+    held column by column, so that segment conditions can be evaluated for
+    all of them at once (see SegmentPluginBase.evaluate_batch()).
+
+    Conditions are decided as arrays of booleans, one per request. Each
+    segment is decided at most once per batch (see decide()).
+    '''
+
+    def __init__(self, size, columns, now=None, seed=0):
+        numpy = get_numpy()
+        self.size = size
+        self.columns = columns
+        # The instant at which time-based conditions are decided
+        self.now = now
+        self.random = numpy.random.RandomState(seed)
+        self.unsupported = set()
+        self._decisions = dict()
+
+
+    @classmethod
+    def from_rows(cls, rows, **kwargs):
+        '''
+        Returns a batch of the given rows, as yielded by read_log().
+        '''
+
+        builders = dict()
+        size = 0
+        for row in rows:
+            for key, value in row.items():
+                try:
+                    builder = builders[key]
+                except KeyError:
+                    builder = builders[key] = ColumnBuilder()
+                builder.add(size, value)
+            size += 1
+
+        columns = dict(
+            (key, builder.build(size)) for key, builder in builders.items())
+        return cls(size, columns, **kwargs)
+
+
+    def constant(self, value):
+        numpy = get_numpy()
+        return numpy.full(self.size, bool(value), dtype=bool)
+
+
+    def column(self, kind, name=None):
+        column = self.columns.get((kind, name))
+        if column is None:
+            numpy = get_numpy()
+            column = Column([None], numpy.zeros(self.size, dtype=numpy.intp))
+        return column
+
+
+    def cookie(self, name):
+        return self.column(COOKIE_FIELD, name)
+
+
+    def header(self, meta_key):
+        return self.column(HEADER_FIELD, meta_key)
+
+
+    def ip(self):
+        return self.column(IP_FIELD)
+
+
+    def authenticated(self):
+        return self.column(AUTHENTICATED_FIELD).map(bool)
+
+
+    def query(self, name):
+        '''
+        Returns the column of the given query parameter's values (as tuples),
+        falling back to the value persisted in a cookie (see
+        query.get_query_params()). Each distinct query string is parsed only
+        once.
+        '''
+
+        numpy = get_numpy()
+        query = self.column(QUERY_FIELD)
+        persisted = self.cookie(get_query_cookie_prefix() + name)
+
+        values = [None]
+        index = {None: 0}
+        remap = numpy.zeros(len(query.values) + len(persisted.values), dtype=numpy.intp)
+        candidates = [
+            parse_query(value).get(name) if value is not None else None
+            for value in query.values
+        ] + [
+            (value, ) if value is not None else None
+            for value in persisted.values
+        ]
+        for num, value in enumerate(candidates):
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(values)
+                values.append(value)
+            remap[num] = code
+
+        params = remap[query.codes]
+        return Column(values, numpy.where(
+            params > 0, params, remap[persisted.codes + len(query.values)]))
+
+
+    def bucket(self, experiment, identity, cookie_name=''):
+        '''
+        Returns an array of each request's bucket in the given experiment, or
+        -1 where there is nothing to identify the visitor by (see
+        buckets.get_bucket()). New visitors and sessions, which would be
+        given a random identifier, get a random bucket. The identifier kept
+        in a session is not in the log, so, the value of its cookie stands in
+        for it.
+        '''
+
+        numpy = get_numpy()
+        if identity == COOKIE:
+            column = self.cookie(cookie_name)
+        elif identity == SESSION:
+            column = self.cookie(settings.SESSION_COOKIE_NAME)
+        else:
+            column = self.cookie(get_bucket_cookie_name())
+
+        buckets = numpy.fromiter(
+            (hash_bucket(experiment, value) if value else -1
+             for value in column.values),
+            dtype=numpy.int16, count=len(column.values))[column.codes]
+
+        if identity != COOKIE:
+            new = buckets < 0
+            buckets[new] = self.random.randint(0, NUM_BUCKETS, int(new.sum()))
+        return buckets
+
+
+    def decide(self, instance):
+        '''
+        Returns the decisions of the given segment plugin instance for every
+        request in the batch. Operators' overrides do not apply. Segments
+        whose plugin class can't be evaluated in batches (evaluate_batch()
+        returns None) never match and are recorded in `unsupported`.
+        '''
+
+        try:
+            return self._decisions[instance.pk]
+        except KeyError:
+            pass
+
+        plugin = instance.get_plugin_class_instance()
+        decision = None
+        if hasattr(plugin, 'evaluate_batch'):
+            decision = plugin.evaluate_batch(self, instance)
+        if decision is None:
+            self.unsupported.add(instance.plugin_type)
+            decision = self.constant(False)
+
+        self._decisions[instance.pk] = decision
+        return decision
+
+
+def iter_limiter_children(batch, instance, rendered):
+    '''
+    Yields (child, shown) for each child of the given Limit Block, where
+    shown is an array of whether the child is displayed for each request in
+    the batch, given that the Limit Block is displayed where `rendered` is
+    True. This follows SegmentLimitPlugin.iter_context_appropriate_children().
+    '''
+
+    numpy = get_numpy()
+    render_all = (instance.max_children == 0)
+    slots_remaining = numpy.full(batch.size, instance.max_children, dtype=numpy.int32)
+
+    for child_instance in instance.child_plugin_instances or []:
+        child_plugin = child_instance.get_plugin_class_instance()
+        if child_plugin.model != child_instance.__class__:
+            # An orphan plugin
+            continue
+
+        if hasattr(child_plugin, 'is_context_appropriate'):
+            shown = rendered & batch.decide(child_instance)
+        else:
+            shown = rendered.copy()
+        if not render_all:
+            shown &= slots_remaining > 0
+            slots_remaining -= shown
+
+        yield child_instance, shown
+
+
+def simulate(batch, roots):
+    '''
+    Returns a list of (limiter, rendered, children) for each Limit Block in
+    the given plugin trees, where rendered is an array of whether the Limit
+    Block itself is displayed for each request (its ancestors may be
+    segments) and children is a list of (child, shown), see
+    iter_limiter_children().
+    '''
+
+    # This can't be defined at the file level, else circular imports
+    from .models import SegmentBasePluginModel, SegmentLimitPluginModel
+
+    limiters = []
+
+    def walk(instance, rendered):
+        if isinstance(instance, SegmentLimitPluginModel):
+            children = list(iter_limiter_children(batch, instance, rendered))
+            limiters.append((instance, rendered, children))
+            for child, shown in children:
+                walk(child, shown)
+            return
+
+        for child in instance.child_plugin_instances or []:
+            if isinstance(child, SegmentBasePluginModel):
+                # The conditions of a composite segment, which aren't
+                # displayed themselves.
+                continue
+            walk(child, rendered)
+
+    for root in roots:
+        walk(root, batch.constant(True))
+    return limiters
+
+
+def get_distribution(limiter, rendered, children):
+    '''
+    Returns a list of (/count/, /shown children/), most frequent first, of
+    the combinations of children displayed by the given Limit Block. Requests
+    for which the Limit Block isn't displayed at all are counted with None.
+    '''
+
+    numpy = get_numpy()
+    matrix = numpy.column_stack([rendered] + [shown for child, shown in children])
+    rows, counts = numpy.unique(matrix, axis=0, return_counts=True)
+
+    distribution = []
+    for row, count in zip(rows, counts):
+        if row[0]:
+            shown = [child for (child, _), flag in zip(children, row[1:]) if flag]
+        else:
+            shown = None
+        distribution.append((int(count), shown))
+    return sorted(distribution, key=lambda item: -item[0])
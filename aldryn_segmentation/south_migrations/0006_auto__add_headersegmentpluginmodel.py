@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'HeaderSegmentPluginModel'
+        db.create_table(u'aldryn_segmentation_headersegmentpluginmodel', (
+            (u'cmsplugin_ptr', self.gf('django.db.models.fields.related.OneToOneField')(to=orm['cms.CMSPlugin'], unique=True, primary_key=True)),
+            ('label', self.gf('django.db.models.fields.CharField')(default=u'', max_length=128, blank=True)),
+            ('header_name', self.gf('django.db.models.fields.CharField')(default=u'', max_length=256, blank=True)),
+            ('match_type', self.gf('django.db.models.fields.CharField')(default=u'exact', max_length=8)),
+            ('header_value', self.gf('django.db.models.fields.CharField')(default=u'', max_length=4096)),
+        ))
+        db.send_create_signal(u'aldryn_segmentation', ['HeaderSegmentPluginModel'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'HeaderSegmentPluginModel'
+        db.delete_table(u'aldryn_segmentation_headersegmentpluginmodel')
+
+
+    models = {
+        u'aldryn_segmentation.authenticatedsegmentpluginmodel': {
+            'Meta': {'object_name': 'AuthenticatedSegmentPluginModel'},
+            u'cmsplugin_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['cms.CMSPlugin']", 'unique': 'True', 'primary_key': 'True'}),
+            'label': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '128', 'blank': 'True'})
+        },
+        u'aldryn_segmentation.compositesegmentpluginmodel': {
+            'Meta': {'object_name': 'CompositeSegmentPluginModel', '_ormbases': ['cms.CMSPlugin']},
+            u'cmsplugin_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['cms.CMSPlugin']", 'unique': 'True', 'primary_key': 'True'}),
+            'label': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '128', 'blank': 'True'}),
+            'operator': ('django.db.models.fields.CharField', [], {'default': "u'and'", 'max_length': '3'})
+        },
+        u'aldryn_segmentation.cookiesegmentpluginmodel': {
+            'Meta': {'object_name': 'CookieSegmentPluginModel'},
+            u'cmsplugin_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['cms.CMSPlugin']", 'unique': 'True', 'primary_key': 'True'}),
+            'cookie_key': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '4096'}),
+            'cookie_value': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '4096'}),
+            'label': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '128', 'blank': 'True'})
+        },
+        u'aldryn_segmentation.countrysegmentpluginmodel': {
+            'Meta': {'object_name': 'CountrySegmentPluginModel', '_ormbases': ['cms.CMSPlugin']},
+            u'cmsplugin_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['cms.CMSPlugin']", 'unique': 'True', 'primary_key': 'True'}),
+            'country_code': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '2'}),
+            'label': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '128', 'blank': 'True'})
+        },
+        u'aldryn_segmentation.fallbacksegmentpluginmodel': {
+            'Meta': {'object_name': 'FallbackSegmentPluginModel'},
+            u'cmsplugin_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['cms.CMSPlugin']", 'unique': 'True', 'primary_key': 'True'}),
+            'label': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '128', 'blank': 'True'})
+        },
+        u'aldryn_segmentation.headersegmentpluginmodel': {
+            'Meta': {'object_name': 'HeaderSegmentPluginModel', '_ormbases': ['cms.CMSPlugin']},
+            u'cmsplugin_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['cms.CMSPlugin']", 'unique': 'True', 'primary_key': 'True'}),
+            'header_name': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '256', 'blank': 'True'}),
+            'header_value': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '4096'}),
+            'label': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '128', 'blank': 'True'}),
+            'match_type': ('django.db.models.fields.CharField', [], {'default': "u'exact'", 'max_length': '8'})
+        },
+        u'aldryn_segmentation.segment': {
+            'Meta': {'object_name': 'Segment', 'managed': 'False'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        u'aldryn_segmentation.segmentlimitpluginmodel': {
+            'Meta': {'object_name': 'SegmentLimitPluginModel', '_ormbases': ['cms.CMSPlugin']},
+            u'cmsplugin_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['cms.CMSPlugin']", 'unique': 'True', 'primary_key': 'True'}),
+            'label': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '128', 'blank': 'True'}),
+            'max_children': ('django.db.models.fields.PositiveIntegerField', [], {'default': '1'})
+        },
+        u'aldryn_segmentation.segmentoverriderecord': {
+            'Meta': {'unique_together': "((u'user_id', u'segment_class', u'segment_config_hash'),)", 'object_name': 'SegmentOverrideRecord'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'override': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'segment_class': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'segment_config': ('django.db.models.fields.TextField', [], {}),
+            'segment_config_hash': ('django.db.models.fields.CharField', [], {'max_length': '40'}),
+            'user_id': ('django.db.models.fields.PositiveIntegerField', [], {})
+        },
+        u'aldryn_segmentation.segmentpluginindex': {
+            'Meta': {'object_name': 'SegmentPluginIndex'},
+            'config_key': ('django.db.models.fields.TextField', [], {}),
+            'labels': ('django.db.models.fields.TextField', [], {'default': "u'{}'"}),
+            'placeholder': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'+'", 'null': 'True', 'to': "orm['cms.Placeholder']"}),
+            'plugin': ('django.db.models.fields.related.OneToOneField', [], {'related_name': "'+'", 'unique': 'True', 'primary_key': 'True', 'to': "orm['cms.CMSPlugin']"}),
+            'plugin_type': ('django.db.models.fields.CharField', [], {'max_length': '50', 'db_index': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'+'", 'null': 'True', 'to': u"orm['sites.Site']"})
+        },
+        u'aldryn_segmentation.switchsegmentpluginmodel': {
+            'Meta': {'object_name': 'SwitchSegmentPluginModel'},
+            u'cmsplugin_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['cms.CMSPlugin']", 'unique': 'True', 'primary_key': 'True'}),
+            'label': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '128', 'blank': 'True'}),
+            'on_off': ('django.db.models.fields.BooleanField', [], {'default': 'True'})
+        },
+        'cms.cmsplugin': {
+            'Meta': {'object_name': 'CMSPlugin'},
+            'changed_date': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'creation_date': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'language': ('django.db.models.fields.CharField', [], {'max_length': '15', 'db_index': 'True'}),
+            'level': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'lft': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['cms.CMSPlugin']", 'null': 'True', 'blank': 'True'}),
+            'placeholder': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['cms.Placeholder']", 'null': 'True'}),
+            'plugin_type': ('django.db.models.fields.CharField', [], {'max_length': '50', 'db_index': 'True'}),
+            'position': ('django.db.models.fields.PositiveSmallIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'rght': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'tree_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'})
+        },
+        'cms.placeholder': {
+            'Meta': {'object_name': 'Placeholder'},
+            'default_width': ('django.db.models.fields.PositiveSmallIntegerField', [], {'null': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'slot': ('django.db.models.fields.CharField', [], {'max_length': '50', 'db_index': 'True'})
+        },
+        u'sites.site': {
+            'Meta': {'ordering': "(u'domain',)", 'object_name': 'Site', 'db_table': "u'django_site'"},
+            'domain': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        }
+    }
+
+    complete_apps = ['aldryn_segmentation']
\ No newline at end of file
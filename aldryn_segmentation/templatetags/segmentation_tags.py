@@ -9,7 +9,8 @@ from classytags.arguments import Argument
 
 from cms.templatetags.cms_tags import RenderPlugin
 
-from ..segment_pool import SegmentOverride
+from ..cms_plugins.fragment_cache import render_cached
+from ..cms_plugins.segment_renderers import is_edit_mode
 
 
 register = template.Library()
@@ -22,46 +23,23 @@ class RenderSegmentPlugin(RenderPlugin):
         Argument('render_plugin')
     )
 
-    def is_renderable(self, context, plugin_instance):
-        '''
-        Determines whether this plugin is to be rendered in this context.
-        '''
-
-        # TODO: Seems to me this method is not necessary
-        # Once tests are established then maybe we can remove this.
-
-        child_plugin = plugin_instance.get_plugin_class_instance()
-
-        try:
-            allow_overrides = child_plugin.allow_overrides
-            get_override = child_plugin.get_segment_override
-        except AttributeError:
-            # This doesn't quack like a SegmentPlugin, so, it always renders.
-            return True
-
-        # This is a segment plugin... or at least quacks like one.
-        if allow_overrides:
-            # only evaluate override if we allow overrides
-            override = get_override(context, plugin_instance)
-
-            if override == SegmentOverride.ForcedActive:
-                return True
-            elif override == SegmentOverride.ForcedInactive:
-                return False
-
-        # OK, what does the plugin's is_context_appropriate() say?
-        return child_plugin.is_context_appropriate(context, plugin_instance)
-
     def render_tag(self, context, plugin, render_plugin):
-        response = super(RenderSegmentPlugin, self).render_tag(context, plugin)
-
-        if not (render_plugin and self.is_renderable(context, plugin)):
+        #
+        # NOTE: The limiter has already decided whether this plugin is
+        # renderable (see SegmentLimitPlugin.iter_context_appropriate_children)
+        # so there is no need to evaluate it all over again.
+        #
+        if not render_plugin:
             # OK, this is a Segmentation Plugin that is NOT appropriate for
-            # rendering in the current context. Unfortunately, we need to
-            # render the plugin, but throw away the results in order to allow
-            # the structureboard to display properly. Ugh!
+            # rendering in the current context. Unfortunately, in edit mode,
+            # we need to render the plugin, but throw away the results in
+            # order to allow the structureboard to display properly. Ugh!
+            if is_edit_mode(context.get('request')):
+                super(RenderSegmentPlugin, self).render_tag(context, plugin)
             return ''
-        return response
+
+        return render_cached(context, plugin, lambda: (
+            super(RenderSegmentPlugin, self).render_tag(context, plugin)))
 
 
 register.tag(RenderSegmentPlugin)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.contrib.sessions.backends.cache import SessionStore
+from django.http import HttpResponse
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+
+from ..buckets import (
+    COOKIE,
+    SESSION,
+    format_bucket_vector,
+    get_bucket,
+    get_bucket_vector,
+    hash_bucket,
+    make_cache_key,
+    parse_bucket_vector,
+)
+from ..middleware import SegmentBucketMiddleware
+
+
+class BucketTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+
+    def get_request(self, cookie=None, session=None):
+        if cookie is None:
+            request = self.factory.get('/')
+        else:
+            request = self.factory.get('/', HTTP_COOKIE=cookie)
+        if session is not None:
+            request.session = session
+        return request
+
+
+    def test_stable_across_workers(self):
+        # The bucket only depends on the experiment and the identifier, never
+        # on the process (E.g., its hash seed).
+        self.assertEqual(hash_bucket('hero', 'visitor-1'), 19)
+        self.assertEqual(hash_bucket('checkout', 'visitor-1'), 29)
+        self.assertEqual(hash_bucket('hero', 'visitor-2'), 69)
+
+        for _ in range(3):
+            request = self.get_request('segment_bucket=visitor-1')
+            self.assertEqual(get_bucket(request, 'hero'), 19)
+
+
+    def test_new_visitor(self):
+        request = self.get_request()
+        bucket = get_bucket(request, 'hero')
+        self.assertEqual(get_bucket(request, 'hero'), bucket)
+
+        response = SegmentBucketMiddleware().process_response(
+            request, HttpResponse())
+        visitor_id = response.cookies['segment_bucket'].value
+
+        # The visitor's next request lands in the same bucket.
+        request = self.get_request('segment_bucket=' + visitor_id)
+        self.assertEqual(get_bucket(request, 'hero'), bucket)
+
+
+    def test_stable_across_session(self):
+        session = SessionStore()
+        bucket = get_bucket(self.get_request(session=session), 'hero', SESSION)
+
+        # Logging in cycles the session key, but not the bucket.
+        session.cycle_key()
+        self.assertEqual(
+            get_bucket(self.get_request(session=session), 'hero', SESSION), bucket)
+
+        # Another session is identified independently.
+        other = SessionStore()
+        get_bucket(self.get_request(session=other), 'hero', SESSION)
+        self.assertNotEqual(other['_segment_bucket_id'], session['_segment_bucket_id'])
+
+
+    def test_own_cookie(self):
+        request = self.get_request('uid=visitor-1')
+        self.assertEqual(get_bucket(request, 'hero', COOKIE, 'uid'), 19)
+
+        request = self.get_request()
+        self.assertIsNone(get_bucket(request, 'hero', COOKIE, 'uid'))
+        self.assertEqual(get_bucket_vector(request), ())
+
+
+    def test_vector(self):
+        request = self.get_request('segment_bucket=visitor-1')
+        get_bucket(request, 'hero')
+        get_bucket(request, 'checkout')
+        get_bucket(request, 'hero')
+
+        vector = get_bucket_vector(request)
+        self.assertEqual(vector, (('checkout', 29), ('hero', 19)))
+        self.assertEqual(format_bucket_vector(vector), 'checkout=29,hero=19')
+        self.assertEqual(parse_bucket_vector('checkout=29,hero=19'),
+                         dict(vector))
+        self.assertEqual(parse_bucket_vector('checkout=x,=1,hero'), {})
+        self.assertEqual(make_cache_key(request, 'page'), 'page:checkout=29,hero=19')
+        self.assertEqual(make_cache_key(self.get_request(), 'page'), 'page')
+
+
+class BucketMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = SegmentBucketMiddleware()
+
+
+    def process(self, cookie='segment_bucket=visitor-1', **extra):
+        request = self.factory.get('/', HTTP_COOKIE=cookie, **extra)
+        get_bucket(request, 'hero')
+        return self.middleware.process_response(request, HttpResponse())
+
+
+    def test_not_bucketed(self):
+        request = self.factory.get('/')
+        response = self.middleware.process_response(request, HttpResponse())
+        self.assertFalse(response.has_header('X-Segment-Buckets'))
+        self.assertFalse(response.has_header('Vary'))
+
+
+    def test_unknown_variant(self):
+        response = self.process()
+        self.assertEqual(response['X-Segment-Buckets'], 'hero=19')
+        self.assertIn('X-Segment-Buckets', response['Vary'])
+        self.assertNotIn('Cookie', response['Vary'])
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(response.cookies['segment_buckets'].value, 'hero=19')
+
+
+    def test_known_variant(self):
+        response = self.process(
+            cookie='segment_bucket=visitor-1; segment_buckets="checkout=29,hero=19"',
+            HTTP_X_SEGMENT_BUCKETS='checkout=29,hero=19',
+        )
+        self.assertEqual(response['X-Segment-Buckets'], 'hero=19')
+        self.assertFalse(response.has_header('Cache-Control'))
+        self.assertNotIn('segment_buckets', response.cookies)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from ..cms_plugins import budgets
+from ..cms_plugins.budgets import (
+    ACTIVE,
+    ERROR,
+    EXHAUSTED,
+    FALLBACK,
+    OVER_BUDGET,
+    get_events,
+    get_failure,
+    run_condition,
+)
+
+
+class Instance(object):
+
+    plugin_type = 'TestSegmentPlugin'
+
+    def __init__(self, pk):
+        self.pk = pk
+
+
+class Condition(object):
+    '''
+    A segment plugin whose condition returns `decision` after `delay`
+    seconds, or waits for `release` if given.
+    '''
+
+    evaluation_budget = None
+    evaluation_fallback = None
+    run_in_thread = False
+
+    def __init__(self, decision=True, delay=0, release=None, **attrs):
+        self.decision = decision
+        self.delay = delay
+        self.release = release
+        self.calls = 0
+        for name, value in attrs.items():
+            setattr(self, name, value)
+
+
+    def _evaluate(self):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(5)
+        elif self.delay:
+            time.sleep(self.delay)
+        if isinstance(self.decision, Exception):
+            raise self.decision
+        return self.decision
+
+
+    def is_context_appropriate(self, context, instance):
+        return self._evaluate()
+
+
+    def get_decision_inputs(self, context, instance):
+        return None
+
+
+    def is_inputs_appropriate(self, inputs, instance):
+        return self._evaluate()
+
+
+@override_settings(SEGMENTATION_EVALUATION_BUDGET=None,
+                   SEGMENTATION_EVALUATION_FALLBACK='inactive',
+                   SEGMENTATION_EVALUATION_THREADS=1)
+class RunConditionTests(SimpleTestCase):
+
+    def setUp(self):
+        self.context = {'request': RequestFactory().get('/')}
+        self.release = threading.Event()
+        budgets._pool = None
+
+
+    def tearDown(self):
+        self.release.set()
+        if budgets._pool is not None:
+            budgets._pool.close()
+            budgets._pool.join()
+            budgets._pool = None
+
+
+    def get_count(self, reason):
+        return get_events().get(('TestSegmentPlugin', reason), 0)
+
+
+    def test_decision(self):
+        self.assertTrue(run_condition(self.context, Condition(True), Instance(1)))
+        self.assertFalse(run_condition(self.context, Condition(False), Instance(2)))
+        self.assertIsNone(get_failure(self.context['request'], Instance(1)))
+
+
+    def test_error(self):
+        errors = self.get_count(ERROR)
+        condition = Condition(ValueError('Oops'))
+        self.assertFalse(run_condition(self.context, condition, Instance(1)))
+
+        condition = Condition(ValueError('Oops'), evaluation_fallback=ACTIVE)
+        self.assertTrue(run_condition(self.context, condition, Instance(2)))
+
+        self.assertEqual(self.get_count(ERROR), errors + 2)
+        self.assertEqual(get_failure(self.context['request'], Instance(2)), ACTIVE)
+
+
+    @override_settings(SEGMENTATION_EVALUATION_BUDGET=0.05)
+    def test_exhausted(self):
+        exhausted = self.get_count(EXHAUSTED)
+        slow = Condition(True, delay=0.1)
+        self.assertTrue(run_condition(self.context, slow, Instance(1)))
+
+        condition = Condition(True, evaluation_fallback=FALLBACK)
+        self.assertFalse(run_condition(self.context, condition, Instance(2)))
+        self.assertEqual(condition.calls, 0)
+        self.assertEqual(self.get_count(EXHAUSTED), exhausted + 1)
+        self.assertEqual(get_failure(self.context['request'], Instance(2)), FALLBACK)
+
+
+    def test_late_inline_decision_is_kept(self):
+        over_budget = self.get_count(OVER_BUDGET)
+        condition = Condition(True, delay=0.05, evaluation_budget=0.01)
+        self.assertTrue(run_condition(self.context, condition, Instance(1)))
+
+        # It is counted, but not treated as a failure.
+        self.assertEqual(self.get_count(OVER_BUDGET), over_budget + 1)
+        self.assertIsNone(get_failure(self.context['request'], Instance(1)))
+
+
+    def test_threaded(self):
+        condition = Condition(True, run_in_thread=True, evaluation_budget=1)
+        self.assertTrue(run_condition(self.context, condition, Instance(1)))
+        self.assertEqual(condition.calls, 1)
+
+
+    def test_threaded_over_budget(self):
+        over_budget = self.get_count(OVER_BUDGET)
+        condition = Condition(True, release=self.release, run_in_thread=True,
+                              evaluation_budget=0.05)
+        start = time.time()
+        self.assertFalse(run_condition(self.context, condition, Instance(1)))
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(self.get_count(OVER_BUDGET), over_budget + 1)
+        self.assertEqual(get_failure(self.context['request'], Instance(1)), 'inactive')
+
+
+    def test_busy_pool(self):
+        blocked = Condition(True, release=self.release, run_in_thread=True,
+                            evaluation_budget=0.05)
+        self.assertFalse(run_condition(self.context, blocked, Instance(1)))
+
+        # The abandoned condition still holds the only thread, so, the next
+        # one is decided at once rather than queued behind it.
+        condition = Condition(True, run_in_thread=True, evaluation_budget=1,
+                              evaluation_fallback=ACTIVE)
+        start = time.time()
+        self.assertTrue(run_condition(self.context, condition, Instance(2)))
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(condition.calls, 0)
+        self.assertEqual(get_failure(self.context['request'], Instance(2)), ACTIVE)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import os
+import unittest
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from ..cms_plugins.segment_plugins import CountrySegmentPlugin
+from ..geoip import GeoIPLookup, geoip, get_client_ip, get_visitor_country
+from ..models import CountrySegmentPluginModel
+
+try:
+    import maxminddb
+except ImportError:
+    maxminddb = None
+
+
+#
+# A tiny MaxMind-format database with documentation networks only:
+#
+#   192.0.2.0/24      country KE
+#   198.51.100.0/24   country CH
+#   203.0.113.0/24    registered_country DE (and no country)
+#   2001:db8::/32     country FR
+#
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'geoip-test.mmdb')
+
+
+class UnusedReader(object):
+
+    def get(self, ip_address):
+        raise AssertionError('{0} was not looked up in the cache.'.format(ip_address))
+
+
+    def close(self):
+        pass
+
+
+@unittest.skipIf(maxminddb is None, 'requires aldryn-segmentation[geoip]')
+@override_settings(SEGMENTATION_GEOIP_DATABASE=FIXTURE)
+class GeoIPLookupTests(SimpleTestCase):
+
+    def setUp(self):
+        self.lookup = GeoIPLookup()
+
+
+    def tearDown(self):
+        self.lookup.close()
+
+
+    def test_country(self):
+        self.assertEqual(self.lookup.get_country('192.0.2.10'), 'KE')
+        self.assertEqual(self.lookup.get_country('198.51.100.200'), 'CH')
+        self.assertEqual(self.lookup.get_country('2001:db8::1'), 'FR')
+
+
+    def test_registered_country(self):
+        self.assertEqual(self.lookup.get_country('203.0.113.5'), 'DE')
+
+
+    def test_unknown_and_invalid(self):
+        self.assertIsNone(self.lookup.get_country('10.0.0.1'))
+        self.assertIsNone(self.lookup.get_country('not an address'))
+        self.assertIsNone(self.lookup.get_country(''))
+        self.assertIsNone(self.lookup.get_country(None))
+
+
+    def test_cache(self):
+        self.assertEqual(self.lookup.get_country('192.0.2.10'), 'KE')
+        self.assertIsNone(self.lookup.get_country('10.0.0.1'))
+        # Both known and unknown addresses are answered from the cache
+        self.lookup._reader.close()
+        self.lookup._reader = UnusedReader()
+        self.assertEqual(self.lookup.get_country('192.0.2.10'), 'KE')
+        self.assertIsNone(self.lookup.get_country('10.0.0.1'))
+
+
+    @override_settings(SEGMENTATION_GEOIP_CACHE_SIZE=1)
+    def test_cache_is_bounded(self):
+        self.lookup.get_country('192.0.2.10')
+        self.lookup.get_country('198.51.100.1')
+        self.assertEqual(len(self.lookup.cache), 1)
+
+
+    @override_settings(SEGMENTATION_GEOIP_DATABASE=None)
+    def test_no_database(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.lookup.get_country('192.0.2.10')
+
+
+    @override_settings(SEGMENTATION_GEOIP_DATABASE=FIXTURE + '.missing')
+    def test_missing_database(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.lookup.get_country('192.0.2.10')
+
+
+class ClientIPTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+
+    def test_remote_addr(self):
+        request = self.factory.get('/', REMOTE_ADDR='192.0.2.1',
+                                   HTTP_X_FORWARDED_FOR='198.51.100.1')
+        self.assertEqual(get_client_ip(request), '192.0.2.1')
+
+
+    @override_settings(SEGMENTATION_GEOIP_PROXY_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_proxy_header(self):
+        request = self.factory.get('/', REMOTE_ADDR='10.0.0.1',
+            HTTP_X_FORWARDED_FOR='203.0.113.1, 198.51.100.1')
+        self.assertEqual(get_client_ip(request), '198.51.100.1')
+
+        request = self.factory.get('/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(get_client_ip(request), '10.0.0.1')
+
+
+    @override_settings(SEGMENTATION_GEOIP_PROXY_HEADER='HTTP_X_FORWARDED_FOR',
+                       SEGMENTATION_GEOIP_PROXY_COUNT=2)
+    def test_proxy_count(self):
+        request = self.factory.get('/', REMOTE_ADDR='10.0.0.1',
+            HTTP_X_FORWARDED_FOR='192.0.2.1, 203.0.113.1, 198.51.100.1')
+        self.assertEqual(get_client_ip(request), '203.0.113.1')
+
+
+@unittest.skipIf(maxminddb is None, 'requires aldryn-segmentation[geoip]')
+@override_settings(SEGMENTATION_GEOIP_DATABASE=FIXTURE)
+class CountrySegmentTests(SimpleTestCase):
+
+    def setUp(self):
+        geoip.close()
+        self.factory = RequestFactory()
+        self.plugin = CountrySegmentPlugin()
+
+
+    def tearDown(self):
+        geoip.close()
+
+
+    def test_one_lookup_per_request(self):
+        request = self.factory.get('/', REMOTE_ADDR='192.0.2.10')
+        self.assertEqual(get_visitor_country(request), 'KE')
+        request.META['REMOTE_ADDR'] = '198.51.100.1'
+        self.assertEqual(get_visitor_country(request), 'KE')
+
+
+    def test_is_context_appropriate(self):
+        kenya = CountrySegmentPluginModel(country_code='KE')
+        switzerland = CountrySegmentPluginModel(country_code='CH')
+
+        context = {'request': self.factory.get('/', REMOTE_ADDR='192.0.2.10')}
+        self.assertTrue(self.plugin.is_context_appropriate(context, kenya))
+        self.assertFalse(self.plugin.is_context_appropriate(context, switzerland))
+
+        context = {'request': self.factory.get('/', REMOTE_ADDR='10.0.0.1')}
+        self.assertFalse(self.plugin.is_context_appropriate(context, kenya))
+
+
+    def test_decision_inputs(self):
+        instance = CountrySegmentPluginModel(country_code='KE')
+        context = {'request': self.factory.get('/', REMOTE_ADDR='192.0.2.10')}
+        self.assertEqual(
+            self.plugin.get_decision_inputs(context, instance), '192.0.2.10')
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+
+from ..models import SegmentOverrideRecord
+from ..segment_pool.override_backends import (
+    DatabaseOverrideBackend,
+    PoolOverrideBackend,
+)
+from ..segment_pool.segment_pool import SegmentOverride
+
+
+class User(object):
+
+    def __init__(self, pk, username):
+        self.pk = pk
+        self.username = username
+
+
+class DatabaseOverrideBackendTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.backend = DatabaseOverrideBackend(None)
+        self.user = User(1, 'editor')
+
+
+    def get_records(self):
+        return list(SegmentOverrideRecord.objects.filter(
+            user_id=self.user.pk).values_list(
+                'segment_class', 'segment_config', 'override'))
+
+
+    def test_upsert(self):
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedActive)
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedInactive)
+        self.assertEqual(self.get_records(), [
+            ('CookieSegmentPlugin', 'a=1', SegmentOverride.ForcedInactive),
+        ])
+
+
+    def test_no_override_deletes(self):
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedActive)
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.NoOverride)
+        self.assertEqual(self.get_records(), [])
+
+
+    def test_long_configuration(self):
+        config = 'a' * 5000
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', config,
+                                  SegmentOverride.ForcedActive)
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', config + 'b',
+                                  SegmentOverride.ForcedInactive)
+        self.assertEqual(len(self.get_records()), 2)
+        self.assertEqual(
+            self.backend.get_override(self.user, 'CookieSegmentPlugin', config),
+            SegmentOverride.ForcedActive)
+
+
+    def test_users_are_separate(self):
+        other = User(2, 'other')
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedActive)
+        self.assertEqual(self.backend.get_overrides(other), {})
+        self.assertEqual(self.backend.get_overrides(User(None, '')), {})
+
+
+    def test_one_query_per_user(self):
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedActive)
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'b=2',
+                                  SegmentOverride.ForcedInactive)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_overrides(self.user), {
+                ('CookieSegmentPlugin', 'a=1'): SegmentOverride.ForcedActive,
+                ('CookieSegmentPlugin', 'b=2'): SegmentOverride.ForcedInactive,
+            })
+            self.backend.get_override(self.user, 'CookieSegmentPlugin', 'a=1')
+
+        # Another request (a fresh user object) is answered from the cache.
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.backend.get_override(User(1, 'editor'), 'CookieSegmentPlugin', 'b=2'),
+                SegmentOverride.ForcedInactive)
+
+
+    def test_writes_invalidate(self):
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedActive)
+        self.assertEqual(len(self.backend.get_overrides(User(1, 'editor'))), 1)
+
+        self.backend.reset_overrides(self.user)
+        self.assertEqual(self.backend.get_overrides(self.user), {})
+        self.assertEqual(self.backend.get_overrides(User(1, 'editor')), {})
+
+
+class PoolOverrideBackendTests(SimpleTestCase):
+
+    def setUp(self):
+        self.backend = PoolOverrideBackend(None)
+        self.user = User(1, 'editor')
+
+
+    def age(self, seconds):
+        for key, (override, timestamp) in list(self.backend._entries.items()):
+            self.backend._entries[key] = (override, timestamp - seconds)
+
+
+    def test_set_and_reset(self):
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedActive)
+        self.assertEqual(
+            self.backend.get_override(self.user, 'CookieSegmentPlugin', 'a=1'),
+            SegmentOverride.ForcedActive)
+
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.NoOverride)
+        self.assertEqual(len(self.backend), 0)
+
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedInactive)
+        self.backend.reset_overrides(self.user)
+        self.assertEqual(self.backend.get_overrides(self.user), {})
+        self.assertEqual(len(self.backend), 0)
+
+
+    @override_settings(SEGMENTATION_OVERRIDE_TTL=60)
+    def test_ttl(self):
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedActive)
+        self.age(30)
+        self.assertEqual(
+            self.backend.get_override(self.user, 'CookieSegmentPlugin', 'a=1'),
+            SegmentOverride.ForcedActive)
+
+        self.age(60)
+        self.assertEqual(
+            self.backend.get_override(self.user, 'CookieSegmentPlugin', 'a=1'),
+            SegmentOverride.NoOverride)
+        self.assertEqual(len(self.backend), 0)
+
+
+    @override_settings(SEGMENTATION_OVERRIDE_TTL=None)
+    def test_no_ttl(self):
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedActive)
+        self.age(365 * 24 * 60 * 60)
+        self.backend.sweep()
+        self.assertEqual(len(self.backend), 1)
+
+
+    @override_settings(SEGMENTATION_OVERRIDE_TTL=60)
+    def test_sweep(self):
+        other = User(2, 'other')
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedActive)
+        self.backend.set_override(other, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedActive)
+
+        self.backend.sweep(time.time() + 120)
+        self.assertEqual(len(self.backend), 0)
+        self.assertEqual(self.backend._user_keys, {})
+
+
+    @override_settings(SEGMENTATION_OVERRIDE_MAX_ENTRIES=2)
+    def test_lru_eviction(self):
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'a=1',
+                                  SegmentOverride.ForcedActive)
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'b=2',
+                                  SegmentOverride.ForcedActive)
+        # Using 'a=1' makes 'b=2' the least-recently used.
+        self.backend.get_override(self.user, 'CookieSegmentPlugin', 'a=1')
+        self.backend.set_override(self.user, 'CookieSegmentPlugin', 'c=3',
+                                  SegmentOverride.ForcedInactive)
+
+        self.assertEqual(len(self.backend), 2)
+        self.assertEqual(self.backend.get_overrides(self.user), {
+            ('CookieSegmentPlugin', 'a=1'): SegmentOverride.ForcedActive,
+            ('CookieSegmentPlugin', 'c=3'): SegmentOverride.ForcedInactive,
+        })
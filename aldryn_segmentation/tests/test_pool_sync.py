@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+
+from ..segment_pool.segment_pool import SegmentPool
+
+
+class Worker(SegmentPool):
+    '''
+    A segment pool that records the changes it applies rather than loading
+    the plugins, as if it ran in its own process.
+    '''
+
+    def __init__(self):
+        super(Worker, self).__init__()
+        self.applied = []
+        # As if the pool of site 1 had been discovered
+        self._partitions = {1: dict()}
+        self._version = self.get_shared_version()
+
+
+    def _apply_changes(self, changes, use_index=None):
+        self.applied.extend(changes)
+
+
+class PoolSyncTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.first = Worker()
+        self.second = Worker()
+
+
+    def test_changes_are_applied(self):
+        self.first.publish_changes([
+            (False, 'CookieSegmentPlugin', 1),
+            (True, 'CookieSegmentPlugin', 2),
+        ])
+        self.first.publish_changes([(False, 'CountrySegmentPlugin', 3)])
+
+        # The publishing worker applied them itself and is still in sync.
+        self.assertEqual(self.first._version, 3)
+        self.first.sync()
+        self.assertEqual(self.first.applied, [])
+
+        self.second.sync()
+        self.assertEqual(self.second.applied, [
+            (False, 'CookieSegmentPlugin', 1),
+            (True, 'CookieSegmentPlugin', 2),
+            (False, 'CountrySegmentPlugin', 3),
+        ])
+        self.assertEqual(self.second._version, 3)
+
+        # Nothing is applied twice.
+        self.second.sync()
+        self.assertEqual(len(self.second.applied), 3)
+
+
+    def test_interleaved_publishers(self):
+        self.first.publish_changes([(False, 'CookieSegmentPlugin', 1)])
+        self.second.publish_changes([(False, 'CookieSegmentPlugin', 2)])
+        self.first.publish_changes([(False, 'CookieSegmentPlugin', 3)])
+
+        # Once another worker has published in between, a worker applies its
+        # own later changes again, which is harmless.
+        self.first.sync()
+        self.second.sync()
+        self.assertEqual(self.first.applied, [
+            (False, 'CookieSegmentPlugin', 2),
+            (False, 'CookieSegmentPlugin', 3),
+        ])
+        self.assertEqual(self.second.applied, [
+            (False, 'CookieSegmentPlugin', 1),
+            (False, 'CookieSegmentPlugin', 2),
+            (False, 'CookieSegmentPlugin', 3),
+        ])
+        self.assertEqual(self.first._version, 3)
+        self.assertEqual(self.second._version, 3)
+
+
+    def test_once_per_request(self):
+        request = self.factory.get('/')
+        self.second.sync(request)
+        self.first.publish_changes([(False, 'CookieSegmentPlugin', 1)])
+        self.second.sync(request)
+        self.assertEqual(self.second.applied, [])
+
+        self.second.sync(self.factory.get('/'))
+        self.assertEqual(self.second.applied, [(False, 'CookieSegmentPlugin', 1)])
+
+
+    def test_lost_change_log(self):
+        self.first.publish_changes([
+            (False, 'CookieSegmentPlugin', 1),
+            (False, 'CookieSegmentPlugin', 2),
+        ])
+        cache.delete(SegmentPool.CHANGE_KEY.format(version=1))
+
+        self.second.sync()
+        self.assertEqual(self.second.applied, [])
+        self.assertEqual(self.second._partitions, dict())
+        self.assertEqual(self.second._version, 2)
+
+
+    def test_too_many_changes(self):
+        # As if that many changes had been published
+        cache.set(SegmentPool.VERSION_KEY, SegmentPool.MAX_SYNC_CHANGES + 1, None)
+
+        self.second.sync()
+        self.assertEqual(self.second.applied, [])
+        self.assertEqual(self.second._partitions, dict())
+
+
+    def test_not_discovered(self):
+        self.second._version = None
+        self.first.publish_changes([(False, 'CookieSegmentPlugin', 1)])
+        self.second.sync()
+        self.assertEqual(self.second.applied, [])
+        self.assertIsNone(self.second._version)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import unittest
+from datetime import datetime, time
+
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from django.utils.timezone import utc
+
+from ..models import ScheduleSegmentPluginModel
+from ..schedule import compute_state, get_state
+
+try:
+    import pytz
+except ImportError:
+    pytz = None
+
+
+def at(*args):
+    return datetime(*args, tzinfo=utc)
+
+
+@override_settings(USE_TZ=True, TIME_ZONE='UTC')
+class ComputeStateTests(SimpleTestCase):
+
+    def test_daily_hours(self):
+        instance = ScheduleSegmentPluginModel(
+            start_time=time(9), end_time=time(17))
+        # 2024-01-01 is a Monday.
+        self.assertEqual(compute_state(instance, at(2024, 1, 1, 8)),
+                         (False, at(2024, 1, 1, 9)))
+        self.assertEqual(compute_state(instance, at(2024, 1, 1, 9)),
+                         (True, at(2024, 1, 1, 17)))
+        self.assertEqual(compute_state(instance, at(2024, 1, 1, 17)),
+                         (False, at(2024, 1, 2, 9)))
+
+
+    def test_overnight_hours(self):
+        instance = ScheduleSegmentPluginModel(
+            start_time=time(22), end_time=time(6))
+        self.assertEqual(compute_state(instance, at(2024, 1, 1, 12)),
+                         (False, at(2024, 1, 1, 22)))
+        # Midnight is not a change of state.
+        self.assertEqual(compute_state(instance, at(2024, 1, 1, 23)),
+                         (True, at(2024, 1, 2, 6)))
+        self.assertEqual(compute_state(instance, at(2024, 1, 2, 5, 59)),
+                         (True, at(2024, 1, 2, 6)))
+
+
+    def test_weekdays(self):
+        instance = ScheduleSegmentPluginModel(weekdays='01234')
+        # Friday, then Saturday
+        self.assertEqual(compute_state(instance, at(2024, 1, 5, 12)),
+                         (True, at(2024, 1, 6)))
+        self.assertEqual(compute_state(instance, at(2024, 1, 6, 12)),
+                         (False, at(2024, 1, 8)))
+
+
+    def test_date_window(self):
+        instance = ScheduleSegmentPluginModel(
+            active_from=at(2024, 1, 10), active_until=at(2024, 1, 20))
+        self.assertEqual(compute_state(instance, at(2024, 1, 1)),
+                         (False, at(2024, 1, 10)))
+        self.assertEqual(compute_state(instance, at(2024, 1, 15)),
+                         (True, at(2024, 1, 20)))
+        self.assertEqual(compute_state(instance, at(2024, 1, 25)), (False, None))
+
+
+    def test_date_window_and_hours(self):
+        instance = ScheduleSegmentPluginModel(
+            active_from=at(2024, 1, 10, 12), start_time=time(9), end_time=time(17))
+        self.assertEqual(compute_state(instance, at(2024, 1, 1)),
+                         (False, at(2024, 1, 10, 12)))
+        self.assertEqual(compute_state(instance, at(2024, 1, 10, 18)),
+                         (False, at(2024, 1, 11, 9)))
+
+
+    def test_always(self):
+        instance = ScheduleSegmentPluginModel()
+        self.assertEqual(compute_state(instance, at(2024, 1, 1)), (True, None))
+
+
+    @unittest.skipIf(pytz is None, 'requires pytz')
+    def test_timezone(self):
+        instance = ScheduleSegmentPluginModel(
+            start_time=time(9), end_time=time(17), timezone='Europe/Zurich')
+        # Winter time, UTC+1
+        self.assertEqual(compute_state(instance, at(2024, 1, 1, 7, 30)),
+                         (False, at(2024, 1, 1, 8)))
+        self.assertEqual(compute_state(instance, at(2024, 1, 1, 12)),
+                         (True, at(2024, 1, 1, 16)))
+        # The day summer time (UTC+2) begins
+        self.assertEqual(compute_state(instance, at(2024, 3, 31, 12)),
+                         (True, at(2024, 3, 31, 15)))
+
+
+    @unittest.skipIf(pytz is None, 'requires pytz')
+    def test_timezone_weekdays(self):
+        instance = ScheduleSegmentPluginModel(
+            weekdays='5', timezone='Pacific/Auckland')
+        # Friday evening in UTC is already Saturday in Auckland (UTC+13).
+        self.assertEqual(compute_state(instance, at(2024, 1, 5, 12)),
+                         (True, at(2024, 1, 6, 11)))
+
+
+@override_settings(USE_TZ=True, TIME_ZONE='UTC')
+class GetStateTests(SimpleTestCase):
+
+    def test_precomputed_until_boundary(self):
+        instance = ScheduleSegmentPluginModel(
+            pk=-1, start_time=time(9), end_time=time(17))
+        self.assertEqual(get_state(instance, at(2024, 1, 1, 10)),
+                         (True, at(2024, 1, 1, 17)))
+
+        # Until the boundary, the state is not computed again.
+        instance.end_time = time(12)
+        self.assertEqual(get_state(instance, at(2024, 1, 1, 13)),
+                         (True, at(2024, 1, 1, 17)))
+
+        self.assertEqual(get_state(instance, at(2024, 1, 1, 17)),
+                         (False, at(2024, 1, 2, 9)))
+
+
+    def test_changed_instance(self):
+        instance = ScheduleSegmentPluginModel(
+            pk=-2, start_time=time(9), end_time=time(17),
+            changed_date=at(2024, 1, 1))
+        self.assertTrue(get_state(instance, at(2024, 1, 1, 10))[0])
+
+        instance.start_time = time(11)
+        instance.changed_date = at(2024, 1, 1, 10)
+        self.assertEqual(get_state(instance, at(2024, 1, 1, 10)),
+                         (False, at(2024, 1, 1, 11)))
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import Permission
+from django.db.models import Q
+
+
+#
+# The user context is created at most once per request and remembered here.
+#
+USER_CONTEXT_ATTR = '_segment_user_context'
+
+
+class UserContext(object):
+    '''
+    The visitor's group ids and permissions ('app_label.codename'). Each is
+    loaded with a single query, the first time a segment asks for it, so
+    that every further check is a set lookup.
+
+    User models without groups or permissions (E.g., custom ones without
+    PermissionsMixin) simply have none.
+    '''
+
+    def __init__(self, user):
+        self.user = user
+        self._group_ids = None
+        self._permissions = None
+
+
+    @property
+    def is_authenticated(self):
+        return bool(self.user is not None and self.user.is_authenticated())
+
+
+    @property
+    def group_ids(self):
+        if self._group_ids is None:
+            self._group_ids = set()
+            if self.is_authenticated and hasattr(self.user, 'groups'):
+                self._group_ids.update(
+                    self.user.groups.values_list('pk', flat=True))
+        return self._group_ids
+
+
+    @property
+    def permissions(self):
+        '''
+        The user's permissions, either direct or through any of their groups.
+        '''
+
+        if self._permissions is None:
+            self._permissions = set()
+            if self.is_authenticated:
+                via = Q()
+                if hasattr(self.user, 'user_permissions'):
+                    via |= Q(user=self.user)
+                if hasattr(self.user, 'groups'):
+                    via |= Q(group__user=self.user)
+                if via:
+                    self._permissions.update(
+                        '{0}.{1}'.format(app_label, codename)
+                        for app_label, codename in Permission.objects.filter(
+                            via).values_list('content_type__app_label', 'codename')
+                    )
+        return self._permissions
+
+
+    def is_member(self, group_id):
+        return group_id in self.group_ids
+
+
+    def has_permission(self, permission):
+        '''
+        Returns True if the user has the given permission ('app_label.codename')
+        directly or through any of their groups. Like Django's ModelBackend,
+        active superusers have all permissions and inactive users none.
+        '''
+        if not self.is_authenticated or not self.user.is_active:
+            return False
+        if getattr(self.user, 'is_superuser', False):
+            return True
+        return permission in self.permissions
+
+
+def get_user_context(request):
+    '''
+    Returns the UserContext of the given request's user, creating it the first
+    time it is asked for.
+    '''
+
+    try:
+        return getattr(request, USER_CONTEXT_ATTR)
+    except AttributeError:
+        pass
+
+    user_context = UserContext(getattr(request, 'user', None))
+    setattr(request, USER_CONTEXT_ATTR, user_context)
+    return user_context
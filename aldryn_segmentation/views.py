@@ -6,6 +6,7 @@ from django.utils.translation import ugettext_lazy as _
 from django.views.decorators.http import require_POST
 from django.utils.encoding import force_text
 
+from .metrics import render_metrics
 from .segment_pool import segment_pool
 
 
@@ -19,8 +20,11 @@ def set_segment_override(request):
     segment_config = request.POST.get('segment_config', None)
     override = request.POST.get('override', None)
 
-    segment_pool.set_override(request.user, segment_class, segment_config, override)
-    return HttpResponse(force_text(_('The segment override was successfully changed.')))
+    segment_pool.set_override(request.user, segment_class, segment_config,
+                              override, request=request)
+    response = HttpResponse(force_text(_('The segment override was successfully changed.')))
+    segment_pool.override_backend.update_response(request, response)
+    return response
 
 
 def reset_all_segment_overrides(request):
@@ -28,5 +32,17 @@ def reset_all_segment_overrides(request):
     This view resets all segment overrides in one go.
     '''
 
-    segment_pool.reset_all_segment_overrides(request.user)
-    return HttpResponse(force_text(_('The all segment override were successfully reset.')))
+    segment_pool.reset_all_segment_overrides(request.user, request=request)
+    response = HttpResponse(force_text(_('The all segment override were successfully reset.')))
+    segment_pool.override_backend.update_response(request, response)
+    return response
+
+
+def segment_metrics(request):
+    '''
+    This view exports this process' segmentation metrics (see
+    aldryn_segmentation.metrics) in the Prometheus text format.
+    '''
+
+    return HttpResponse(render_metrics(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
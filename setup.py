@@ -11,6 +11,13 @@ REQUIREMENTS = [
     # python setup.py sdist upload
 ]
 
+EXTRAS_REQUIRE = {
+    # For the Country segment
+    'geoip': ['maxminddb>=1.1.0'],
+    # For the simulate_segments command
+    'simulation': ['numpy>=1.13'],
+}
+
 CLASSIFIERS = [
     'Development Status :: 2 - Pre-Alpha',
     'Environment :: Web Environment',
@@ -36,6 +43,7 @@ setup(
     license='LICENSE.txt',
     platforms=['OS Independent'],
     install_requires=REQUIREMENTS,
+    extras_require=EXTRAS_REQUIRE,
     classifiers=CLASSIFIERS,
     include_package_data=True,
     zip_safe=False
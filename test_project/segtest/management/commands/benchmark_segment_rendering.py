@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import timeit
+from optparse import make_option
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.template import RequestContext
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from cms.api import add_plugin
+from cms.models import Placeholder
+from cms.utils.plugins import build_plugin_tree, downcast_plugins
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compares rendering a deep tree of segment plugins through the '
+            'templates with the direct Python renderer. Nothing is saved.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--depth', dest='depth', type='int', default=4,
+            help='Levels of nested Limit Blocks (default: 4).'),
+        make_option('--breadth', dest='breadth', type='int', default=4,
+            help='Segment plugins in each Limit Block (default: 4).'),
+        make_option('--iterations', dest='iterations', type='int', default=20,
+            help='Renders per renderer (default: 20).'),
+    )
+
+    def build_tree(self, placeholder, depth, breadth, target=None):
+        '''
+        Adds a "Show All" Limit Block holding `breadth` cookie segments, each
+        of which holds the next level down, `depth` levels deep.
+        '''
+        limiter = add_plugin(placeholder, 'SegmentLimitPlugin', 'en',
+                             target=target, max_children=0)
+        for num in range(breadth):
+            segment = add_plugin(placeholder, 'CookieSegmentPlugin', 'en',
+                                 target=limiter, cookie_key='benchmark',
+                                 cookie_value='yes' if num % 2 else 'no')
+            if depth > 1:
+                self.build_tree(placeholder, depth - 1, breadth, target=segment)
+            else:
+                add_plugin(placeholder, 'FallbackSegmentPlugin', 'en',
+                           target=segment)
+        return limiter
+
+    def render(self, placeholder, request):
+        plugins = downcast_plugins(placeholder.get_plugins())
+        root = build_plugin_tree(plugins)[0]
+        return root.render_plugin(RequestContext(request), placeholder)
+
+    def handle(self, *args, **options):
+        depth = options['depth']
+        breadth = options['breadth']
+        iterations = options['iterations']
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.current_page = None
+        request.COOKIES['benchmark'] = 'yes'
+
+        try:
+            with transaction.atomic():
+                placeholder = Placeholder.objects.create(slot='segment-benchmark')
+                self.build_tree(placeholder, depth, breadth)
+                num_plugins = placeholder.get_plugins().count()
+
+                outputs = {}
+                for renderer in ('template', 'python', ):
+                    with override_settings(SEGMENTATION_RENDERER=renderer):
+                        outputs[renderer] = self.render(placeholder, request)
+                        seconds = min(timeit.repeat(
+                            lambda: self.render(placeholder, request),
+                            repeat=3, number=iterations))
+                    self.stdout.write('{0:>8}: {1:8.2f} ms per render of '
+                        '{2:d} plugins'.format(
+                            renderer, 1000.0 * seconds / iterations,
+                            num_plugins))
+
+                if outputs['template'] != outputs['python']:
+                    raise CommandError('The renderers produced different output!')
+
+                raise Rollback()
+        except Rollback:
+            pass
@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from optparse import make_option
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+from django.core.signals import request_finished, request_started
+from django.core.urlresolvers import reverse
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test.client import Client
+from django.utils.six.moves import queue, socketserver
+from django.utils.six.moves.urllib.error import HTTPError, URLError
+from django.utils.six.moves.urllib.request import Request, urlopen
+
+from cms.api import add_plugin, create_page, publish_page
+
+from aldryn_segmentation.segment_pool import SegmentOverride, segment_pool
+
+
+ANONYMOUS = 'anonymous'
+MEMBER = 'member'
+EDITOR = 'editor'
+KINDS = (ANONYMOUS, MEMBER, EDITOR, )
+
+PREFIX = 'loadtest'
+PASSWORD = 'loadtest'
+COOKIE_NAME = 'loadtest'
+COOKIE_VALUES = ('a', 'b', 'c', )
+
+#
+# The kind of visitor making a request is sent in this header, so that the
+# server-side measurements can be attributed to it.
+#
+KIND_HEADER = 'X-Loadtest-Kind'
+KIND_META = 'HTTP_X_LOADTEST_KIND'
+
+USER_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:45.0) Gecko/20100101 Firefox/45.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_4) AppleWebKit/601.5.17 '
+    '(KHTML, like Gecko) Version/9.1 Safari/601.5.17',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 9_3 like Mac OS X) AppleWebKit/601.1.46 '
+    '(KHTML, like Gecko) Version/9.0 Mobile/13E188a Safari/601.1',
+    'Mozilla/5.0 (iPad; CPU OS 9_3 like Mac OS X) AppleWebKit/601.1.46 '
+    '(KHTML, like Gecko) Version/9.0 Mobile/13E188a Safari/601.1',
+    'Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/49.0.2623.105 Mobile Safari/537.36',
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+)
+
+#
+# The segment plugins the pages are built from, in turn. The last child of
+# every Limit Block is a Fallback segment.
+#
+SEGMENTS = (
+    ('CookieSegmentPlugin', lambda num: {
+        'cookie_key': COOKIE_NAME,
+        'cookie_value': COOKIE_VALUES[num % len(COOKIE_VALUES)],
+    }),
+    ('HeaderSegmentPlugin', lambda num: {
+        'match_type': 'device',
+        'header_value': ('mobile', 'tablet', 'bot', )[num % 3],
+    }),
+    ('AuthenticatedSegmentPlugin', lambda num: {}),
+    ('BucketSegmentPlugin', lambda num: {
+        'experiment': PREFIX,
+        'bucket_from': 0,
+        'bucket_to': 25 * (1 + num % 3),
+    }),
+)
+
+
+def percentile(values, percent):
+    '''
+    Returns the given percentile of the values, by the nearest-rank method.
+    '''
+
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+class Visitor(object):
+
+    def __init__(self, kind, cookies, user_agent):
+        self.kind = kind
+        self.cookies = cookies
+        self.user_agent = user_agent
+
+
+    @property
+    def cookie_header(self):
+        return '; '.join(
+            '{0}={1}'.format(name, value)
+            for name, value in sorted(self.cookies.items()))
+
+
+class Probe(object):
+    '''
+    Measures the render time and the number of queries of each request on
+    the thread that handles it, using the request signals.
+    '''
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+
+    def expect(self, kind):
+        '''
+        Attributes the requests handled on this thread to the given kind of
+        visitor (for the test client, which handles them on the caller's
+        thread and might not pass the environ to request_started).
+        '''
+        self._local.expected = kind
+
+
+    def started(self, sender, environ=None, **kwargs):
+        kind = (environ or dict()).get(KIND_META) or getattr(self._local, 'expected', None)
+        self._local.kind = kind
+        self._local.start = time.time()
+        # Django < 1.8 and 1.8, respectively
+        connection.use_debug_cursor = True
+        connection.force_debug_cursor = True
+
+
+    def finished(self, sender, **kwargs):
+        kind = getattr(self._local, 'kind', None)
+        if kind is None:
+            return
+        self._local.kind = None
+        sample = (time.time() - self._local.start, len(connection.queries))
+        with self._lock:
+            self.samples[kind].append(sample)
+
+
+    def __enter__(self):
+        request_started.connect(self.started)
+        request_finished.connect(self.finished)
+        return self
+
+
+    def __exit__(self, *args):
+        request_started.disconnect(self.started)
+        request_finished.disconnect(self.finished)
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class Command(BaseCommand):
+    help = ('Builds pages of (nested) Limit Blocks and segment plugins and '
+            'requests them from many threads as a synthetic population of '
+            'anonymous visitors, logged-in members and editors with '
+            'overrides. Reports throughput, latency percentiles, queries per '
+            'request and render time per kind of visitor. The pages and '
+            'users are deleted afterwards, unless --keep is given.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--pages', dest='pages', type='int', default=5,
+            help='Pages to build (default: 5).'),
+        make_option('--limiters', dest='limiters', type='int', default=2,
+            help='Limit Blocks at the top of each page (default: 2).'),
+        make_option('--segments', dest='segments', type='int', default=4,
+            help='Segment plugins in each Limit Block, including its '
+                 'Fallback segment (default: 4).'),
+        make_option('--depth', dest='depth', type='int', default=2,
+            help='Levels of nested Limit Blocks (default: 2).'),
+        make_option('--requests', dest='requests', type='int', default=1000,
+            help='Requests to make in total (default: 1000).'),
+        make_option('--threads', dest='threads', type='int', default=8,
+            help='Concurrent clients (default: 8).'),
+        make_option('--visitors', dest='visitors', type='int', default=200,
+            help='Size of the visitor population (default: 200).'),
+        make_option('--members', dest='members', type='float', default=0.2,
+            help='Share of logged-in members among visitors (default: 0.2).'),
+        make_option('--editors', dest='editors', type='float', default=0.05,
+            help='Share of logged-in editors among visitors (default: 0.05).'),
+        make_option('--users', dest='users', type='int', default=5,
+            help='Member and editor accounts to create of each (default: 5).'),
+        make_option('--overrides', dest='overrides', type='int', default=3,
+            help='Segment overrides set by each editor (default: 3).'),
+        make_option('--server', action='store_true', dest='server', default=False,
+            help='Serve the requests from a local threaded WSGI server '
+                 'instead of calling Django through the test client.'),
+        make_option('--seed', dest='seed', type='int', default=0,
+            help='Seed for the visitor population (default: 0).'),
+        make_option('--keep', action='store_true', dest='keep', default=False,
+            help='Keep the pages and users afterwards.'),
+    )
+
+    def build_tree(self, placeholder, depth, breadth, target=None):
+        '''
+        Adds a Limit Block holding `breadth` segments, the last of which is
+        a Fallback segment, each of which holds the next level down or, at
+        the bottom, some text.
+        '''
+        limiter = add_plugin(placeholder, 'SegmentLimitPlugin', 'en',
+                             target=target, max_children=1)
+        for num in range(breadth):
+            if num == breadth - 1:
+                segment = add_plugin(placeholder, 'FallbackSegmentPlugin', 'en',
+                                     target=limiter)
+            else:
+                plugin_type, get_kwargs = SEGMENTS[num % len(SEGMENTS)]
+                segment = add_plugin(placeholder, plugin_type, 'en',
+                                     target=limiter, **get_kwargs(num))
+            if depth > 1:
+                self.build_tree(placeholder, depth - 1, breadth, target=segment)
+            else:
+                add_plugin(placeholder, 'TextPlugin', 'en', target=segment,
+                           body='<p>{0} {1}</p>'.format(segment.plugin_type, num))
+        return limiter
+
+    def build_pages(self, options, publisher):
+        urls = []
+        for num in range(options['pages']):
+            page = create_page('{0}-{1}'.format(PREFIX, num), 'page.html', 'en',
+                               slug='{0}-{1}'.format(PREFIX, num))
+            placeholder = page.placeholders.get(slot='content')
+            for limiter in range(options['limiters']):
+                self.build_tree(placeholder, options['depth'], options['segments'])
+            page = publish_page(page, publisher, 'en')
+            self.pages.append(page)
+            urls.append(page.get_public_object().get_absolute_url('en'))
+        return urls
+
+    def create_users(self, options):
+        User = get_user_model()
+        users = dict((kind, []) for kind in (MEMBER, EDITOR, ))
+        for kind in users:
+            for num in range(options['users']):
+                username = '{0}-{1}-{2}'.format(PREFIX, kind, num)
+                user = User(**{User.USERNAME_FIELD: username})
+                user.is_staff = user.is_superuser = kind == EDITOR
+                user.set_password(PASSWORD)
+                user.save()
+                users[kind].append(username)
+        return users
+
+    def log_in(self, username, kind, num_overrides, rng):
+        '''
+        Returns the cookies of a new session of the given user. Editors also
+        set overrides on random segments through the toolbar's view, so that
+        they end up wherever the override backend keeps them.
+        '''
+        client = Client()
+        if not client.login(username=username, password=PASSWORD):
+            raise CommandError('Could not log in as {0}.'.format(username))
+
+        if kind == EDITOR and num_overrides:
+            segments = sorted(
+                (class_name, config_key)
+                for class_name, segment_class in segment_pool.segments.items()
+                for config_key in segment_class[segment_pool.CFGS]
+            )
+            for class_name, config_key in rng.sample(
+                    segments, min(num_overrides, len(segments))):
+                client.post(reverse('admin:set_segment_override'), {
+                    'segment_class': class_name,
+                    'segment_config': config_key,
+                    'override': rng.choice((SegmentOverride.ForcedActive,
+                                            SegmentOverride.ForcedInactive)),
+                })
+
+        return dict((name, morsel.value)
+                    for name, morsel in client.cookies.items())
+
+    def make_visitors(self, options, users, rng):
+        sessions = dict(
+            (kind, [self.log_in(username, kind, options['overrides'], rng)
+                    for username in usernames])
+            for kind, usernames in users.items()
+        )
+
+        visitors = []
+        for num in range(options['visitors']):
+            draw = rng.random()
+            if draw < options['editors'] and sessions[EDITOR]:
+                kind = EDITOR
+            elif draw < options['editors'] + options['members'] and sessions[MEMBER]:
+                kind = MEMBER
+            else:
+                kind = ANONYMOUS
+
+            cookies = dict()
+            if kind != ANONYMOUS:
+                cookies.update(rng.choice(sessions[kind]))
+            if rng.random() < 0.75:
+                cookies[COOKIE_NAME] = rng.choice(COOKIE_VALUES)
+            if rng.random() < 0.75:
+                # The others are new visitors, who get a bucket cookie
+                cookies['segment_bucket'] = '{0:032x}'.format(rng.getrandbits(128))
+
+            visitors.append(Visitor(kind, cookies, rng.choice(USER_AGENTS)))
+        return visitors
+
+    def request_with_client(self, client, probe, visitor, url):
+        client.cookies.clear()
+        for name, value in visitor.cookies.items():
+            client.cookies[name] = value
+        probe.expect(visitor.kind)
+        response = client.get(url, HTTP_USER_AGENT=visitor.user_agent,
+                              **{KIND_META: visitor.kind})
+        return response.status_code == 200
+
+    def request_from_server(self, base_url, visitor, url):
+        request = Request(base_url + url, headers={
+            'Cookie': visitor.cookie_header,
+            'User-Agent': visitor.user_agent,
+            KIND_HEADER: visitor.kind,
+        })
+        try:
+            response = urlopen(request)
+            response.read()
+            return response.getcode() == 200
+        except (HTTPError, URLError):
+            return False
+
+    def run(self, plan, options, probe):
+        '''
+        Makes the planned requests from options['threads'] threads. Returns
+        the wall time taken and a list of (kind, latency, ok).
+        '''
+
+        server = None
+        base_url = None
+        if options['server']:
+            server = ThreadedWSGIServer(('127.0.0.1', 0), QuietWSGIRequestHandler)
+            server.set_app(get_wsgi_application())
+            threading.Thread(target=server.serve_forever).start()
+            base_url = 'http://{0}:{1}'.format(*server.server_address)
+
+        pending = queue.Queue()
+        for item in plan:
+            pending.put(item)
+        results = []
+
+        def work():
+            client = Client()
+            try:
+                while True:
+                    try:
+                        visitor, url = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    start = time.time()
+                    if server is None:
+                        ok = self.request_with_client(client, probe, visitor, url)
+                    else:
+                        ok = self.request_from_server(base_url, visitor, url)
+                    results.append((visitor.kind, time.time() - start, ok))
+            finally:
+                connection.close()
+
+        start = time.time()
+        threads = [threading.Thread(target=work) for num in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        return elapsed, results
+
+    def report(self, elapsed, results, probe):
+        self.stdout.write('{0:d} requests in {1:.2f} s: {2:.1f} requests/s'.format(
+            len(results), elapsed, len(results) / elapsed if elapsed else 0.0))
+        self.stdout.write('{0:>10} {1:>8} {2:>7} {3:>8} {4:>8} {5:>8} {6:>8} '
+                          '{7:>9} {8:>9}'.format(
+            'visitors', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+            'p99 ms', 'queries', 'render ms'))
+
+        for kind in KINDS:
+            latencies = [latency for k, latency, ok in results if k == kind]
+            if not latencies:
+                continue
+            errors = len([ok for k, latency, ok in results if k == kind and not ok])
+            samples = probe.samples.get(kind) or [(0.0, 0)]
+            self.stdout.write('{0:>10} {1:8d} {2:7d} {3:8.1f} {4:8.2f} {5:8.2f} '
+                              '{6:8.2f} {7:9.1f} {8:9.2f}'.format(
+                kind,
+                len(latencies),
+                errors,
+                len(latencies) / elapsed if elapsed else 0.0,
+                1000.0 * percentile(latencies, 50),
+                1000.0 * percentile(latencies, 95),
+                1000.0 * percentile(latencies, 99),
+                float(sum(queries for render, queries in samples)) / len(samples),
+                1000.0 * sum(render for render, queries in samples) / len(samples),
+            ))
+
+    def clean_up(self, users):
+        User = get_user_model()
+        for kind, usernames in users.items():
+            if kind == EDITOR:
+                for username in usernames:
+                    client = Client()
+                    client.login(username=username, password=PASSWORD)
+                    client.get(reverse('admin:reset_all_segment_overrides'))
+        for page in self.pages:
+            public = page.get_public_object()
+            if public is not None and public.pk != page.pk:
+                public.delete()
+            page.delete()
+        User.objects.filter(**{
+            '{0}__startswith'.format(User.USERNAME_FIELD): PREFIX + '-'}).delete()
+
+    def handle(self, *args, **options):
+        if min(options['segments'], options['depth'], options['users']) < 1:
+            raise CommandError('--segments, --depth and --users must be at '
+                               'least 1.')
+
+        rng = random.Random(options['seed'])
+        users = self.create_users(options)
+        self.pages = []
+        try:
+            User = get_user_model()
+            publisher = User.objects.get(
+                **{User.USERNAME_FIELD: users[EDITOR][0]})
+            urls = self.build_pages(options, publisher)
+
+            visitors = self.make_visitors(options, users, rng)
+            plan = [(rng.choice(visitors), rng.choice(urls))
+                    for num in range(options['requests'])]
+
+            self.stdout.write('{0:d} pages of {1:d} plugins each, {2:d} '
+                'visitors, {3:d} threads, {4}'.format(
+                    len(urls),
+                    self.pages[0].placeholders.get(slot='content').get_plugins().count(),
+                    len(visitors),
+                    options['threads'],
+                    'local WSGI server' if options['server'] else 'test client'))
+
+            with Probe() as probe:
+                # Warm up, E.g., discovering the pool, outside of the timings
+                warm_up = Client()
+                for url in urls:
+                    warm_up.get(url)
+                probe.samples.clear()
+
+                elapsed, results = self.run(plan, options, probe)
+            self.report(elapsed, results, probe)
+        finally:
+            if not options['keep']:
+                self.clean_up(users)